@@ -0,0 +1,113 @@
+"""
+Registry of live async workers.
+
+Every AsyncCore worker registers its control channel in a Redis sorted set for
+its channel type, scored by the time of its last heartbeat. Listing and
+controlling workers reads the registry instead of scanning the keyspace with
+KEYS, and dead workers are reaped by score:
+
+    >>> registry = AsyncRegistry(redis_client)
+    >>> registry.heartbeat("shipyard_async_control", "shipyard_async_control_...")
+    >>> registry.live("shipyard_async_control", max_age=40)
+    ["shipyard_async_control_..."]
+
+Commands are pushed to workers over Redis pub/sub. Each worker listens on the
+command channel of its channel type, and on the command channel of its own
+control channel, for messages like:
+
+    {"command": "stop"}
+    {"command": "settings", "settings": {"duty_cycle": 5}}
+"""
+import json
+import time
+
+
+class AsyncRegistry(object):
+    """
+    Track live async workers by channel type.
+    """
+
+    # registry keys look like async_registry:shipyard_async_control
+    key_prefix = "async_registry:"
+
+    # command channels look like async_commands:shipyard_async_control
+    command_prefix = "async_commands:"
+
+    def __init__(self, redis):
+        """
+        :param redis: a redis.StrictRedis client
+        """
+        self.redis = redis
+
+    def key(self, channel_type):
+        """
+        The registry key for a channel type.
+
+        :param channel_type:
+        :return:
+        """
+        return self.key_prefix + channel_type
+
+    def heartbeat(self, channel_type, channel):
+        """
+        Register a worker, or record that it's still alive.
+
+        :param channel_type:
+        :param channel: the worker's control channel
+        :return:
+        """
+        self.redis.zadd(self.key(channel_type), {channel: time.time()})
+
+    def unregister(self, channel_type, channel):
+        """
+        Remove a worker from the registry.
+
+        :param channel_type:
+        :param channel:
+        :return:
+        """
+        self.redis.zrem(self.key(channel_type), channel)
+
+    def live(self, channel_type, max_age=None):
+        """
+        Find the registered workers of a channel type, optionally only those
+        with a heartbeat in the last `max_age` seconds.
+
+        :param channel_type:
+        :param max_age: seconds
+        :return: list of (channel, last heartbeat timestamp)
+        """
+        low = "-inf" if max_age is None else time.time() - max_age
+        return self.redis.zrangebyscore(self.key(channel_type), low, "+inf", withscores=True)
+
+    def reap(self, channel_type, max_age):
+        """
+        Drop workers that haven't sent a heartbeat in `max_age` seconds.
+
+        :param channel_type:
+        :param max_age: seconds
+        :return: number of workers reaped
+        """
+        return self.redis.zremrangebyscore(self.key(channel_type), "-inf", "(%f" % (time.time() - max_age,))
+
+    def command_channel(self, channel):
+        """
+        The pub/sub channel commands for a channel type, or a single worker's
+        control channel, are published to.
+
+        :param channel:
+        :return:
+        """
+        return self.command_prefix + channel
+
+    def publish(self, channel, command, **kwargs):
+        """
+        Push a command to the workers listening on a channel.
+
+        :param channel: channel type, or a worker's control channel
+        :param command: stop | settings
+        :param kwargs: any other command data
+        :return: number of workers that received the command
+        """
+        kwargs["command"] = command
+        return self.redis.publish(self.command_channel(channel), json.dumps(kwargs))
@@ -0,0 +1,296 @@
+"""
+Run many periodic async tasks in one process.
+
+Rather than one management command (and one container) per background task,
+tasks register with an AsyncRuntime, each with its own duty cycle. A scheduler
+thread hands due tasks to a bounded pool of worker threads, where the ORM work
+happens, and every task shares one Redis connection pool:
+
+    >>> runtime = AsyncRuntime(workers=4)
+    >>> runtime.register(ShipyardRestockTask(duty_cycle=20))
+    >>> runtime.register(ShipLogPruneTask(duty_cycle=3600))
+    >>> runtime.start()
+    ...
+    >>> runtime.stats()
+    {"shipyard_restock": {"runs": 12, "failures": 0, "mean": 0.08, "last": 0.07, "max": 0.31}, ...}
+    >>> runtime.stop()
+
+A task never overlaps itself. Its next run is scheduled a duty cycle after the
+start of the previous run, or as soon as the previous run completes, if that
+took longer than the duty cycle.
+"""
+from django.conf import settings
+from django.db import close_old_connections
+
+from datetime import datetime
+import heapq
+import Queue
+import threading
+import time
+import traceback
+
+import redis
+
+# every redis client in the process shares this pool, see redis_pool
+_redis_pool = None
+_redis_pool_lock = threading.Lock()
+
+
+def redis_pool():
+    """
+    The Redis connection pool shared by everything in this process, on the
+    Redis server in the SBO_REDIS settings.
+
+    :return: redis.ConnectionPool
+    """
+    global _redis_pool
+
+    with _redis_pool_lock:
+        if _redis_pool is None:
+            _redis_pool = redis.ConnectionPool(
+                host=settings.SBO_REDIS["host"],
+                port=settings.SBO_REDIS["port"],
+                db=settings.SBO_REDIS["db"]
+            )
+
+    return _redis_pool
+
+
+class TaskStats(object):
+    """
+    Timing stats for a single task.
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed, failed=False):
+        """
+        Record a single run of the task.
+
+        :param elapsed: seconds the run took
+        :param failed: did the run raise?
+        :return:
+        """
+        self.runs += 1
+        self.total += elapsed
+        self.last = elapsed
+        self.max = max(self.max, elapsed)
+
+        if failed:
+            self.failures += 1
+
+    def as_dict(self):
+        """
+        Our stats, as a dict.
+
+        :return:
+        """
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "mean": self.total / self.runs if self.runs > 0 else 0.0,
+            "last": self.last,
+            "max": self.max
+        }
+
+
+class AsyncTask(object):
+    """
+    A periodic task run by the AsyncRuntime. Subclasses set a name and
+    default duty cycle, and implement `run`.
+    """
+    name = "task"
+
+    # seconds between the start of each run
+    duty_cycle = 20
+
+    def __init__(self, duty_cycle=None):
+        if duty_cycle is not None:
+            self.duty_cycle = duty_cycle
+
+        self.stats = TaskStats()
+
+    def run(self):
+        """
+        Do one run of our work. This is called on one of the runtime's worker
+        threads.
+
+        :return: optional string describing what we did, for the log
+        """
+        raise NotImplementedError()
+
+
+class AsyncRuntime(object):
+    """
+    Schedule periodic tasks onto a bounded pool of worker threads.
+    """
+    lead = "[async_runtime]"
+
+    def __init__(self, workers=4):
+        """
+        :param workers: how many tasks can run at once
+        """
+        self.workers = workers
+        self.tasks = []
+
+        # (next run time, task index) of every task that isn't running
+        self._schedule = []
+        self._schedule_changed = threading.Condition()
+
+        # tasks waiting for a worker
+        self._jobs = Queue.Queue(maxsize=workers)
+
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def register(self, task):
+        """
+        Add a task to the runtime. Tasks are first run as soon as the runtime
+        starts.
+
+        :param task: AsyncTask
+        :return: the task
+        """
+        with self._schedule_changed:
+            self.tasks.append(task)
+            heapq.heappush(self._schedule, (time.time(), len(self.tasks) - 1))
+            self._schedule_changed.notify()
+
+        return task
+
+    def start(self):
+        """
+        Start our scheduler and worker threads.
+
+        :return:
+        """
+        self._stopping.clear()
+
+        for worker in range(self.workers):
+            thread = threading.Thread(target=self._work, name="async-runtime-worker-%d" % (worker,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+        thread = threading.Thread(target=self._scheduler, name="async-runtime-scheduler")
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout=30):
+        """
+        Stop scheduling tasks, and wait for running tasks to finish.
+
+        :param timeout: seconds to wait for each thread
+        :return:
+        """
+        self._stopping.set()
+
+        with self._schedule_changed:
+            self._schedule_changed.notify()
+
+        # wake up our workers, they stop when they get a None job
+        for worker in range(self.workers):
+            self._jobs.put(None)
+
+        for thread in self._threads:
+            thread.join(timeout)
+
+        self._threads = []
+
+    def set_duty_cycle(self, name, duty_cycle):
+        """
+        Change the duty cycle of a task, taking effect from its next run.
+
+        :param name: task name
+        :param duty_cycle: seconds
+        :return:
+        """
+        for task in self.tasks:
+            if task.name == name:
+                task.duty_cycle = duty_cycle
+
+    def stats(self):
+        """
+        Timing stats for every task, by task name.
+
+        :return: dict
+        """
+        return dict((task.name, task.stats.as_dict()) for task in self.tasks)
+
+    def log(self, msg, *kargs):
+        """
+        Simple logging output.
+
+        :param msg:
+        :return:
+        """
+        if len(kargs) > 0:
+            msg = msg % kargs
+
+        print "%s [%s] - %s" % (self.lead, str(datetime.now()), msg)
+
+    def _scheduler(self):
+        """
+        Hand tasks to our workers as they come due.
+
+        :return:
+        """
+        while not self._stopping.is_set():
+
+            with self._schedule_changed:
+                if len(self._schedule) == 0:
+                    self._schedule_changed.wait()
+                    continue
+
+                next_run, index = self._schedule[0]
+                delay = next_run - time.time()
+
+                if delay > 0:
+                    self._schedule_changed.wait(delay)
+                    continue
+
+                heapq.heappop(self._schedule)
+
+            # this blocks while every worker is busy
+            self._jobs.put(index)
+
+    def _work(self):
+        """
+        Run tasks handed to us by the scheduler, until we're handed None.
+
+        :return:
+        """
+        while True:
+            index = self._jobs.get()
+
+            if index is None:
+                return
+
+            task = self.tasks[index]
+            start = time.time()
+            failed = False
+
+            try:
+                result = task.run()
+                if result is not None:
+                    self.log("%s: %s", task.name, result)
+            except Exception:
+                failed = True
+                self.log("%s failed:\n%s", task.name, traceback.format_exc())
+            finally:
+                # we're on our own thread, so we manage our own database connection
+                close_old_connections()
+
+            elapsed = time.time() - start
+            task.stats.record(elapsed, failed=failed)
+
+            # next run is a duty cycle after this one started
+            with self._schedule_changed:
+                heapq.heappush(self._schedule, (start + task.duty_cycle, index))
+                self._schedule_changed.notify()
@@ -0,0 +1,121 @@
+"""
+Generate many sectors at once, fanning the work out across a pool of processes.
+
+Sectors are addressed by sector coordinates, where sector (0, 0) is anchored at
+the origin of the universe, sector (1, 0) is anchored at (sector_width, 0), and
+so on. Every sector shares the same `simplex_seed`, so the noise field is
+continuous across sector boundaries, while each sector gets its own seed for
+the rest of the generation (names, planet counts, imagery, etc). That makes
+every sector reproducible on its own, no matter which process generates it or
+in which order. Each sector draws from its own `random.Random`, so generating
+a sector never touches the process wide `random` state.
+
+    >>> galaxy = GalaxyGenerator(simplex_seed=7222007)
+    >>> for sector_x, sector_y, features in galaxy.generate(-2, -2, 2, 2):
+    ...     realizer.realize_bulk(features)
+"""
+import hashlib
+import multiprocessing
+import random
+
+from smooth_space_generator import SectorGenerator
+
+
+def sector_seed(simplex_seed, sector_x, sector_y):
+    """
+    Derive the generation seed for a single sector.
+
+    :param simplex_seed:
+    :param sector_x:
+    :param sector_y:
+    :return:
+    """
+    n = hashlib.sha256()
+    n.update("%d:(%d, %d)" % (simplex_seed, sector_x, sector_y))
+    return int(n.hexdigest()[:16], 16)
+
+
+def generate_sector(job):
+    """
+    Generate a single sector. This is the unit of work handed to our process
+    pool, so it needs to live at the module level.
+
+    :param job: tuple of (sector_x, sector_y, simplex_seed)
+    :return: tuple of (sector_x, sector_y, features)
+    """
+    sector_x, sector_y, simplex_seed = job
+
+    generator = SectorGenerator(rng=random.Random(sector_seed(simplex_seed, sector_x, sector_y)))
+    generator.reseed(simplex_seed)
+    generator.sector_x = sector_x * generator.sector_width
+    generator.sector_y = sector_y * generator.sector_height
+
+    features, sector_map = generator.generate(no_map=True)
+
+    return sector_x, sector_y, features
+
+
+class GalaxyGenerator(object):
+    """
+    Generate a rectangle of sectors across a process pool.
+    """
+
+    def __init__(self, simplex_seed=7222007, processes=None):
+        """
+        Setup our galaxy.
+
+        :param simplex_seed: noise seed shared by every sector
+        :param processes: size of the process pool, defaults to the number of cores
+        """
+        self.simplex_seed = simplex_seed
+        self.processes = processes or multiprocessing.cpu_count()
+
+    def sectors(self, min_x, min_y, max_x, max_y):
+        """
+        List the sector coordinates in a rectangle, inclusive of both corners.
+
+        :param min_x:
+        :param min_y:
+        :param max_x:
+        :param max_y:
+        :return:
+        """
+        return [(sector_x, sector_y) for sector_y in range(min_y, max_y + 1) for sector_x in range(min_x, max_x + 1)]
+
+    def generate(self, min_x, min_y, max_x, max_y):
+        """
+        Generate every sector in a rectangle, yielding each sector as soon as it
+        completes, in the form:
+
+            (sector_x, sector_y, features)
+
+        Sectors complete in whatever order the pool gets to them.
+
+        :param min_x:
+        :param min_y:
+        :param max_x:
+        :param max_y:
+        :return:
+        """
+        return self.generate_sectors(self.sectors(min_x, min_y, max_x, max_y))
+
+    def generate_sectors(self, sectors):
+        """
+        Generate every sector in a list of sector coordinates, yielding each
+        sector as soon as it completes. See `generate`.
+
+        :param sectors: list of (sector_x, sector_y)
+        :return:
+        """
+        jobs = [(sector_x, sector_y, self.simplex_seed) for sector_x, sector_y in sectors]
+
+        pool = multiprocessing.Pool(processes=self.processes)
+        try:
+            for result in pool.imap_unordered(generate_sector, jobs):
+                yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
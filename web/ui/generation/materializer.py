@@ -0,0 +1,194 @@
+"""
+Materialize sectors of space on demand.
+
+Rather than generating the whole universe up front, sectors are generated and
+realized the first time something (like a ship looking for places to travel)
+touches them. Every sector is tracked in the `Sector` registry, so a sector is
+only ever generated once, and because each sector is generated from the galaxy
+`simplex_seed` and its own coordinates (see `ui.generation.galaxy`), a sector
+comes out the same no matter when, or by whom, it is materialized.
+
+Generating a sector takes a while, so a page only materializes the nearest
+`inline_sectors` missing sectors itself, and shows what exists. The rest of
+the sectors it touches, and the sectors neighbouring them, are queued for
+prefetch, and a task on the async runtime (see `async_tasks`) materializes
+queued sectors in the background, so by the time a ship gets close to them
+they already exist. The queue is a Redis set, so a sector is only ever
+queued once, however many pages look towards it:
+
+    >>> materializer = SectorMaterializer()
+    >>> materializer.ensure_radius(150, 420, 2500)
+    [(0, 0)]
+    >>> materializer.prefetch_pending()
+    [(-1, -1), (0, -1), ...]
+"""
+from django.conf import settings
+from django.db import transaction
+
+from ui.async_runtime import redis_pool
+from ui.models import Sector
+from ui import spatial
+
+from galaxy import generate_sector
+from realizer import SectorRealizer
+
+import redis
+
+# sectors waiting to be prefetched, as "sector_x:sector_y"
+PREFETCH_KEY = "sectors:prefetch:pending"
+
+
+class SectorMaterializer(object):
+    """
+    Generate and realize sectors the first time they are needed.
+    """
+
+    def __init__(self, simplex_seed=None, prefetch=None, prefetch_radius=1, inline_sectors=None):
+        """
+        Setup our materializer. Anything we aren't given comes from the
+        SBO_SECTORS settings.
+
+        :param simplex_seed: noise seed shared by every sector
+        :param prefetch: queue neighbouring sectors for prefetch?
+        :param prefetch_radius: how many sectors out do we prefetch?
+        :param inline_sectors: most sectors ensure_radius materializes itself
+        """
+        self.simplex_seed = simplex_seed if simplex_seed is not None else settings.SBO_SECTORS["simplex_seed"]
+        self.prefetch = prefetch if prefetch is not None else settings.SBO_SECTORS["prefetch"]
+        self.prefetch_radius = prefetch_radius
+        self.inline_sectors = inline_sectors if inline_sectors is not None else settings.SBO_SECTORS["inline_sectors"]
+
+    def _redis(self):
+        return redis.StrictRedis(connection_pool=redis_pool())
+
+    def ensure_radius(self, x, y, radius):
+        """
+        Make sure the sectors overlapped by a circle get realized. We only
+        materialize the nearest `inline_sectors` missing sectors, which
+        starts with the sector at the center, and queue the rest, along
+        with the sectors around them, for prefetch.
+
+        :param x:
+        :param y:
+        :param radius:
+        :return: list of (sector_x, sector_y) we materialized
+        """
+        sectors = spatial.sectors_for_radius(x, y, radius)
+        missing = Sector.objects.unregistered(sectors)
+
+        materialized = self.ensure_sectors(missing[:self.inline_sectors])
+        self.queue(missing[self.inline_sectors:])
+
+        if self.prefetch:
+            self.prefetch_neighbours(sectors)
+
+        return materialized
+
+    def ensure_sectors(self, sectors):
+        """
+        Materialize any of the given sectors that have never been claimed.
+
+        :param sectors: list of (sector_x, sector_y)
+        :return: list of (sector_x, sector_y) we materialized
+        """
+        materialized = []
+
+        for sector_x, sector_y in Sector.objects.unregistered(sectors):
+            if self.materialize(sector_x, sector_y) is not None:
+                materialized.append((sector_x, sector_y))
+
+        return materialized
+
+    def materialize(self, sector_x, sector_y):
+        """
+        Claim, generate and realize a single sector. If someone else has
+        already claimed the sector, we leave it to them.
+
+        :param sector_x:
+        :param sector_y:
+        :return: the realized Sector, or None if the sector was already claimed
+        """
+        with transaction.atomic():
+            sector = Sector.objects.claim(sector_x, sector_y, self.simplex_seed)
+
+            if sector is None:
+                return None
+
+            sector_x, sector_y, features = generate_sector((sector_x, sector_y, self.simplex_seed))
+
+            locations = SectorRealizer().realize_bulk(features)
+
+            sector.mark_realized(len(locations))
+
+        return sector
+
+    def neighbours(self, sectors):
+        """
+        Find the sectors within `prefetch_radius` of the given sectors, that
+        aren't already in the list.
+
+        :param sectors: list of (sector_x, sector_y)
+        :return: list of (sector_x, sector_y)
+        """
+        known = set(sectors)
+        found = []
+
+        for sector_x, sector_y in sectors:
+            for dy in range(-self.prefetch_radius, self.prefetch_radius + 1):
+                for dx in range(-self.prefetch_radius, self.prefetch_radius + 1):
+                    neighbour = (sector_x + dx, sector_y + dy)
+                    if neighbour not in known:
+                        known.add(neighbour)
+                        found.append(neighbour)
+
+        return found
+
+    def prefetch_neighbours(self, sectors):
+        """
+        Queue the neighbours of the given sectors for prefetch.
+
+        :param sectors: list of (sector_x, sector_y)
+        :return: how many sectors we queued
+        """
+        return self.queue(Sector.objects.unregistered(self.neighbours(sectors)))
+
+    def queue(self, sectors):
+        """
+        Queue sectors for prefetch.
+
+        :param sectors: list of (sector_x, sector_y)
+        :return: how many sectors we queued
+        """
+        if len(sectors) == 0:
+            return 0
+
+        try:
+            self._redis().sadd(PREFETCH_KEY, *["%d:%d" % sector for sector in sectors])
+        except redis.RedisError:
+            # prefetch is only a head start, the sectors are materialized when a page is nearest to them
+            return 0
+
+        return len(sectors)
+
+    def prefetch_pending(self, limit=4):
+        """
+        Materialize up to `limit` queued sectors. Anything we don't get to,
+        because generation failed, goes back on the queue.
+
+        :param limit:
+        :return: list of (sector_x, sector_y) we materialized
+        """
+        client = self._redis()
+        queued = client.spop(PREFETCH_KEY, limit) or []
+
+        if len(queued) == 0:
+            return []
+
+        sectors = [tuple(int(part) for part in sector.split(":")) for sector in queued]
+
+        try:
+            return self.ensure_sectors(sectors)
+        except Exception:
+            # anything that did get realized is skipped next time around
+            client.sadd(PREFETCH_KEY, *queued)
+            raise
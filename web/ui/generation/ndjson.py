@@ -0,0 +1,40 @@
+"""
+Read and write location streams as newline delimited JSON, one location per
+line. This lets generation and realization run as separate processes, piped
+together, without either side holding a whole sector in memory:
+
+    python ui/generation/smooth_space_generator.py --sector --ndjson | python manage.py realize_sector -
+
+See `SectorGenerator::iter_locations` for the location stream format.
+"""
+import json
+
+
+def write_locations(locations, stream):
+    """
+    Write each location in a stream as a line of JSON.
+
+    :param locations: iterable of locations
+    :param stream: file like object
+    :return: number of locations written
+    """
+    count = 0
+    for location in locations:
+        stream.write(json.dumps(location))
+        stream.write("\n")
+        count += 1
+    return count
+
+
+def read_locations(stream):
+    """
+    Read locations from lines of JSON, one location at a time. Blank lines
+    are skipped.
+
+    :param stream: file like object
+    :return:
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
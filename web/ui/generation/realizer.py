@@ -60,7 +60,14 @@ A location object looks like:
         }
 """
 
-from ui.models import Location
+from django.db import transaction
+
+from ui.models import Location, ShipYard
+from ui import spatial
+from ui import reachability
+
+import random
+import time
 
 class SectorRealizer(object):
     """
@@ -68,8 +75,12 @@ class SectorRealizer(object):
     sector.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, batch_size=1000, shipyard_chance=0.0):
+        # how many locations do we insert at once when realizing in bulk?
+        self.batch_size = batch_size
+
+        # what are the odds a location realized in bulk gets a ship yard?
+        self.shipyard_chance = shipyard_chance
 
     def realize(self, sector):
         """
@@ -90,19 +101,167 @@ class SectorRealizer(object):
 
         return locations
 
-    def _realize_location(self, location_json, parent=None):
+    def realize_bulk(self, sector):
         """
-        Given a location, generate the object for this location, as well
-        as any children objects. Return the overall list of objects
-        created.
+        Realize all of the locations in a sector JSON structure, inserting
+        each level of the star/planet/moon tree with a single bulk insert, and
+        linking children to the parents created in the level above. The whole
+        sector is created in one transaction. Return the list of created objects.
 
-        :param location:
+        :param sector:
         :return:
         """
+        start = time.time()
         locations = []
 
-        # create this object
-        location = Location.objects.create(
+        with transaction.atomic():
+
+            # each level is a list of (location_json, parent) pairs
+            level = [(location_json, None) for location_json in sector]
+
+            while len(level) > 0:
+
+                # create this level
+                level_locations = [self._build_location(location_json, parent) for location_json, parent in level]
+                Location.objects.bulk_create(level_locations, batch_size=self.batch_size)
+                locations += level_locations
+
+                # and collect the children for the next level down
+                next_level = []
+                for (location_json, parent), location in zip(level, level_locations):
+                    for child_location_json in location_json.get("children", []):
+                        next_level.append((child_location_json, location))
+                level = next_level
+
+        # cached reachability around the new locations is stale
+        reachability.invalidate([(location.x_coordinate, location.y_coordinate) for location in locations])
+
+        self._seed_shipyards(locations)
+
+        elapsed = time.time() - start
+        print "%d locations generated in %.2f seconds (%.1f locations/second)" % (len(locations), elapsed, len(locations) / max(elapsed, 0.001))
+
+        return locations
+
+    def realize_stream(self, locations):
+        """
+        Realize a flat stream of locations (see `SectorGenerator::iter_locations`),
+        inserting them in batches. Locations reference their parents by their
+        generation session `id`, and parents must arrive before their children.
+
+        Only the current batch, and the database ids of the locations that may
+        still have children coming, are held in memory. Return the number of
+        locations created.
+
+        :param locations: iterable of streamed locations
+        :return:
+        """
+        start = time.time()
+        count = 0
+
+        # session id -> database id, for locations that may still have children in the stream
+        resolved = {}
+
+        # session ids of the location we last saw, and its ancestors
+        lineage = []
+
+        batch = []
+
+        for location_json in locations:
+
+            # track where we are in the tree
+            if location_json["parent"] is None:
+                lineage = []
+            else:
+                lineage = lineage[:lineage.index(location_json["parent"]) + 1]
+            lineage.append(location_json["id"])
+
+            batch.append(location_json)
+
+            if len(batch) >= self.batch_size:
+                count += self._realize_batch(batch, resolved)
+                batch = []
+
+                # anything off of our current lineage can't be a parent anymore
+                resolved = dict([(session_id, resolved[session_id]) for session_id in lineage if session_id in resolved])
+
+        if len(batch) > 0:
+            count += self._realize_batch(batch, resolved)
+
+        elapsed = time.time() - start
+        print "%d locations generated in %.2f seconds (%.1f locations/second)" % (count, elapsed, count / max(elapsed, 0.001))
+
+        return count
+
+    def _realize_batch(self, batch, resolved):
+        """
+        Insert a batch of streamed locations. Parents need ids before their
+        children can be inserted, so the batch goes in as a series of bulk
+        inserts, one for each level of the tree found in the batch.
+
+        :param batch: list of streamed locations
+        :param resolved: session id -> database id, updated as we insert
+        :return: number of locations created
+        """
+        count = 0
+        points = []
+        created = []
+
+        with transaction.atomic():
+
+            while len(batch) > 0:
+                ready = [location_json for location_json in batch if location_json["parent"] is None or location_json["parent"] in resolved]
+                batch = [location_json for location_json in batch if not (location_json["parent"] is None or location_json["parent"] in resolved)]
+
+                if len(ready) == 0:
+                    raise ValueError("Streamed locations reference parents that were never streamed")
+
+                level_locations = []
+                for location_json in ready:
+                    location = self._build_location(location_json)
+                    location.parent_id = resolved.get(location_json["parent"])
+                    level_locations.append(location)
+
+                Location.objects.bulk_create(level_locations, batch_size=self.batch_size)
+
+                for location_json, location in zip(ready, level_locations):
+                    resolved[location_json["id"]] = location.pk
+
+                points += [(location.x_coordinate, location.y_coordinate) for location in level_locations]
+                created += level_locations
+                count += len(level_locations)
+
+        # cached reachability around the new locations is stale
+        reachability.invalidate(points)
+
+        self._seed_shipyards(created)
+
+        return count
+
+    def _seed_shipyards(self, locations):
+        """
+        Give a random selection of newly realized locations ship yards, all
+        seeded together, see `ShipYardManager::seed_locations`.
+
+        :param locations: list of saved Location objects
+        :return: list of ShipYard
+        """
+        if self.shipyard_chance <= 0:
+            return []
+
+        chosen = [location for location in locations if random.random() < self.shipyard_chance]
+        return ShipYard.objects.seed_locations(chosen, batch_size=self.batch_size)
+
+    def _build_location(self, location_json, parent=None):
+        """
+        Build, but don't save, the Location object for a location in the
+        sector JSON structure.
+
+        :param location_json:
+        :param parent:
+        :return:
+        """
+        location = Location(
             name=location_json["name"],
 
             # location in space
@@ -127,6 +286,23 @@ class SectorRealizer(object):
             # shared location hash
             location_hash=location_json["location_hash"]
         )
+
+        # bulk inserts skip Location.save, so we need to place this in the spatial grid ourselves
+        return spatial.assign_grid_cell(location)
+
+    def _realize_location(self, location_json, parent=None):
+        """
+        Given a location, generate the object for this location, as well
+        as any children objects. Return the overall list of objects
+        created.
+
+        :param location:
+        :return:
+        """
+        locations = []
+
+        # create this object
+        location = self._build_location(location_json, parent=parent)
         location.save()
 
         locations.append(location)
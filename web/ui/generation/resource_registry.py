@@ -0,0 +1,212 @@
+"""
+Lazily loaded game resources.
+
+The game data catalogues in `ui/resources` and the image directories in
+`ui/static/ui/images` are read once per process, the first time something
+asks for them, rather than when `ui.models` or the sector generator is
+imported. Paths are resolved relative to this file, so it doesn't matter what
+directory we're run from.
+
+This module doesn't need Django, so the sector generator can use it when it's
+run as a script:
+
+    >>> resource_registry.images("star")
+    ["Star1.png", "Star2.png", ...]
+    >>> resource_registry.goods()
+    [{"name": "Ore", ...}, ...]
+    >>> resource_registry.pick_ship_template()
+    {"name": "Darter", "availability": 0.95, ...}
+
+Alongside each catalogue we precompile anything derived from it that would
+otherwise be rebuilt on every use, like the alias tables (see `sampling`) used
+to pick ship templates, upgrade grades, and shipyard name parts.
+"""
+import json
+import os
+import threading
+
+from sampling import AliasTable, first_success_weights
+
+# web/ui
+UI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESOURCE_DIR = os.path.join(UI_DIR, "resources")
+IMAGE_DIR = os.path.join(UI_DIR, "static", "ui", "images")
+
+# which image directory holds the images for each kind of thing?
+IMAGE_DIRECTORIES = {
+    "star": "stars",
+    "nebula": "nebulas",
+    "ship": "ships",
+    "asteroid": "asteroids",
+    "moon": "moons"
+}
+
+# planet images are a fixed set, not every image in the planet directory
+PLANET_IMAGES = ["planet%d.png" % i for i in range(1, 8) + range(10, 21)]
+
+_loaded = {}
+# loaders can ask for other resources, so this needs to be reentrant
+_lock = threading.RLock()
+
+
+def _cached(name, loader):
+    """
+    Load a resource the first time it's asked for, and hand back the same
+    object after that.
+
+    :param name: cache key
+    :param loader: function that loads the resource
+    :return:
+    """
+    try:
+        return _loaded[name]
+    except KeyError:
+        pass
+
+    with _lock:
+        if name not in _loaded:
+            _loaded[name] = loader()
+
+    return _loaded[name]
+
+
+def _load_json(filename):
+    with open(os.path.join(RESOURCE_DIR, filename), "r") as resource:
+        return json.load(resource)
+
+
+def reset():
+    """
+    Forget everything we've loaded, so it's read again on next use.
+
+    :return:
+    """
+    with _lock:
+        _loaded.clear()
+
+
+def images(kind):
+    """
+    The image names available for a kind of location, or for ships.
+
+    :param kind: planet | star | nebula | asteroid | moon | ship
+    :return: list of image file names
+    """
+    if kind == "planet":
+        return PLANET_IMAGES
+
+    def load():
+        directory = os.path.join(IMAGE_DIR, IMAGE_DIRECTORIES[kind])
+        return sorted([image for image in os.listdir(directory) if image.endswith("png")])
+
+    return _cached("images:" + kind, load)
+
+
+def system_prefixes():
+    """
+    Star and planet system name prefixes.
+
+    :return: list of strings
+    """
+    def load():
+        with open(os.path.join(RESOURCE_DIR, "planet_prefix.list"), "r") as prefixes:
+            return [prefix.strip() for prefix in prefixes.readlines()]
+
+    return _cached("system_prefixes", load)
+
+
+def shipyards():
+    """
+    Ship yard data, see shipyards.json.
+
+    :return: dict
+    """
+    return _cached("shipyards", lambda: _load_json("shipyards.json"))
+
+
+def ship_templates():
+    """
+    Ship types and sizes, see shiptypes.json.
+
+    :return: dict
+    """
+    return _cached("ship_templates", lambda: _load_json("shiptypes.json"))
+
+
+def goods():
+    """
+    Every good that can be traded, see goods.json.
+
+    :return: list of dicts
+    """
+    return _cached("goods", lambda: _load_json("goods.json"))
+
+
+def upgrades():
+    """
+    Upgrade grades and components, see upgrades.json.
+
+    :return: dict
+    """
+    return _cached("upgrades", lambda: _load_json("upgrades.json"))
+
+
+def ship_template_table():
+    """
+    Ship templates, weighted by availability.
+
+    :return: AliasTable of ship template dicts
+    """
+    def load():
+        templates = ship_templates()["ships"]
+        return AliasTable(templates, [template["availability"] for template in templates])
+
+    return _cached("ship_template_table", load)
+
+
+def upgrade_grade_table():
+    """
+    Upgrade grades, weighted by availability.
+
+    :return: AliasTable of grade dicts
+    """
+    def load():
+        grades = upgrades()["grades"]
+        return AliasTable(grades, [grade["availability"] for grade in grades])
+
+    return _cached("upgrade_grade_table", load)
+
+
+def shipyard_name_table(part):
+    """
+    Shipyard name prefixes or suffixes. A name takes the first part in the
+    list whose probability check passes, or none at all.
+
+    :param part: prefix | suffix
+    :return: AliasTable of strings, where "" is no prefix or suffix
+    """
+    def load():
+        parts = shipyards()["names"][part + "es"]
+        weights = first_success_weights([entry["probability"] for entry in parts])
+        return AliasTable([entry[part] for entry in parts] + [""], weights)
+
+    return _cached("shipyard_name_table:" + part, load)
+
+
+def pick_ship_template():
+    """
+    Pick a ship template, weighted by availability.
+
+    :return: ship template dict
+    """
+    return ship_template_table().draw()
+
+
+def pick_upgrade_grade():
+    """
+    Pick an upgrade grade, weighted by availability.
+
+    :return: grade dict
+    """
+    return upgrade_grade_table().draw()
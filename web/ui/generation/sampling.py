@@ -0,0 +1,164 @@
+"""
+Weighted sampling with Walker alias tables.
+
+An alias table is built once, in O(n), from a list of items and their weights,
+after which every draw is O(1): pick a column uniformly, then flip a biased
+coin between the column's item and its alias. Draws follow the weights
+exactly, so an item with weight 0.03 doesn't cost us 30-odd rejected tries the
+way a rejection loop over availability does.
+
+    >>> grades = AliasTable(["basic", "alpha", "omega"], [1.0, 0.75, 0.03])
+    >>> grades.draw()
+    "alpha"
+    >>> grades.draw_many(5)
+    ["basic", "basic", "alpha", "basic", "alpha"]
+
+Batch draws are vectorized with numpy, for seeding many objects at once.
+Every draw takes its randomness from a `random.Random` (defaulting to the
+`random` module), like the rest of generation, so seeding it makes draws
+reproducible. Batch draws seed a numpy `RandomState` from it.
+"""
+import random
+
+import numpy
+
+
+class AliasTable(object):
+    """
+    Draw items with probability proportional to their weights.
+    """
+
+    def __init__(self, items, weights):
+        """
+        Build our table with Vose's method.
+
+        :param items: list of anything
+        :param weights: list of non-negative numbers, one per item, not all zero
+        """
+        if len(items) != len(weights) or len(items) == 0:
+            raise ValueError("An alias table needs one weight for each of at least one item")
+
+        total = float(sum(weights))
+        if total <= 0 or min(weights) < 0:
+            raise ValueError("Alias table weights must be non-negative, and not all zero")
+
+        self.items = list(items)
+        self.count = len(items)
+
+        # scale the weights so the average column is exactly full
+        scaled = [weight * self.count / total for weight in weights]
+
+        prob = [1.0] * self.count
+        alias = range(self.count)
+
+        small = [index for index, weight in enumerate(scaled) if weight < 1.0]
+        large = [index for index, weight in enumerate(scaled) if weight >= 1.0]
+
+        while len(small) > 0 and len(large) > 0:
+            less = small.pop()
+            more = large.pop()
+
+            # fill the rest of the small column from the large one
+            prob[less] = scaled[less]
+            alias[less] = more
+
+            scaled[more] = (scaled[more] + scaled[less]) - 1.0
+
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # anything left over is full, bar floating point error
+        for index in small + large:
+            prob[index] = 1.0
+
+        self.prob = prob
+        self.alias = alias
+
+        self._prob_array = numpy.array(prob)
+        self._alias_array = numpy.array(alias)
+
+    def draw_index(self, rng=None):
+        """
+        Draw the index of a single item.
+
+        :param rng: random.Random, defaults to the `random` module
+        :return:
+        """
+        rng = rng or random
+        column = int(rng.random() * self.count)
+
+        if rng.random() < self.prob[column]:
+            return column
+        return self.alias[column]
+
+    def draw(self, rng=None):
+        """
+        Draw a single item.
+
+        :param rng: random.Random, defaults to the `random` module
+        :return:
+        """
+        return self.items[self.draw_index(rng=rng)]
+
+    def draw_indices(self, count, rng=None):
+        """
+        Draw the indices of many items at once.
+
+        :param count:
+        :param rng: random.Random, defaults to the `random` module
+        :return: numpy array of indices
+        """
+        state = numpy.random.RandomState((rng or random).getrandbits(32))
+
+        columns = state.randint(0, self.count, size=count)
+        coins = state.random_sample(count)
+
+        return numpy.where(coins < self._prob_array[columns], columns, self._alias_array[columns])
+
+    def draw_many(self, count, rng=None):
+        """
+        Draw many items at once.
+
+        :param count:
+        :param rng: random.Random, defaults to the `random` module
+        :return: list of items
+        """
+        return [self.items[index] for index in self.draw_indices(count, rng=rng)]
+
+    def probabilities(self):
+        """
+        The probability of drawing each item, rebuilt from the table. Handy
+        for checking the table against the weights it came from.
+
+        :return: list of floats
+        """
+        probabilities = [0.0] * self.count
+
+        for column in range(self.count):
+            probabilities[column] += self.prob[column] / self.count
+            probabilities[self.alias[column]] += (1.0 - self.prob[column]) / self.count
+
+        return probabilities
+
+
+def first_success_weights(probabilities):
+    """
+    Weights for walking a list and taking the first entry whose own coin flip
+    succeeds, like the shipyard name prefixes and suffixes. The last weight is
+    the chance that every flip fails.
+
+    :param probabilities: chance each entry is taken, if we get to it
+    :return: list of weights, one longer than probabilities
+    """
+    weights = []
+    remaining = 1.0
+
+    for probability in probabilities:
+        probability = min(max(probability, 0.0), 1.0)
+        weights.append(remaining * probability)
+        remaining *= 1.0 - probability
+
+    weights.append(remaining)
+    return weights
@@ -1,14 +1,19 @@
 import argparse
 from collections import namedtuple
 import hashlib
+import itertools
 import json
 import math
 from opensimplex import OpenSimplex
-import os
+import numpy
 import random
 import string
 import sys
 
+from batch_noise import BatchNoise, FEATURES, FEATURE_SYMBOLS, classify
+from ndjson import write_locations
+import resource_registry
+
 """
 The *smooth_space_generator* builds out a mostly logical galaxy sector. Inputs can include
 a sector offset, random sampling offsets, and other components.
@@ -28,7 +33,7 @@ Every location generated by the smooth_space_generator will have a structure lik
         "name"          : string name
         "x_coordinate"  : integer
         "y_coordinate"  : integer
-        "image_name"    : see *_IMAGES in models.py
+        "image_name"    : see resource_registry.images
         "fuel_markup"   : percentage fuel markup at location, in 1.05 form (for 5% markup)
         "type" : [planet, star, asteroid, moon, nebula]
         "location_meta" : JSON metadata for the location, in python object form
@@ -56,38 +61,24 @@ Where a resource is an object of the form:
     }
     
 The `stats` entry is dependent on the Location `type`. 
-"""
 
-####
-# Resource Loads
-####
+Sectors can also be generated as a flat stream of locations, rather than a nested
+structure (see `SectorGenerator::iter_locations`). Streamed locations have no
+`children`, and instead carry generation session scoped references:
 
-# Star/Planet System name prefixes
-with open("ui/resources/planet_prefix.list", "r") as prefixes:
-    SYSTEM_PREFIXES = [prefix.strip() for prefix in prefixes.readlines()]
+    {
+        "id"            : integer, unique to this generation session
+        "parent"        : id of the parent location, or null for top level locations
+        ...
+    }
 
+Parents are always streamed before their children.
+"""
 
 ####
-# Images
+# Resources
 ####
-# Planets
-planet_range = range(1,8) + range(10, 21)
-PLANET_IMAGES = ["planet%d.png" % i for i in planet_range]
-
-# Stars
-STAR_IMAGES = [star for star in os.listdir("ui/static/ui/images/stars") if star.endswith("png")]
-
-# Nebula
-NEBULA_IMAGES = [n for n in os.listdir("ui/static/ui/images/nebulas") if n.endswith("png")]
-
-# SHIP Images
-SHIP_IMAGES = [ship for ship in os.listdir("ui/static/ui/images/ships") if ship.endswith("png")]
-
-# Asteroid Images
-ASTEROID_IMAGES = [a for a in os.listdir("ui/static/ui/images/asteroids") if a.endswith("png")]
-
-# Moon Images
-MOON_IMAGES = [m for m in os.listdir("ui/static/ui/images/moons") if m.endswith("png")]
+# names and images are loaded on first use, see resource_registry
 
 
 ####
@@ -105,12 +96,17 @@ class SectorGenerator(object):
     Handle generation control and synthesis for the smooth generator
     """
 
-    def __init__(self):
+    def __init__(self, rng=None):
         """
         Setup our defaults
+
+        :param rng: random.Random used for everything but the noise, defaults to the `random` module
         """
         self.locations = []
 
+        # names, imagery, planet counts, etc. all come from here
+        self.random = rng or random
+
         # anchor this sector in space
         self.sector_x = 0
         self.sector_y = 0
@@ -140,6 +136,10 @@ class SectorGenerator(object):
         self.coordinate_dampening = 500.0
         self.simplex = OpenSimplex(seed=self.simplex_seed)
 
+        # subsector grids this large (or larger) have their noise evaluated in a
+        # single vectorized pass, rather than one subsector at a time
+        self.batch_threshold = 2500
+
     def reseed(self, seed):
         """
         Seed the simplex generator, and setup the gen function
@@ -186,6 +186,25 @@ class SectorGenerator(object):
         :return:
         """
 
+        bp = self.feature_breakpoints()
+
+        if   bp[0] <= noise_val < bp[1]:
+            return "void"
+        elif bp[1] <= noise_val < bp[2]:
+            return "nebula"
+        elif bp[2] <= noise_val < bp[3]:
+            return "star"
+        elif bp[3] <= noise_val:
+            return "asteroid"
+
+    def feature_breakpoints(self):
+        """
+        Where do our features start and stop along the noise scale? Returns
+        the lower bound of void, nebula, star, and asteroid.
+
+        :return:
+        """
+
         # bp is for break point...
         # we use our density function to determine our breakpoints. We pull apart how
         # dense the individual features are, and then whatever is left over is
@@ -193,20 +212,82 @@ class SectorGenerator(object):
         scaled_density = (1.0 / 3.0) * self.density
         void_density = 1.0 - (scaled_density * 3.0)
 
-        bp = [
+        return [
             0.0,
             void_density,
             void_density + scaled_density * 1,
             void_density + scaled_density * 2]
 
-        if   bp[0] <= noise_val < bp[1]:
-            return "void"
-        elif bp[1] <= noise_val < bp[2]:
-            return "nebula"
-        elif bp[2] <= noise_val < bp[3]:
-            return "star"
-        elif bp[3] <= noise_val:
-            return "asteroid"
+    def subsector_centers(self):
+        """
+        Absolute center coordinates of our subsectors, as a list of
+        column centers and a list of row centers. These follow the same
+        math as the subsector_iterator.
+
+        :return: tuple of (x centers, y centers)
+        """
+        x_centers = []
+        for ss_x in range(0, self.x_subsectors):
+            x_west = (self.sector_width / self.x_subsectors) * ss_x
+            x_east = x_west + (self.sector_width / self.x_subsectors)
+            x_centers.append((x_east - x_west) / 2.0 + x_west + self.sector_x)
+
+        y_centers = []
+        for ss_y in range(0, self.y_subsectors):
+            y_south = (self.sector_height / self.y_subsectors) * ss_y
+            y_north = y_south + (self.sector_height / self.y_subsectors)
+            y_centers.append((y_north - y_south) / 2 + y_south + self.sector_y)
+
+        return x_centers, y_centers
+
+    def noise_grid(self):
+        """
+        Evaluate our noise function for every subsector center at once. The
+        result is a (y_subsectors, x_subsectors) array, matching what
+        noise_at_coordinate would give for each subsector.
+
+        :return:
+        """
+        x_centers, y_centers = self.subsector_centers()
+        x_grid, y_grid = numpy.meshgrid(numpy.array(x_centers, dtype=numpy.float64), numpy.array(y_centers, dtype=numpy.float64))
+
+        raw_noise = BatchNoise(self.simplex_seed).noise2d(x_grid / self.coordinate_dampening, y_grid / self.coordinate_dampening)
+
+        return numpy.power((raw_noise + 1.0) / 2.0, self.noise_exponent)
+
+    def feature_grid(self):
+        """
+        Classify every subsector into a feature in a single pass. The result
+        is a (y_subsectors, x_subsectors) array of indices into FEATURES.
+
+        :return:
+        """
+        return classify(self.noise_grid(), self.feature_breakpoints())
+
+    def subsector_features(self):
+        """
+        Walk our subsectors, yielding the feature at each subsector center as:
+
+            (subsector_row, subsector_col, center, feature)
+
+        Large subsector grids are evaluated with the vectorized noise engine, while
+        small grids use the scalar noise functions.
+
+        :return:
+        """
+        if self.x_subsectors * self.y_subsectors < self.batch_threshold:
+            for subsector in self.subsector_iterator():
+                noise = self.noise_at_coordinate(subsector.absolute.center)
+                yield subsector.subsector_row, subsector.subsector_col, subsector.absolute.center, self.feature_from_noise(noise)
+            return
+
+        x_centers, y_centers = self.subsector_centers()
+        features = self.feature_grid()
+
+        for ss_y, y_center in enumerate(y_centers):
+            row = features[ss_y]
+            for ss_x, x_center in enumerate(x_centers):
+                yield ss_y, ss_x, Coordinate(x=x_center, y=y_center), FEATURES[row[ss_x]]
 
     def subsector_iterator(self):
         """
@@ -332,9 +413,9 @@ class SectorGenerator(object):
         """
 
         # setup our top level generators
-        gen_nebula = NebulaGenerator()
-        gen_star = StarGenerator()
-        gen_asteroid = AsteroidGenerator()
+        gen_nebula = NebulaGenerator(rng=self.random)
+        gen_star = StarGenerator(rng=self.random)
+        gen_asteroid = AsteroidGenerator(rng=self.random)
 
         # we'll maintain a list of the top level features we create
         features = []
@@ -342,30 +423,24 @@ class SectorGenerator(object):
         # track the rows for our map
         map_rows = []
 
-        # walk the sector iterator
-        for subsector in self.subsector_iterator():
+        # walk the sector features
+        for subsector_row, subsector_col, center, feature in self.subsector_features():
 
             # create a new row in our map
-            if subsector.subsector_col == 0:
+            if subsector_col == 0:
                 map_rows.append([])
 
-            # format our row
-            noise = self.noise_at_coordinate(subsector.absolute.center)
-            feature = self.feature_from_noise(noise)
-
             if feature == "nebula":
-                features.append(gen_nebula.create_at_location(subsector.absolute.center.x, subsector.absolute.center.y))
-                map_rows[-1].append("N")
+                features.append(gen_nebula.create_at_location(center.x, center.y))
             elif feature == "star":
-                features.append(gen_star.create_at_location(subsector.absolute.center.x, subsector.absolute.center.y))
-                map_rows[-1].append("S")
+                features.append(gen_star.create_at_location(center.x, center.y))
             elif feature == "asteroid":
-                features.append(gen_asteroid.create_at_location(subsector.absolute.center.x, subsector.absolute.center.y))
-                map_rows[-1].append("A")
-            elif feature == "void":
-                map_rows[-1].append(" ")
-            else:
+                features.append(gen_asteroid.create_at_location(center.x, center.y))
+            elif feature != "void":
                 print "! We got a feature named [%s], and have no idea what to do with it !" % (feature,)
+                continue
+
+            map_rows[-1].append(FEATURE_SYMBOLS[feature])
 
         # create a header and footer for the map
         map_cap = "+" + "+".join(["---" for i in range(len(map_rows[0]))]) + "+"
@@ -385,17 +460,46 @@ class SectorGenerator(object):
 
         return features, map_string
 
+    def iter_locations(self):
+        """
+        Generate the sector as a flat stream of locations, rather than as a
+        nested structure. Locations are yielded one at a time, depth first,
+        with `id` and `parent` references in place of `children`, so the sector
+        never needs to be held in memory at once.
+
+        :return:
+        """
+
+        generators = {
+            "nebula": NebulaGenerator(rng=self.random),
+            "star": StarGenerator(rng=self.random),
+            "asteroid": AsteroidGenerator(rng=self.random)
+        }
+
+        # location ids are scoped to this generation session
+        ids = itertools.count(1)
+
+        for subsector_row, subsector_col, center, feature in self.subsector_features():
+
+            if feature not in generators:
+                continue
+
+            for location in generators[feature].iter_at_location(center.x, center.y, ids=ids):
+                yield location
+
 class NebulaGenerator(object):
     """
     Generate a Nebula. Each nebula has a certain set of resources, which we generate
     at creation time.
     """
 
-    def __init__(self):
+    def __init__(self, rng=None):
         """
         Setup general nebula generation
+
+        :param rng: random.Random, defaults to the `random` module
         """
-        pass
+        self.random = rng or random
 
     def create_at_location(self, x, y):
         """
@@ -405,13 +509,29 @@ class NebulaGenerator(object):
         :param y:
         :return:
         """
-        return {
+        return assemble_tree(self.iter_at_location(x, y))[0]
+
+    def iter_at_location(self, x, y, ids=None, parent=None):
+        """
+        Generate a nebula at the given location, as a location stream.
+
+        :param x:
+        :param y:
+        :param ids: session id counter
+        :param parent: session id of our parent
+        :return:
+        """
+        ids = ids or itertools.count(1)
+
+        yield {
+            "id": next(ids),
+            "parent": parent,
             "name": self._create_name(),
             "x_coordinate": x,
             "y_coordinate": y,
             "type": "nebula",
             "location_hash": create_location_hash(x, y),
-            "image_name": random.sample(NEBULA_IMAGES, 1)[0],
+            "image_name": self.random.sample(resource_registry.images("nebula"), 1)[0],
             "fuel_markup": 1.0,
             "location_meta": {}
         }
@@ -422,7 +542,7 @@ class NebulaGenerator(object):
 
         :return:
         """
-        return "NGC %d" % (random.randrange(10, 10000))
+        return "NGC %d" % (self.random.randrange(10, 10000))
 
 
 class MoonGenerator(object):
@@ -430,10 +550,13 @@ class MoonGenerator(object):
     Generator for moons.
     """
 
-    def __init__(self):
+    def __init__(self, rng=None):
         """
         setup moon generation.
+
+        :param rng: random.Random, defaults to the `random` module
         """
+        self.random = rng or random
         self.location_hash = None
         self.parent_offset = 0
 
@@ -463,14 +586,30 @@ class MoonGenerator(object):
         :param y:
         :return:
         """
-        return {
+        return assemble_tree(self.iter_at_location(x, y))[0]
+
+    def iter_at_location(self, x, y, ids=None, parent=None):
+        """
+        Create a moon at the given location, as a location stream.
+
+        :param x:
+        :param y:
+        :param ids: session id counter
+        :param parent: session id of our parent
+        :return:
+        """
+        ids = ids or itertools.count(1)
+
+        yield {
+            "id": next(ids),
+            "parent": parent,
             "name": self._create_name(),
             "x_coordinate": x,
             "y_coordinate": y,
             "location_hash": self.location_hash,
             "parent_offset": self.parent_offset,
             "type": "moon",
-            "image_name": random.sample(MOON_IMAGES, 1)[0],
+            "image_name": self.random.sample(resource_registry.images("moon"), 1)[0],
             "fuel_markup": 1.0,
             "location_meta": {}
         }
@@ -479,9 +618,9 @@ class MoonGenerator(object):
         """
         we'll use satellite provisional naming ( https://en.wikipedia.org/wiki/Naming_of_moons#Provisional_designations )
         """
-        m_year = random.randrange(2010, 10000)
-        m_plan = random.choice("ABCDEFGHJKLMNO[QRSTUVWXYZ")
-        m_inc = random.randrange(1, 1000)
+        m_year = self.random.randrange(2010, 10000)
+        m_plan = self.random.choice("ABCDEFGHJKLMNO[QRSTUVWXYZ")
+        m_inc = self.random.randrange(1, 1000)
 
         return "S/%d %s %d" % (m_year, m_plan, m_inc)
 
@@ -491,11 +630,14 @@ class PlanetGenerator(object):
     Generator for planets. Each planet also generates its moons.
     """
 
-    def __init__(self):
+    def __init__(self, rng=None):
         """
         Setup planet generation.
+
+        :param rng: random.Random, defaults to the `random` module
         """
-        self.moon_generator = MoonGenerator()
+        self.random = rng or random
+        self.moon_generator = MoonGenerator(rng=self.random)
         self.location_hash = None
         self.parent_offset = 0
         self.name = ""
@@ -526,18 +668,37 @@ class PlanetGenerator(object):
         :param y:
         :return:
         """
-        return {
+        return assemble_tree(self.iter_at_location(x, y))[0]
+
+    def iter_at_location(self, x, y, ids=None, parent=None):
+        """
+        Generate a planet, followed by its moons, as a location stream.
+
+        :param x:
+        :param y:
+        :param ids: session id counter
+        :param parent: session id of our parent
+        :return:
+        """
+        ids = ids or itertools.count(1)
+
+        planet = {
+            "id": next(ids),
+            "parent": parent,
             "name": self.name,
             "x_coordinate": x,
             "y_coordinate": y,
             "location_hash": self.location_hash,
             "parent_offset": self.parent_offset,
-            "children": self._create_moons(),
             "type": "planet",
-            "image_name": random.sample(PLANET_IMAGES, 1)[0],
+            "image_name": self.random.sample(resource_registry.images("planet"), 1)[0],
             "fuel_markup": 1.0,
             "location_meta": {}
         }
+        yield planet
+
+        for moon in self._iter_moons(ids, planet["id"]):
+            yield moon
 
     def with_name(self, name):
         """
@@ -547,9 +708,9 @@ class PlanetGenerator(object):
         """
         self.name = name
 
-    def _create_moons(self, x_coordinate=0, y_coordinate=0):
+    def _iter_moons(self, ids, parent, x_coordinate=0, y_coordinate=0):
         """
-        Create the moons for this planet.
+        Create the moons for this planet, one at a time.
 
         :return:
         """
@@ -557,20 +718,16 @@ class PlanetGenerator(object):
         self.moon_generator.with_location_hash(self.location_hash)
 
         # how many moons are we creating?
-        moon_count = int(random.triangular(0, 50, 7))
-
-        # gather up all of our moons
-        moons = []
+        moon_count = int(self.random.triangular(0, 50, 7))
 
         for i in range(moon_count):
 
             # set how far the moon will be from the planet
-            self.moon_generator.at_parent_offset(random.uniform(0.001, 1.0))
+            self.moon_generator.at_parent_offset(self.random.uniform(0.001, 1.0))
 
             # create our moon
-            moons.append(self.moon_generator.create_at_location(x_coordinate, y_coordinate))
-
-        return moons
+            for moon in self.moon_generator.iter_at_location(x_coordinate, y_coordinate, ids=ids, parent=parent):
+                yield moon
 
 
 class AsteroidGenerator(object):
@@ -578,11 +735,13 @@ class AsteroidGenerator(object):
     Generator for asteroids.
     """
 
-    def __init__(self):
+    def __init__(self, rng=None):
         """
         Setup asteroid generation.
+
+        :param rng: random.Random, defaults to the `random` module
         """
-        pass
+        self.random = rng or random
 
     def create_at_location(self, x, y):
         """
@@ -592,13 +751,29 @@ class AsteroidGenerator(object):
         :param y:
         :return:
         """
-        return {
+        return assemble_tree(self.iter_at_location(x, y))[0]
+
+    def iter_at_location(self, x, y, ids=None, parent=None):
+        """
+        Create an asteroid at the given location, as a location stream.
+
+        :param x:
+        :param y:
+        :param ids: session id counter
+        :param parent: session id of our parent
+        :return:
+        """
+        ids = ids or itertools.count(1)
+
+        yield {
+            "id": next(ids),
+            "parent": parent,
             "name": self._create_name(),
             "x_coordinate": x,
             "y_coordinate": y,
             "type": "asteroid",
             "location_hash": create_location_hash(x, y),
-            "image_name": random.sample(ASTEROID_IMAGES, 1)[0],
+            "image_name": self.random.sample(resource_registry.images("asteroid"), 1)[0],
             "fuel_markup": 1.0,
             "location_meta": {}
         }
@@ -608,10 +783,10 @@ class AsteroidGenerator(object):
         Asteroids use New-style Provisional Naming ( https://en.wikipedia.org/wiki/Provisional_designation_in_astronomy )
         :return:
         """
-        ast_year = random.randrange(2010, 10000)
-        ast_la = random.choice("ABCDEFGHJKLMNOPQRSTUVWXY")
-        ast_lb = random.choice("ABCDEFGHJKLMNO[QRSTUVWXYZ")
-        ast_cy = random.randrange(1, 500)
+        ast_year = self.random.randrange(2010, 10000)
+        ast_la = self.random.choice("ABCDEFGHJKLMNOPQRSTUVWXY")
+        ast_lb = self.random.choice("ABCDEFGHJKLMNO[QRSTUVWXYZ")
+        ast_cy = self.random.randrange(1, 500)
 
         return "%d %s %s-%d" % (ast_year, ast_la, ast_lb, ast_cy)
 
@@ -622,11 +797,14 @@ class StarGenerator(object):
     its planets and moons.
     """
 
-    def __init__(self):
+    def __init__(self, rng=None):
         """
         Setup star generation.
+
+        :param rng: random.Random, defaults to the `random` module
         """
-        self.planet_generator = PlanetGenerator()
+        self.random = rng or random
+        self.planet_generator = PlanetGenerator(rng=self.random)
 
     def create_at_location(self, x, y):
         """
@@ -636,23 +814,42 @@ class StarGenerator(object):
         :param y:
         :return:
         """
+        return assemble_tree(self.iter_at_location(x, y))[0]
+
+    def iter_at_location(self, x, y, ids=None, parent=None):
+        """
+        Create a star, followed by all of its sub-objects, as a location stream.
+
+        :param x:
+        :param y:
+        :param ids: session id counter
+        :param parent: session id of our parent
+        :return:
+        """
+        ids = ids or itertools.count(1)
+
         loc_hash = create_location_hash(x, y)
         name = self._create_name()
-        return {
+        star = {
+            "id": next(ids),
+            "parent": parent,
             "name": name,
             "x_coordinate": x,
             "y_coordinate": y,
             "location_hash": loc_hash,
-            "children": self._create_planets(star_name=name, x_coordinate=x, y_coordinate=y, location_hash=loc_hash),
             "type": "star",
-            "image_name": random.sample(STAR_IMAGES, 1)[0],
+            "image_name": self.random.sample(resource_registry.images("star"), 1)[0],
             "fuel_markup": 1.0,
             "location_meta": {}
         }
+        yield star
+
+        for planet in self._iter_planets(ids, star["id"], star_name=name, x_coordinate=x, y_coordinate=y, location_hash=loc_hash):
+            yield planet
 
-    def _create_planets(self, star_name="", x_coordinate=0, y_coordinate=0, location_hash=None):
+    def _iter_planets(self, ids, parent, star_name="", x_coordinate=0, y_coordinate=0, location_hash=None):
         """
-        Create a set of planets orbiting our star.
+        Create a set of planets orbiting our star, one at a time.
 
         :return:
         """
@@ -660,20 +857,17 @@ class StarGenerator(object):
         self.planet_generator.with_location_hash(location_hash)
 
         # how many planets are we generating?
-        planet_count = int(random.triangular(0, 20, 4))
+        planet_count = int(self.random.triangular(0, 20, 4))
 
         # We're starting with our first planet somewhere between 0.25 and 0.5 AU
         # from the parent star
-        planet_au = random.uniform(0.25, 0.5)
+        planet_au = self.random.uniform(0.25, 0.5)
 
         # the further out into the planets we get, the further apart they start to spread, with
         # our trianglular variate boundaries growing by au_slide_*
         au_slide_lower = 0.25
         au_slide_higher = 1.5
 
-        # hold our planets
-        planets = []
-
         # start generating
         for i in range(0, planet_count):
 
@@ -695,16 +889,15 @@ class StarGenerator(object):
             self.planet_generator.with_name(planet_name)
 
             # create
-            planets.append(self.planet_generator.create_at_location(x_coordinate, y_coordinate))
+            for location in self.planet_generator.iter_at_location(x_coordinate, y_coordinate, ids=ids, parent=parent):
+                yield location
 
             # update the AU offset, using a starting triangular variate between 1 and 10, with a mean of 3.
             # this number grows the further into a planet sequence we get
             au_low = 1 + au_slide_lower * i
             au_high = 10 + au_slide_higher * i
             au_mean = ((au_high - au_low) / 3.0) + au_low
-            planet_au += random.triangular(au_low, au_high, au_mean)
-
-        return planets
+            planet_au += self.random.triangular(au_low, au_high, au_mean)
 
     def _create_name(self):
         """
@@ -712,14 +905,43 @@ class StarGenerator(object):
         :return:
         """
         # get a good prefix
-        star_prefix = random.sample(SYSTEM_PREFIXES, 1)[0]
+        star_prefix = self.random.sample(resource_registry.system_prefixes(), 1)[0]
 
         # pick a designator
-        star_number = random.randint(1000, 10000)
+        star_number = self.random.randint(1000, 10000)
 
         return "%s %s" % (star_prefix, star_number)
 
 
+def assemble_tree(locations):
+    """
+    Build the nested location structure from a stream of locations. Stars and
+    planets get a `children` list, and the stream `id` and `parent` references
+    are dropped.
+
+    :param locations: location stream, parents before children
+    :return: list of top level locations
+    """
+    roots = []
+    by_id = {}
+
+    for location in locations:
+        location = dict(location)
+        location_id = location.pop("id")
+        parent = location.pop("parent")
+
+        if location["type"] in ["star", "planet"]:
+            location["children"] = []
+        by_id[location_id] = location
+
+        if parent is None:
+            roots.append(location)
+        else:
+            by_id[parent]["children"].append(location)
+
+    return roots
+
+
 def create_location_hash(x, y):
     """
     Generate a unique location hash that can be shared among
@@ -744,6 +966,7 @@ def options():
     parse.add_argument("--y", dest="y_coordinate", type=int, default=0, help="Y Coordinate for generation")
 
     parse.add_argument("--create", dest="create", default=False, action="store_true", help="Create the generated sector in the database")
+    parse.add_argument("--ndjson", dest="ndjson", default=False, action="store_true", help="Stream the generated sector to stdout as newline delimited JSON")
     return parse.parse_args()
 
 
@@ -754,16 +977,15 @@ def cli_sector(opts):
     :param opts:
     :return:
     """
-    # assume our sector x and y at (0,0)
-    sector_x = 0
-    sector_y = 0
-
-    if len(sys.argv) > 2:
-        sector_y = int(sys.argv[-1])
-        sector_x = int(sys.argv[-2])
-
-    # setup a generator
+    # setup a generator, anchored at our coordinates
     generator = SectorGenerator()
+    generator.sector_x = opts.x_coordinate
+    generator.sector_y = opts.y_coordinate
+
+    # stream the sector one location at a time, for piping into the realizer
+    if opts.ndjson:
+        write_locations(generator.iter_locations(), sys.stdout)
+        return
 
     features = generator.generate()
 
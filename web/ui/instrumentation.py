@@ -0,0 +1,281 @@
+"""
+Per-view query count and latency instrumentation.
+
+The `ViewInstrumentationMiddleware` records, for every request, the wall time,
+the number of SQL queries, and the time spent in SQL, filed under the URL
+name of the view that handled it. We keep a rolling window of recent requests
+for each URL name, and report percentiles over it:
+
+    >>> view_stats.summary()
+    {
+        "marketplace": {
+            "requests": 500,
+            "wall_ms": {"p50": 41.2, "p90": 88.0, "p99": 140.3},
+            "sql_count": {"p50": 14, "p90": 19, "p99": 31},
+            "sql_ms": {"p50": 12.1, "p90": 30.4, "p99": 52.8},
+            "n_plus_one": 3
+        },
+        ...
+    }
+
+The summary is served as JSON by the `debug-instrumentation` view, for staff,
+and each view's summary is logged every `log_every` requests.
+
+We also look for N+1 query patterns. Queries are reduced to their shape, with
+literals swapped for placeholders, and a request that runs the same shape
+`n_plus_one` or more times is flagged and logged.
+
+Stats are kept in memory, so each web process reports on its own requests.
+Django 1.11 has no query hooks, so we turn on the debug cursor for the length
+of each request to see its queries. That costs us on every query, so SQL
+capture has its own `capture_sql` setting. Without it we only record wall
+time, and report the SQL stats as None.
+"""
+from django.conf import settings
+from django.db import connections
+
+from collections import deque
+from datetime import datetime
+import re
+import threading
+import time
+
+# literals we swap for placeholders when working out a query's shape
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \((?:\s*\?\s*,)*\s*\?\s*\)", re.IGNORECASE)
+
+
+def query_shape(sql):
+    """
+    Reduce a query to its shape, so the same query with different values
+    looks the same.
+
+    :param sql:
+    :return:
+    """
+    shape = _STRING_LITERAL.sub("?", sql)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    return _IN_LIST.sub("IN (...)", shape)
+
+
+def percentile(values, fraction):
+    """
+    Nearest rank percentile of a list of numbers.
+
+    :param values: sorted list
+    :param fraction: 0.0 - 1.0
+    :return:
+    """
+    if len(values) == 0:
+        return 0
+    rank = int(round(fraction * (len(values) - 1)))
+    return values[rank]
+
+
+class ViewStats(object):
+    """
+    Rolling request stats, by URL name.
+    """
+
+    # which percentiles do we report?
+    percentiles = [("p50", 0.5), ("p90", 0.9), ("p99", 0.99)]
+
+    def __init__(self, window=500):
+        """
+        :param window: how many recent requests we keep for each URL name
+        """
+        self.window = window
+        self._requests = {}
+        self._totals = {}
+        self._flagged = {}
+        self._lock = threading.Lock()
+
+    def record(self, url_name, wall_ms, sql_count, sql_ms, n_plus_one=False):
+        """
+        Record a single request.
+
+        :param url_name:
+        :param wall_ms:
+        :param sql_count: or None if we didn't capture SQL
+        :param sql_ms: or None if we didn't capture SQL
+        :param n_plus_one: was an N+1 pattern flagged?
+        :return: total requests recorded for this URL name
+        """
+        with self._lock:
+            if url_name not in self._requests:
+                self._requests[url_name] = deque(maxlen=self.window)
+                self._totals[url_name] = 0
+                self._flagged[url_name] = 0
+
+            self._requests[url_name].append((wall_ms, sql_count, sql_ms))
+            self._totals[url_name] += 1
+
+            if n_plus_one:
+                self._flagged[url_name] += 1
+
+            return self._totals[url_name]
+
+    def summary(self, url_name=None):
+        """
+        Percentiles over our rolling window, for one URL name or all of them.
+
+        :param url_name:
+        :return: dict of URL name -> stats, or just the stats for url_name
+        """
+        with self._lock:
+            names = [url_name] if url_name is not None else self._requests.keys()
+            windows = dict((name, list(self._requests.get(name, []))) for name in names)
+            totals = dict((name, self._totals.get(name, 0)) for name in names)
+            flagged = dict((name, self._flagged.get(name, 0)) for name in names)
+
+        summary = {}
+        for name, requests in windows.items():
+            stats = {"requests": totals[name], "n_plus_one": flagged[name]}
+
+            for index, metric in enumerate(["wall_ms", "sql_count", "sql_ms"]):
+                values = sorted([request[index] for request in requests if request[index] is not None])
+
+                # SQL we never captured
+                if index > 0 and len(values) == 0:
+                    stats[metric] = None
+                    continue
+
+                stats[metric] = dict((label, percentile(values, fraction)) for label, fraction in self.percentiles)
+
+            summary[name] = stats
+
+        if url_name is not None:
+            return summary[url_name]
+        return summary
+
+    def reset(self):
+        """
+        Forget everything we've recorded.
+
+        :return:
+        """
+        with self._lock:
+            self._requests = {}
+            self._totals = {}
+            self._flagged = {}
+
+
+# every request in the process records here
+view_stats = ViewStats(window=settings.SBO_INSTRUMENTATION["window"])
+
+
+class ViewInstrumentationMiddleware(object):
+    """
+    Record wall time, SQL count, and SQL time for every request, by URL name.
+    """
+    lead = "[instrumentation]"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SBO_INSTRUMENTATION["enabled"]:
+            return self.get_response(request)
+
+        capture_sql = settings.SBO_INSTRUMENTATION["capture_sql"]
+
+        # Django clears the query logs as each request starts, so anything
+        # logged from here on is ours
+        debug_cursors = {}
+        if capture_sql:
+            for connection in connections.all():
+                debug_cursors[connection.alias] = connection.force_debug_cursor
+                connection.force_debug_cursor = True
+
+        start = time.time()
+
+        try:
+            response = self.get_response(request)
+        finally:
+            wall_ms = (time.time() - start) * 1000.0
+
+            queries = [] if capture_sql else None
+            if capture_sql:
+                for connection in connections.all():
+                    queries += list(connection.queries_log)
+                    connection.force_debug_cursor = debug_cursors.get(connection.alias, False)
+
+        url_name = "unresolved"
+        if request.resolver_match is not None and request.resolver_match.url_name is not None:
+            url_name = request.resolver_match.url_name
+
+        self._record(request, url_name, wall_ms, queries)
+
+        return response
+
+    def _record(self, request, url_name, wall_ms, queries):
+        """
+        Record a request, and log anything interesting about it.
+
+        :param request:
+        :param url_name:
+        :param wall_ms:
+        :param queries: list of {"sql", "time"} from the query logs, or None if we didn't capture SQL
+        :return:
+        """
+        if queries is None:
+            total = view_stats.record(url_name, wall_ms, None, None)
+            self._log_summary(url_name, total)
+            return
+
+        sql_ms = sum([float(query["time"]) for query in queries]) * 1000.0
+
+        shapes = {}
+        for query in queries:
+            shape = query_shape(query["sql"])
+            shapes[shape] = shapes.get(shape, 0) + 1
+
+        threshold = settings.SBO_INSTRUMENTATION["n_plus_one"]
+        repeated = sorted([(count, shape) for shape, count in shapes.items() if count >= threshold], reverse=True)
+
+        for count, shape in repeated:
+            self.log("possible N+1 in %s (%s): %d x %s", url_name, request.path, count, shape)
+
+        total = view_stats.record(url_name, wall_ms, len(queries), sql_ms, n_plus_one=len(repeated) > 0)
+        self._log_summary(url_name, total)
+
+    def _log_summary(self, url_name, total):
+        """
+        Log the summary for a URL name every `log_every` requests.
+
+        :param url_name:
+        :param total: requests recorded for the URL name
+        :return:
+        """
+        if total % settings.SBO_INSTRUMENTATION["log_every"] != 0:
+            return
+
+        stats = view_stats.summary(url_name)
+
+        if stats["sql_count"] is None:
+            self.log(
+                "%s over %d requests: wall p50 %.1fms p90 %.1fms p99 %.1fms",
+                url_name, total, stats["wall_ms"]["p50"], stats["wall_ms"]["p90"], stats["wall_ms"]["p99"]
+            )
+        else:
+            self.log(
+                "%s over %d requests: wall p50 %.1fms p90 %.1fms p99 %.1fms, sql p50 %d p90 %d p99 %d queries in p50 %.1fms p99 %.1fms, %d N+1 flagged",
+                url_name, total,
+                stats["wall_ms"]["p50"], stats["wall_ms"]["p90"], stats["wall_ms"]["p99"],
+                stats["sql_count"]["p50"], stats["sql_count"]["p90"], stats["sql_count"]["p99"],
+                stats["sql_ms"]["p50"], stats["sql_ms"]["p99"],
+                stats["n_plus_one"]
+            )
+
+    def log(self, msg, *kargs):
+        """
+        Simple logging output.
+
+        :param msg:
+        :return:
+        """
+        if len(kargs) > 0:
+            msg = msg % kargs
+
+        print "%s [%s] - %s" % (self.lead, str(datetime.now()), msg)
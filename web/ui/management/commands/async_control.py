@@ -1,10 +1,14 @@
 from django.core.management.base import BaseCommand, CommandError
 
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import time
 
 import redis
 
+from ui.async_registry import AsyncRegistry
+from ui.async_runtime import redis_pool
+
 """
 Control all of the async services.
 """
@@ -15,7 +19,8 @@ class Command(BaseCommand):
 
     # control channel prefix mappings, channel prefix pattern -> channel type
     control_prefixes = {
-        "shipyard_async_control": "shipyard_async_control_"
+        "shipyard_async_control": "shipyard_async_control_",
+        "async_tasks_control": "async_tasks_control_"
     }
 
 
@@ -23,13 +28,15 @@ class Command(BaseCommand):
         super(Command, self).__init__(*args, **kwargs)
 
         # self.log("Connecting to redis")
-        self.redis = redis.StrictRedis(host='redis', port=6379, db=0)
+        self.redis = redis.StrictRedis(connection_pool=redis_pool())
+        self.registry = AsyncRegistry(self.redis)
 
     def add_arguments(self, parser):
         parser.add_argument("command", nargs=1)
         parser.add_argument("terms", nargs="*")
 
         parser.add_argument("--seconds", dest="seconds", type=int, default=20, help="Seconds")
+        parser.add_argument("--dead-after", dest="dead_after", type=int, default=120, help="Seconds without a heartbeat before a worker is reaped")
 
     def log(self, msg, *kargs, **kwargs):
         """
@@ -57,6 +64,7 @@ class Command(BaseCommand):
         dispatch_map = {
             "list": self._handle_list,
             "stop": self._handle_stop,
+            "settings": self._handle_settings,
             "expire": self._handle_expire
         }
 
@@ -66,6 +74,34 @@ class Command(BaseCommand):
         else:
             self.log("The command [%s] was not recognized", dispatch_to)
 
+    def _live_channels(self, channel, dead_after):
+        """
+        Reap the dead workers of a channel type, and find the control channels
+        of the rest, along with their settings. Settings are fetched with a
+        single MGET, and workers whose settings have already expired are
+        dropped from the registry.
+
+        :param channel: channel type, like shipyard_async_control
+        :param dead_after: seconds without a heartbeat before a worker is dead
+        :return: list of (control channel, last heartbeat timestamp, settings dict)
+        """
+        self.registry.reap(channel, dead_after)
+
+        workers = self.registry.live(channel)
+        if len(workers) == 0:
+            return []
+
+        redis_keys = [redis_key for redis_key, heartbeat in workers]
+
+        live = []
+        for (redis_key, heartbeat), chan_raw in zip(workers, self.redis.mget(redis_keys)):
+            if chan_raw is None:
+                self.registry.unregister(channel, redis_key)
+            else:
+                live.append((redis_key, heartbeat, json.loads(chan_raw)))
+
+        return live
+
     def _handle_stop(self, *args, **options):
         """
         stop services by setting the active flag to false. We'll get a list
@@ -82,18 +118,82 @@ class Command(BaseCommand):
 
         for channel in channels:
             channel_key = self.control_prefixes[channel]
-            redis_keys = self.redis.keys(channel_key + "*")
-            print "Stopping channel(%s) == %d instances" % (channel_key, len(redis_keys))
-            for redis_key in redis_keys:
-                chan_data = json.loads(self.redis.get(redis_key))
+            live = self._live_channels(channel, options["dead_after"])
+            print "Stopping channel(%s) == %d instances" % (channel_key, len(live))
+
+            if len(live) == 0:
+                continue
+
+            # workers stop as soon as the command reaches them
+            received = self.registry.publish(channel, "stop")
+
+            # and we mark them inactive for anyone listing workers
+            updates = {}
+            for redis_key, heartbeat, chan_data in live:
                 chan_data["active"] = False
-                self.redis.set(redis_key, json.dumps(chan_data))
+                updates[redis_key] = json.dumps(chan_data)
+
+            # keep each worker's expiry, so dead workers still drop out of the registry
+            keys = sorted(updates.keys())
+            pipe = self.redis.pipeline()
+            for redis_key in keys:
+                pipe.pttl(redis_key)
+
+            # a pttl of -2 means the key expired since we listed it, -1 that it never expires
+            writing = [(redis_key, ttl) for redis_key, ttl in zip(keys, pipe.execute()) if ttl is not None and ttl != -2]
+
+            pipe = self.redis.pipeline()
+            for redis_key, ttl in writing:
+                pipe.set(redis_key, updates[redis_key], px=ttl if ttl > 0 else None, xx=True)
+            deactivated = [redis_key for (redis_key, ttl), written in zip(writing, pipe.execute()) if written]
+
+            for redis_key in deactivated:
                 print "    - %s deactivated" % (redis_key,)
+            print "    (%d instances received the stop command)" % (received,)
+
+    def _handle_settings(self, *args, **options):
+        """
+        Push new settings to every worker of a channel type, like:
+
+            python manage.py async_control settings shipyard_async_control duty_cycle=5 chunk_size=100
+
+        Values are parsed as JSON where possible, and used as strings otherwise.
+
+        :param args:
+        :param options:
+        :return:
+        """
+        terms = options["terms"]
+
+        if len(terms) < 2:
+            self.log("Specify a channel and one or more key=value settings")
+            return
+
+        channel = terms[0]
+        if channel not in self.control_prefixes:
+            self.log("The channel [%s] was not recognized", channel)
+            return
+
+        settings = {}
+        for term in terms[1:]:
+            if "=" not in term:
+                self.log("Settings look like key=value, not [%s]", term)
+                return
+
+            key, value = term.split("=", 1)
+            try:
+                settings[key] = json.loads(value)
+            except ValueError:
+                settings[key] = value
+
+        received = self.registry.publish(channel, "settings", settings=settings)
+        print "Pushed settings to channel(%s) == %d instances" % (channel, received)
 
     def _handle_expire(self, *args, **options):
         """
-        Clear our redis of a key prefix. This is not surgical, this is a shotgun. If a channel
-        doesn't subsequently update itself, it's config will disappear
+        Expire the control channels of a channel type. This is not surgical, this is a
+        shotgun. If a channel doesn't subsequently update itself, it's config will disappear,
+        and it will be reaped from the registry.
 
         :param args:
         :param options:
@@ -107,10 +207,15 @@ class Command(BaseCommand):
 
         for channel in channels:
             channel_key = self.control_prefixes[channel]
-            redis_keys = self.redis.keys(channel_key + "*")
-            print "Expiring channel(%s) == %d instances" % (channel_key, len(redis_keys))
-            for redis_key in redis_keys:
-                self.redis.expire(redis_key, expire_in)
+            live = self._live_channels(channel, options["dead_after"])
+            print "Expiring channel(%s) == %d instances" % (channel_key, len(live))
+
+            pipe = self.redis.pipeline(transaction=False)
+            for redis_key, heartbeat, chan_data in live:
+                pipe.expire(redis_key, expire_in)
+            pipe.execute()
+
+            for redis_key, heartbeat, chan_data in live:
                 print "    - %s expiring in %d seconds" % (redis_key, expire_in)
 
 
@@ -122,19 +227,15 @@ class Command(BaseCommand):
         :param options:
         :return:
         """
-        now = datetime.now()
+        now = time.time()
 
         for chan_type, prefix in self.control_prefixes.items():
-            chans = self.redis.keys(prefix + "*")
+            chans = self._live_channels(chan_type, options["dead_after"])
 
             print "channel(%s) == %d instances" % (chan_type, len(chans))
 
-            for chan in chans:
-
-                chan_data = json.loads(self.redis.get(chan))
+            for chan, heartbeat, chan_data in chans:
 
-                # figure out the last sync
-                # looks like 2017-06-21 01:29:55.443200
-                last_sync = datetime.strptime(chan_data["last_sync"], "%Y-%m-%d %H:%M:%S.%f")
-                sync_diff = now - last_sync
+                # how long since this worker checked in?
+                sync_diff = timedelta(seconds=now - heartbeat)
                 print "    - %s (last sync: %s)" % (chan, str(sync_diff))
\ No newline at end of file
@@ -7,6 +7,9 @@ import uuid
 
 import redis
 
+from ui.async_registry import AsyncRegistry
+from ui.async_runtime import redis_pool
+
 """
 Async tasks implementing AsyncCore need to define:
 
@@ -20,7 +23,15 @@ Async tasks implementing AsyncCore need to define:
 
  - update_settings(options) - pull in new options that may have changed in our channel settings
  - default_settings() -> dict - The dictionary of default settings for the channel
- - handle() - Do your work and keep running while self.keep_running() is True
+ - handle() - Do your work and keep running while self.keep_running() is True, using self.wait(self.duty_cycle)
+   rather than time.sleep between runs, so commands are picked up while we wait
+
+Commands (stop, settings changes) are pushed to us over Redis pub/sub by async_control, see
+ui.async_registry. While running we only write a cheap heartbeat.
+
+Several workers of the same type can run at once. Each run, a worker should call self.shard()
+to find which partition of the work is its own, and only work on that partition. Partitions
+rebalance as workers join and leave.
 """
 
 class AsyncCore(BaseCommand):
@@ -33,19 +44,26 @@ class AsyncCore(BaseCommand):
     # run time control - we spin up every 20 seconds
     duty_cycle = 20
 
-    # settings sync - check every 60 seconds for settings updates
-    last_settings_sync = 0
-    setting_sync_delay = 60
+    # settings sync - we pull our settings once at start up, after that changes are pushed to us
+    settings_synced = False
 
     def __init__(self, *args, **kwargs):
         super(AsyncCore, self).__init__(*args, **kwargs)
 
-        # fix up our control channel
+        # fix up our control channel, workers are registered by the channel prefix
+        self.channel_type = self.control_channel.strip("_")
         self.control_channel += str(uuid.uuid4())
 
         # spin us up
         self.log("Connecting to redis")
-        self.redis = redis.StrictRedis(host='redis', port=6379, db=0)
+        self.redis = redis.StrictRedis(connection_pool=redis_pool())
+        self.registry = AsyncRegistry(self.redis)
+
+        # listen for commands to every worker of our type, and to just us
+        self.active = True
+        self.commands = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.commands.subscribe(self.registry.command_channel(self.channel_type), self.registry.command_channel(self.control_channel))
+
         self.seed_control_channel()
 
     def sync_settings(self):
@@ -58,8 +76,17 @@ class AsyncCore(BaseCommand):
         chan_raw = self.redis.get(self.control_channel)
         chan = json.loads(chan_raw)
 
+        self._apply_settings(chan)
+
+    def _apply_settings(self, chan):
+        """
+        Use a full set of control channel settings.
+
+        :param chan:
+        :return:
+        """
         # check for our own things to update
-        self.duty_cycle = chan["duty_cycle"]
+        self.duty_cycle = chan.get("duty_cycle", self.duty_cycle)
 
         self.update_settings(chan)
 
@@ -103,6 +130,7 @@ class AsyncCore(BaseCommand):
 
         # stash it
         self.redis.psetex(self.control_channel, self.duty_cycle * 1000 * 2, json.dumps(control))
+        self.registry.heartbeat(self.channel_type, self.control_channel)
 
     def log(self, msg, *kargs, **kwargs):
         """
@@ -133,30 +161,114 @@ class AsyncCore(BaseCommand):
 
     def keep_running(self):
         """
-        Check our control channel for settings.
+        Apply any commands pushed to us, and send our heartbeat.
 
         :return:
         """
-        # do our settings house keeping
-        now = time.time()
-        if now - self.last_settings_sync > self.setting_sync_delay:
+        # our settings are only pulled once, after that they're pushed to us
+        if not self.settings_synced:
             self.log("synchronizing settings")
             self.sync_settings()
-            self.last_settings_sync = now
+            self.settings_synced = True
 
-        # grab our control channel
-        chan_raw = self.redis.get(self.control_channel)
-        chan = json.loads(chan_raw)
+        self.process_commands()
+
+        # let everyone know we're still here, or that we're done
+        if self.active:
+            self.heartbeat()
+        else:
+            self.registry.unregister(self.channel_type, self.control_channel)
+            self.commands.close()
+
+        return self.active
+
+    def heartbeat(self):
+        """
+        Keep our control channel alive, and refresh our registry heartbeat. If
+        our control channel has expired out from under us, we seed it again.
+
+        :return:
+        """
+        if not self.redis.pexpire(self.control_channel, self.duty_cycle * 1000 * 2):
+            self.seed_control_channel()
+        else:
+            self.registry.heartbeat(self.channel_type, self.control_channel)
+
+    def shard(self):
+        """
+        Which partition of the work is ours? Every live worker of our type
+        (anything with a heartbeat in the last two duty cycles) takes a
+        partition, in control channel order, so workers agree on the
+        partitioning without talking to each other. Call this every run, so
+        we pick up workers joining and leaving.
 
-        # poke our time
-        chan["last_sync"] = str(datetime.now())
+        :return: tuple of (shard index, shard count)
+        """
+        workers = sorted([channel for channel, heartbeat in self.registry.live(self.channel_type, max_age=self.duty_cycle * 2)])
+
+        # we may have just started, or missed a heartbeat
+        if self.control_channel not in workers:
+            workers = sorted(workers + [self.control_channel])
+
+        return workers.index(self.control_channel), len(workers)
+
+    def wait(self, seconds):
+        """
+        Wait between runs, applying commands as soon as they arrive. We stop
+        waiting early if we're told to stop.
+
+        :param seconds:
+        :return:
+        """
+        deadline = time.time() + seconds
+
+        while self.active:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self.process_commands(timeout=remaining)
+
+    def process_commands(self, timeout=0):
+        """
+        Apply the commands that have been pushed to us, waiting up to
+        `timeout` seconds for the first one.
+
+        :param timeout:
+        :return:
+        """
+        message = self.commands.get_message(timeout=timeout)
+
+        while message is not None:
+            if message["type"] == "message":
+                self._handle_command(message["data"])
+            message = self.commands.get_message()
+
+    def _handle_command(self, data):
+        """
+        Apply a single command.
+
+        :param data: JSON command, see ui.async_registry
+        :return:
+        """
+        try:
+            command = json.loads(data)
+        except ValueError:
+            self.log("Ignoring malformed command [%s]", data)
+            return
 
-        # get our run
-        run = chan["active"]
+        if command.get("command") == "stop":
+            self.log("Received stop command")
+            self.active = False
 
-        # store our settings
-        self.redis.psetex(self.control_channel, self.duty_cycle * 1000 * 2, json.dumps(chan))
+        elif command.get("command") == "settings":
+            self.log("Received new settings")
 
-        return run
+            chan = json.loads(self.redis.get(self.control_channel) or "{}")
+            chan.update(command.get("settings", {}))
+            chan["last_sync"] = str(datetime.now())
+            self.redis.psetex(self.control_channel, self.duty_cycle * 1000 * 2, json.dumps(chan))
 
+            self._apply_settings(chan)
 
+        else:
+            self.log("Ignoring unknown command [%s]", command.get("command"))
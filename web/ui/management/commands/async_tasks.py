@@ -0,0 +1,212 @@
+from async_core import AsyncCore
+
+from django.conf import settings
+
+import json
+
+from ui.async_runtime import AsyncRuntime, AsyncTask
+from ui.generation.materializer import SectorMaterializer
+from ui.models import ShipYard, ShipTravelLog, ShipCargoLog, CreditJournal
+from ui.provisioning import ShipyardProvisioner
+
+"""
+Run all of our periodic background tasks in one process, on an AsyncRuntime.
+
+    python manage.py async_tasks
+
+Task duty cycles can be changed on the fly:
+
+    python manage.py async_control settings async_tasks_control 'duty_cycles={"shipyard_restock": 5}'
+"""
+
+
+class ShipyardRestockTask(AsyncTask):
+    """
+    Restock the ship yards in our worker's shard.
+    """
+    name = "shipyard_restock"
+    duty_cycle = 20
+
+    def __init__(self, worker, duty_cycle=None):
+        super(ShipyardRestockTask, self).__init__(duty_cycle=duty_cycle)
+        self.worker = worker
+
+    def run(self):
+        yard_count, ship_count = ShipYard.objects.restock_ships(
+            chunk_size=self.worker.chunk_size,
+            time_budget=self.duty_cycle / 2.0,
+            shard=self.worker.shard()
+        )
+
+        if yard_count > 0:
+            return "+ %d ships restocked at %d shipyards" % (ship_count, yard_count)
+
+
+class ShipLogPruneTask(AsyncTask):
+    """
+    Prune the ship travel and cargo logs.
+    """
+    name = "ship_log_prune"
+    duty_cycle = 3600
+
+    def run(self):
+        deleted = 0
+        for log_model in [ShipTravelLog, ShipCargoLog]:
+            deleted += log_model.objects.prune(keep=settings.SBO_SHIP_LOGS["keep"])
+
+        if deleted > 0:
+            return "pruned %d ship log entries" % (deleted,)
+
+
+class CreditSettleTask(AsyncTask):
+    """
+    Settle credits posted to the credit journal.
+    """
+    name = "credit_settle"
+    duty_cycle = 5
+
+    def run(self):
+        entries, profiles = CreditJournal.objects.settle()
+
+        if entries > 0:
+            return "settled %d credit journal entries for %d profiles" % (entries, profiles)
+
+
+class ShipyardProvisionTask(AsyncTask):
+    """
+    Seed ship yards at locations queued by arriving ships.
+    """
+    name = "shipyard_provision"
+    duty_cycle = 2
+
+    def run(self):
+        yards = ShipyardProvisioner().provision_pending()
+
+        if yards > 0:
+            return "+ %d queued shipyards provisioned" % (yards,)
+
+
+class HotLocationProvisionTask(AsyncTask):
+    """
+    Seed ship yards ahead of time around the busiest locations, then decay
+    our traffic counts.
+    """
+    name = "hot_location_provision"
+    duty_cycle = 60
+
+    def run(self):
+        provisioner = ShipyardProvisioner()
+
+        yards = provisioner.provision_hot(
+            top=settings.SBO_PROVISIONING["hot_locations"],
+            neighbours=settings.SBO_PROVISIONING["neighbours"],
+            radius=settings.SBO_PROVISIONING["radius"]
+        )
+        provisioner.decay_traffic(factor=settings.SBO_PROVISIONING["decay"])
+
+        if yards > 0:
+            return "+ %d shipyards provisioned around hot locations" % (yards,)
+
+
+class SectorPrefetchTask(AsyncTask):
+    """
+    Materialize sectors queued for prefetch by ships looking towards them.
+    """
+    name = "sector_prefetch"
+    duty_cycle = 2
+
+    def run(self):
+        sectors = SectorMaterializer().prefetch_pending(limit=settings.SBO_SECTORS["prefetch_batch"])
+
+        if len(sectors) > 0:
+            return "+ %d sectors prefetched" % (len(sectors),)
+
+
+class Command(AsyncCore):
+    help = 'Run periodic background tasks on a shared runtime'
+    lead = "[async_tasks]"
+
+    # redis config
+    control_channel = "async_tasks_control_"
+
+    # how many tasks can run at once?
+    workers = 4
+
+    # shipyard restocking, see ShipYardManager::restock_ships
+    chunk_size = 500
+
+    def default_settings(self):
+        """
+        What does our basic control channel look like?
+
+        :return:
+        """
+        return {
+            "type": "async_tasks_control",
+
+            # how many tasks can run at once?
+            "workers": 4,
+
+            # how often do we log our task stats, in seconds
+            "duty_cycle": 60,
+
+            # seconds between runs of each task, by task name
+            "duty_cycles": {
+                ShipyardRestockTask.name: ShipyardRestockTask.duty_cycle,
+                ShipLogPruneTask.name: ShipLogPruneTask.duty_cycle,
+                CreditSettleTask.name: CreditSettleTask.duty_cycle,
+                ShipyardProvisionTask.name: ShipyardProvisionTask.duty_cycle,
+                HotLocationProvisionTask.name: HotLocationProvisionTask.duty_cycle,
+                SectorPrefetchTask.name: SectorPrefetchTask.duty_cycle
+            },
+
+            "chunk_size": 500
+        }
+
+    def update_settings(self, settings):
+        """
+        Pick up changes to our task settings.
+
+        :param settings:
+        :return:
+        """
+        self.workers = settings.get("workers", self.workers)
+        self.chunk_size = settings.get("chunk_size", self.chunk_size)
+
+        if hasattr(self, "runtime"):
+            for name, duty_cycle in settings.get("duty_cycles", {}).items():
+                self.runtime.set_duty_cycle(name, duty_cycle)
+
+    def handle(self, *args, **options):
+        """
+        Start our runtime, and report on it until we're told to stop.
+
+        :param args:
+        :param options:
+        :return:
+        """
+        self.log("Starting /async_tasks/")
+
+        # pull in our settings before we build our runtime
+        if not self.keep_running():
+            return
+
+        self.runtime = AsyncRuntime(workers=self.workers)
+        self.runtime.register(ShipyardRestockTask(self))
+        self.runtime.register(ShipLogPruneTask())
+        self.runtime.register(CreditSettleTask())
+        self.runtime.register(ShipyardProvisionTask())
+        self.runtime.register(HotLocationProvisionTask())
+        self.runtime.register(SectorPrefetchTask())
+
+        # our first settings sync happened before we had tasks to configure
+        self.sync_settings()
+        self.runtime.start()
+
+        while self.keep_running():
+            self.wait(self.duty_cycle)
+            self.log("task stats %s", json.dumps(self.runtime.stats(), sort_keys=True))
+
+        self.runtime.stop()
+
+        self.log("Stopping /async_tasks/")
@@ -0,0 +1,406 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import transaction, connection, DatabaseError
+
+from datetime import datetime
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from ui.models import Location, Profile, Ship, Good
+from ui.trade import TradeService, TradeOrder, TradeError
+from ui.generation import resource_registry
+from ui.generation.galaxy import generate_sector
+from ui.generation.realizer import SectorRealizer
+from ui.routes import RoutePlanner
+from ui import spatial
+
+"""
+Benchmark hot paths of the game against synthetic data. Anything a benchmark
+writes to the database is rolled back when the benchmark completes.
+
+    python manage.py benchmark spatial --counts 1000 10000 100000
+
+The trade benchmark times many threads trading with the same ship at once.
+Threads need their own committed data, so it cleans up after itself instead.
+That credits and cargo still add up under contention is tested in
+ui.tests.TradeConcurrencyTest.
+
+    python manage.py benchmark trade --threads 16 --orders 200
+
+The startup benchmark times how long it takes a fresh process to set up Django
+and import each of our commands, from outside the web directory, and how long
+the resource registry takes to load everything on first use.
+
+    python manage.py benchmark startup --runs 10
+
+The routes benchmark realizes a square of generated sectors, and times route
+planning between random top level locations in it, for a ship with a max
+range of `--radius`.
+
+    python manage.py benchmark routes --sectors 6 --queries 50 --radius 500
+"""
+
+
+class Command(BaseCommand):
+    help = 'Benchmark game subsystems'
+    lead = "[benchmark]"
+
+    # how many locations are in a realized sector? We use this to keep our synthetic
+    # location density in line with real generated space
+    sector_location_count = 3030
+
+    def add_arguments(self, parser):
+        parser.add_argument("command", nargs=1)
+
+        parser.add_argument("--counts", dest="counts", type=int, nargs="+", default=[1000, 10000, 50000], help="Location counts to benchmark")
+        parser.add_argument("--queries", dest="queries", type=int, default=50, help="Queries to time at each count")
+        parser.add_argument("--radius", dest="radius", type=int, default=500, help="Radius of each range query")
+        parser.add_argument("--threads", dest="threads", type=int, default=8, help="Concurrent traders")
+        parser.add_argument("--orders", dest="orders", type=int, default=200, help="Orders placed by each trader")
+        parser.add_argument("--runs", dest="runs", type=int, default=5, help="Fresh processes to time for each import")
+        parser.add_argument("--sectors", dest="sectors", type=int, default=4, help="Width, in sectors, of the space we plan routes across")
+
+    def log(self, msg, *kargs, **kwargs):
+        """
+        Simple logging output.
+
+        :param msg:
+        :return:
+        """
+        if len(kargs) > 0:
+            msg = msg % kargs
+        if len(kwargs) > 0:
+            msg = msg % kwargs
+
+        print "%s [%s] - %s" % (self.lead, str(datetime.now()), msg)
+
+    def handle(self, *args, **options):
+        """
+        We'll dispatch our benchmark from here.
+
+        :param args:
+        :param options:
+        :return:
+        """
+
+        dispatch_map = {
+            "spatial": self._handle_spatial,
+            "trade": self._handle_trade,
+            "startup": self._handle_startup,
+            "routes": self._handle_routes
+        }
+
+        dispatch_to = options["command"][0]
+        if dispatch_to in dispatch_map:
+            dispatch_map[dispatch_to](*args, **options)
+        else:
+            raise CommandError("The benchmark [%s] was not recognized" % (dispatch_to,))
+
+    def _time_ms(self, func, *args):
+        """
+        Time a single call, in milliseconds.
+
+        :param func:
+        :param args:
+        :return:
+        """
+        start = time.time()
+        func(*args)
+        return (time.time() - start) * 1000.0
+
+    def _median(self, values):
+        """
+        Median of a list of numbers.
+
+        :param values:
+        :return:
+        """
+        values = sorted(values)
+        mid = len(values) / 2
+        if len(values) % 2 == 0:
+            return (values[mid - 1] + values[mid]) / 2.0
+        return values[mid]
+
+    def _handle_spatial(self, *args, **options):
+        """
+        Compare the bounding box + python distance range query to the spatial
+        grid index, over a growing number of locations.
+
+        :param args:
+        :param options:
+        :return:
+        """
+        radius = options["radius"]
+
+        print "%10s %14s %14s %10s" % ("locations", "bbox (ms)", "grid (ms)", "in range")
+
+        for count in options["counts"]:
+
+            with transaction.atomic():
+                extent = self._seed_locations(count)
+
+                centers = [(random.uniform(0, extent), random.uniform(0, extent)) for i in range(options["queries"])]
+
+                bbox_times = [self._time_ms(self._bbox_in_range, x, y, radius) for x, y in centers]
+                grid_times = [self._time_ms(Location.objects.within_range, x, y, radius) for x, y in centers]
+                found = [len(Location.objects.within_range(x, y, radius)) for x, y in centers[:5]]
+
+                print "%10d %14.2f %14.2f %10d" % (count, self._median(bbox_times), self._median(grid_times), self._median(found))
+
+                # leave the database as we found it
+                transaction.set_rollback(True)
+
+    def _seed_locations(self, count):
+        """
+        Scatter synthetic locations across a square of space with the same
+        density as a realized sector. Returns the width of the square.
+
+        :param count:
+        :return:
+        """
+        extent = int(math.sqrt(count * 1.0 / self.sector_location_count) * spatial.SECTOR_SIZE)
+
+        self.log("seeding %d locations across %d x %d", count, extent, extent)
+
+        locations = []
+        for i in range(count):
+            location = Location(
+                name="Benchmark %d" % (i,),
+                x_coordinate=random.randrange(0, extent),
+                y_coordinate=random.randrange(0, extent),
+                image_name="benchmark.png",
+                location_type="star"
+            )
+            locations.append(spatial.assign_grid_cell(location))
+
+        Location.objects.bulk_create(locations, batch_size=5000)
+
+        return extent
+
+    def _bbox_in_range(self, x, y, radius):
+        """
+        The original range query - bounding box in the database, then a real distance
+        check for each location in python.
+
+        :param x:
+        :param y:
+        :param radius:
+        :return:
+        """
+        close_enough = Location.objects.filter(
+            x_coordinate__gte=x - radius,
+            x_coordinate__lte=x + radius,
+            y_coordinate__gte=y - radius,
+            y_coordinate__lte=y + radius
+        ).all()
+
+        plist = []
+        for location in close_enough:
+            real_dist = math.sqrt((x - location.x_coordinate) ** 2 + (y - location.y_coordinate) ** 2)
+            if real_dist <= radius:
+                plist.append(location)
+        return plist
+
+    def _handle_trade(self, *args, **options):
+        """
+        Hammer a single ship with concurrent buy and sell orders through the
+        TradeService, and report how many went through.
+
+        :param args:
+        :param options:
+        :return:
+        """
+        user = User.objects.create_user("benchmark-trader-%d" % (random.randrange(1000000),))
+        profile = Profile.objects.create(user=user, credits=50000)
+        location = Location.objects.create(name="Benchmark Exchange", image_name="benchmark.png", location_type="planet")
+
+        goods = [
+            Good.objects.create(name="Benchmark Good %d" % (i,), location=location, is_import=True, is_export=True, price=random.uniform(20, 200))
+            for i in range(4)
+        ]
+
+        ship = Ship.objects.create(
+            name="Benchmark Hauler",
+            model="benchmark",
+            image_name="benchmark.png",
+            owner=profile,
+            location=location,
+            home_location=location,
+            cargo_capacity=100
+        )
+
+        self.log("%d traders placing %d orders each", options["threads"], options["orders"])
+
+        results = {"filled": 0, "rejected": 0, "errors": 0}
+        results_lock = threading.Lock()
+
+        def trader():
+            service = TradeService(Profile.objects.get(pk=profile.pk))
+            tally = {"filled": 0, "rejected": 0, "errors": 0}
+
+            try:
+                for i in range(options["orders"]):
+                    orders = [
+                        TradeOrder(random.choice(["buy", "sell"]), random.choice(goods).id, random.randint(1, 15))
+                        for j in range(random.randint(1, 3))
+                    ]
+
+                    try:
+                        service.trade(ship.id, location.id, orders)
+                        tally["filled"] += len(orders)
+                    except TradeError:
+                        tally["rejected"] += len(orders)
+                    except DatabaseError as e:
+                        self.log("trade failed: %s", e)
+                        tally["errors"] += len(orders)
+            finally:
+                connection.close()
+
+            with results_lock:
+                for key, value in tally.items():
+                    results[key] += value
+
+        start = time.time()
+
+        threads = [threading.Thread(target=trader) for i in range(options["threads"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.time() - start
+
+        try:
+            print "%10s %10s %10s %12s" % ("filled", "rejected", "errors", "orders/sec")
+            print "%10d %10d %10d %12.1f" % (results["filled"], results["rejected"], results["errors"], results["filled"] / max(elapsed, 0.001))
+        finally:
+            location.delete()
+            user.delete()
+
+    # modules whose import time we care about, as used by manage.py commands and workers
+    startup_modules = [
+        "ui.models",
+        "ui.generation.smooth_space_generator",
+        "ui.management.commands.generate_galaxy",
+        "ui.management.commands.shipyard_async",
+        "ui.management.commands.async_tasks"
+    ]
+
+    # run in a fresh interpreter, prints seconds for django.setup and for the import
+    startup_script = (
+        "import time; start = time.time(); "
+        "import django; django.setup(); setup = time.time(); "
+        "import importlib; importlib.import_module(%r); "
+        "print '%%f %%f' %% (setup - start, time.time() - setup)"
+    )
+
+    def _handle_startup(self, *args, **options):
+        """
+        Time Django setup and module imports in fresh processes, started from
+        outside the web directory, and time a cold load of every resource in
+        the resource registry.
+
+        :param args:
+        :param options:
+        :return:
+        """
+        web_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([web_dir] + [path for path in [env.get("PYTHONPATH")] if path])
+        env["DJANGO_SETTINGS_MODULE"] = os.environ.get("DJANGO_SETTINGS_MODULE", "web.settings")
+
+        print "%-45s %12s %12s" % ("module", "setup (ms)", "import (ms)")
+
+        for module in self.startup_modules:
+            setup_times = []
+            import_times = []
+
+            for run in range(options["runs"]):
+                output = subprocess.check_output([sys.executable, "-c", self.startup_script % (module,)], env=env, cwd="/")
+                setup, imported = [float(value) * 1000.0 for value in output.strip().splitlines()[-1].split()]
+                setup_times.append(setup)
+                import_times.append(imported)
+
+            print "%-45s %12.2f %12.2f" % (module, self._median(setup_times), self._median(import_times))
+
+        resource_registry.reset()
+        elapsed = self._time_ms(self._load_resources)
+        self.log("resource registry cold load in %.2f ms", elapsed)
+
+    def _load_resources(self):
+        """
+        Load everything in the resource registry.
+
+        :return:
+        """
+        for kind in ["planet"] + resource_registry.IMAGE_DIRECTORIES.keys():
+            resource_registry.images(kind)
+
+        resource_registry.system_prefixes()
+        resource_registry.shipyards()
+        resource_registry.goods()
+        resource_registry.pick_ship_template()
+        resource_registry.pick_upgrade_grade()
+
+    def _handle_routes(self, *args, **options):
+        """
+        Time route planning across a square of realized sectors.
+
+        :param args:
+        :param options:
+        :return:
+        """
+        with transaction.atomic():
+            realizer = SectorRealizer()
+            roots = []
+
+            for sector_y in range(options["sectors"]):
+                for sector_x in range(options["sectors"]):
+                    sector_x, sector_y, features = generate_sector((sector_x, sector_y, 7222007))
+                    roots += [location for location in realizer.realize_bulk(features) if location.parent_id is None]
+
+            self.log("realized %d sectors with %d top level locations", options["sectors"] ** 2, len(roots))
+
+            times = []
+            query_counts = []
+            hops = []
+            distances = []
+            unreachable = 0
+
+            connection.force_debug_cursor = True
+            try:
+                for i in range(options["queries"]):
+                    start, destination = random.sample(roots, 2)
+
+                    queries_before = len(connection.queries)
+                    started = time.time()
+                    route = RoutePlanner(options["radius"]).plan(start, destination)
+                    times.append((time.time() - started) * 1000.0)
+                    query_counts.append(len(connection.queries) - queries_before)
+
+                    if route is None:
+                        unreachable += 1
+                    else:
+                        hops.append(len(route.legs))
+                        distances.append(route.distance)
+            finally:
+                connection.force_debug_cursor = False
+
+            times.sort()
+            print "%10s %10s %12s %10s %10s %10s %10s %10s" % ("routes", "no route", "distance", "hops", "queries", "p50 (ms)", "p90 (ms)", "max (ms)")
+            print "%10d %10d %12.1f %10.1f %10.1f %10.2f %10.2f %10.2f" % (
+                len(hops), unreachable,
+                self._median(distances) if len(distances) > 0 else 0.0,
+                self._median(hops) if len(hops) > 0 else 0.0,
+                self._median(query_counts),
+                self._median(times), times[int(len(times) * 0.9)], times[-1]
+            )
+
+            # leave the database as we found it
+            transaction.set_rollback(True)
@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from datetime import datetime
+import time
+
+from ui.generation.galaxy import GalaxyGenerator
+from ui.generation.realizer import SectorRealizer
+from ui.models import Sector
+
+"""
+Generate and realize a rectangle of sectors, using every core we have.
+
+    python manage.py generate_galaxy --min-x -2 --min-y -2 --max-x 2 --max-y 2
+"""
+
+
+class Command(BaseCommand):
+    help = 'Generate and realize a rectangle of sectors across a process pool'
+    lead = "[generate_galaxy]"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-x", dest="min_x", type=int, default=0, help="Western most sector")
+        parser.add_argument("--min-y", dest="min_y", type=int, default=0, help="Southern most sector")
+        parser.add_argument("--max-x", dest="max_x", type=int, default=0, help="Eastern most sector")
+        parser.add_argument("--max-y", dest="max_y", type=int, default=0, help="Northern most sector")
+
+        parser.add_argument("--seed", dest="seed", type=int, default=7222007, help="Simplex seed for the galaxy")
+        parser.add_argument("--processes", dest="processes", type=int, default=None, help="Generator processes, defaults to the number of cores")
+        parser.add_argument("--dry-run", dest="dry_run", default=False, action="store_true", help="Generate sectors without realizing them")
+
+    def log(self, msg, *kargs, **kwargs):
+        """
+        Simple logging output.
+
+        :param msg:
+        :return:
+        """
+        if len(kargs) > 0:
+            msg = msg % kargs
+        if len(kwargs) > 0:
+            msg = msg % kwargs
+
+        print "%s [%s] - %s" % (self.lead, str(datetime.now()), msg)
+
+    def handle(self, *args, **options):
+        """
+        Fan out sector generation, and realize sectors as they come back.
+
+        :param args:
+        :param options:
+        :return:
+        """
+        if options["min_x"] > options["max_x"] or options["min_y"] > options["max_y"]:
+            raise CommandError("The sector rectangle is empty")
+
+        galaxy = GalaxyGenerator(simplex_seed=options["seed"], processes=options["processes"])
+        realizer = SectorRealizer()
+
+        sectors = galaxy.sectors(options["min_x"], options["min_y"], options["max_x"], options["max_y"])
+
+        # skip anything that's already in the sector registry. We only claim
+        # sectors as we realize them, so a failed run doesn't leave any claimed
+        # sectors behind that nobody is realizing
+        if not options["dry_run"]:
+            unregistered = Sector.objects.unregistered(sectors)
+            self.log("Skipping %d sectors that already exist", len(sectors) - len(unregistered))
+            sectors = unregistered
+
+        self.log("Generating %d sectors across %d processes", len(sectors), galaxy.processes)
+
+        # our workers are forked from this process, and shouldn't share our database connection
+        connections.close_all()
+
+        start = time.time()
+        location_count = 0
+
+        for sector_x, sector_y, features in galaxy.generate_sectors(sectors):
+
+            if options["dry_run"]:
+                self.log("Generated sector (%d, %d) with %d top level locations", sector_x, sector_y, len(features))
+                continue
+
+            with transaction.atomic():
+                sector = Sector.objects.claim(sector_x, sector_y, options["seed"])
+
+                # someone else got to this sector while we were generating it
+                if sector is None:
+                    self.log("Sector (%d, %d) was claimed elsewhere, skipping", sector_x, sector_y)
+                    continue
+
+                locations = realizer.realize_bulk(features)
+                sector.mark_realized(len(locations))
+
+            location_count += len(locations)
+
+            self.log("Realized sector (%d, %d) with %d locations", sector_x, sector_y, len(locations))
+
+        self.log("Finished %d sectors, %d locations in %.2f seconds", len(sectors), location_count, time.time() - start)
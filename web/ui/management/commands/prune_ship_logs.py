@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from datetime import datetime, timedelta
+
+from ui.models import ShipTravelLog, ShipCargoLog
+
+"""
+Prune the ship travel and cargo logs in bulk, keeping the most recent entries
+for each ship, and optionally dropping anything older than a number of days.
+
+    python manage.py prune_ship_logs --keep 100 --days 30
+"""
+
+
+class Command(BaseCommand):
+    help = 'Prune old ship travel and cargo log entries'
+    lead = "[prune_ship_logs]"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep", dest="keep", type=int, default=settings.SBO_SHIP_LOGS["keep"], help="Log entries to keep for each ship")
+        parser.add_argument("--days", dest="days", type=int, default=None, help="Drop log entries older than this many days")
+
+    def log(self, msg, *kargs, **kwargs):
+        """
+        Simple logging output.
+
+        :param msg:
+        :return:
+        """
+        if len(kargs) > 0:
+            msg = msg % kargs
+        if len(kwargs) > 0:
+            msg = msg % kwargs
+
+        print "%s [%s] - %s" % (self.lead, str(datetime.now()), msg)
+
+    def handle(self, *args, **options):
+        """
+        Prune each of our logs.
+
+        :param args:
+        :param options:
+        :return:
+        """
+        if options["keep"] < 0:
+            raise CommandError("Can't keep a negative number of log entries")
+
+        before = None
+        if options["days"] is not None:
+            before = timezone.now() - timedelta(days=options["days"])
+
+        for name, log_model in [("travel", ShipTravelLog), ("cargo", ShipCargoLog)]:
+            deleted = log_model.objects.prune(keep=options["keep"], before=before)
+            self.log("Pruned %d %s log entries", deleted, name)
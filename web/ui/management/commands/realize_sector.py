@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+import sys
+
+from ui.generation.ndjson import read_locations
+from ui.generation.realizer import SectorRealizer
+
+"""
+Realize a stream of generated locations, in newline delimited JSON, from a file
+or from stdin:
+
+    python ui/generation/smooth_space_generator.py --sector --ndjson | python manage.py realize_sector -
+"""
+
+
+class Command(BaseCommand):
+    help = 'Realize a newline delimited JSON location stream into the database'
+    lead = "[realize_sector]"
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", nargs=1, help="Path to the location stream, or - for stdin")
+
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=1000, help="Locations to insert at once")
+        parser.add_argument("--shipyard-chance", dest="shipyard_chance", type=float, default=0.0, help="Odds each location gets a stocked ship yard")
+
+    def handle(self, *args, **options):
+        """
+        Stream locations into the realizer.
+
+        :param args:
+        :param options:
+        :return:
+        """
+        source = options["source"][0]
+        realizer = SectorRealizer(batch_size=options["batch_size"], shipyard_chance=options["shipyard_chance"])
+
+        if source == "-":
+            realizer.realize_stream(read_locations(sys.stdin))
+            return
+
+        try:
+            stream = open(source, "r")
+        except IOError as e:
+            raise CommandError("Couldn't open the location stream [%s]: %s" % (source, e))
+
+        with stream:
+            realizer.realize_stream(read_locations(stream))
@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+
+from datetime import datetime
+
+from ui.models import Ship
+
+"""
+Check the running cargo and upgrade loads of every ship against the cargo and
+upgrades the ship actually has, and optionally rebuild them.
+
+    python manage.py ship_loads check
+    python manage.py ship_loads rebuild
+"""
+
+
+class Command(BaseCommand):
+    help = 'Check or rebuild the cargo and upgrade loads of ships'
+    lead = "[ship_loads]"
+
+    def add_arguments(self, parser):
+        parser.add_argument("command", nargs=1)
+
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=1000, help="Ships to check at once")
+
+    def log(self, msg, *kargs, **kwargs):
+        """
+        Simple logging output.
+
+        :param msg:
+        :return:
+        """
+        if len(kargs) > 0:
+            msg = msg % kargs
+        if len(kwargs) > 0:
+            msg = msg % kwargs
+
+        print "%s [%s] - %s" % (self.lead, str(datetime.now()), msg)
+
+    def handle(self, *args, **options):
+        """
+        We'll dispatch our command from here.
+
+        :param args:
+        :param options:
+        :return:
+        """
+        dispatch_to = options["command"][0]
+
+        if dispatch_to not in ["check", "rebuild"]:
+            raise CommandError("The command [%s] was not recognized" % (dispatch_to,))
+
+        rebuild = dispatch_to == "rebuild"
+        checked = 0
+        mismatched = 0
+
+        ship_ids = list(Ship.objects.order_by("id").values_list("id", flat=True))
+
+        for offset in range(0, len(ship_ids), options["batch_size"]):
+            batch = ship_ids[offset:offset + options["batch_size"]]
+
+            with transaction.atomic():
+                for ship_id, cargo_load, upgrade_load, cargo_actual, upgrade_actual in self._loads(batch, lock=rebuild):
+                    checked += 1
+
+                    if cargo_load == cargo_actual and upgrade_load == upgrade_actual:
+                        continue
+
+                    mismatched += 1
+                    self.log("Ship <%d> cargo load %d (actual %d), upgrade load %d (actual %d)", ship_id, cargo_load, cargo_actual, upgrade_load, upgrade_actual)
+
+                    if rebuild:
+                        Ship.objects.filter(pk=ship_id).update(cargo_load=cargo_actual, upgrade_load=upgrade_actual)
+
+        self.log("Checked %d ships, %d with mismatched loads%s", checked, mismatched, " (rebuilt)" if rebuild and mismatched > 0 else "")
+
+    def _loads(self, ship_ids, lock=False):
+        """
+        Find the recorded and actual loads of a batch of ships. Cargo and upgrades
+        are summed in separate queries, so the joins don't multiply each other.
+
+        :param ship_ids:
+        :param lock: lock the ship rows while we rebuild them
+        :return: list of (ship_id, cargo_load, upgrade_load, cargo_actual, upgrade_actual)
+        """
+        ships = Ship.objects.filter(id__in=ship_ids)
+        if lock:
+            ships = ships.select_for_update()
+        recorded = dict((row[0], row[1:]) for row in ships.values_list("id", "cargo_load", "upgrade_load"))
+
+        cargo = dict(Ship.objects.filter(id__in=ship_ids).annotate(actual=models.Sum("cargo__quantity")).values_list("id", "actual"))
+        upgrades = dict(Ship.objects.filter(id__in=ship_ids).annotate(actual=models.Sum("upgrades__capacity")).values_list("id", "actual"))
+
+        return [
+            (ship_id, recorded[ship_id][0], recorded[ship_id][1], cargo.get(ship_id) or 0, upgrades.get(ship_id) or 0)
+            for ship_id in ship_ids if ship_id in recorded
+        ]
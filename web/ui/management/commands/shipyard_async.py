@@ -17,6 +17,10 @@ class Command(AsyncCore):
     # redis config
     control_channel = "shipyard_async_control_"
 
+    # restocking, see default_settings
+    chunk_size = 500
+    time_budget = 10
+
     def default_settings(self):
         """
         What does our basic control channel look like?
@@ -24,9 +28,25 @@ class Command(AsyncCore):
         :return:
         """
         return {
-            "type": "shipyard_async_control"
+            "type": "shipyard_async_control",
+
+            # how many yards do we restock in each bulk insert?
+            "chunk_size": 500,
+
+            # how much of each duty cycle can we spend restocking, in seconds
+            "time_budget": 10
         }
 
+    def update_settings(self, settings):
+        """
+        Pick up changes to our restocking settings.
+
+        :param settings:
+        :return:
+        """
+        self.chunk_size = settings.get("chunk_size", self.chunk_size)
+        self.time_budget = settings.get("time_budget", self.time_budget)
+
     def handle(self, *args, **options):
         """
         Handle the async task mode.
@@ -40,17 +60,17 @@ class Command(AsyncCore):
         while self.keep_running():
 
             # Let's restock ships
-            self.log("starting shipyard resource check")
-            yard = ShipYard.objects.too_few_ships_available().first()
+            shard = self.shard()
+            self.log("starting shipyard resource check (shard %d of %d)", shard[0] + 1, shard[1])
+            start = time.time()
+            yard_count, ship_count = ShipYard.objects.restock_ships(chunk_size=self.chunk_size, time_budget=self.time_budget, shard=shard)
 
-            if yard is not None:
-                self.log("Restocking shipyard <%s>" % (yard.name,))
-                new_ship_count = yard.restock_ships()
-                self.log("+ %d ships restocked at <%s>", new_ship_count, yard.name)
+            if yard_count > 0:
+                self.log("+ %d ships restocked at %d shipyards in %.2f seconds", ship_count, yard_count, time.time() - start)
             else:
                 self.log("% no shipyards needed to be restocked")
 
-            # sleep for a bit
-            time.sleep(self.duty_cycle)
+            # sleep for a bit, but keep listening for commands
+            self.wait(self.duty_cycle)
 
         self.log("Stopping /shipyard_async/")
\ No newline at end of file
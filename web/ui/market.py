@@ -0,0 +1,77 @@
+"""
+Marketplace view model.
+
+A marketplace page shows every good a location imports and exports, and for
+each one, what the visiting ship could do with it. Rather than asking the ship
+about its cargo once per good (and once per question), we load the location's
+goods and the ship's cargo up front, and join them by name in memory:
+
+    >>> market = Marketplace(ship, location)
+    >>> for entry in market.imports:
+    ...     print entry.good.name, entry.has_cargo, entry.can_sell_at_profit
+"""
+from ui.models import Good, Cargo
+
+
+class MarketGood(object):
+    """
+    A good at a marketplace, along with what our ship can do with it.
+    """
+
+    def __init__(self, good, cargo, max_buy):
+        """
+        Work out what our ship can do with the good.
+
+        :param good: models::Good
+        :param cargo: models::Cargo of the same name in the ship's hold, or None
+        :param max_buy: most of this good the ship can buy, if it's an export
+        """
+        self.good = good
+        self.cargo = cargo
+
+        # how much do we have in cargo?
+        self.quantity_in_cargo = 0 if cargo is None else cargo.quantity
+        self.has_cargo = self.quantity_in_cargo > 0
+
+        # would selling our cargo at this price beat what we paid for it?
+        self.can_sell_at_profit = cargo is not None and cargo.average_price() < good.price
+
+        self.max_buy = max_buy
+
+
+class Marketplace(object):
+    """
+    Everything needed to render the marketplace of a location for a ship.
+    """
+
+    def __init__(self, ship, location):
+        """
+        Load our goods and cargo, in one query each, and join them up.
+
+        :param ship:
+        :param location:
+        """
+        self.ship = ship
+        self.location = location
+
+        goods = list(Good.objects.filter(location=location).order_by("id"))
+        cargo = dict((c.name, c) for c in Cargo.objects.filter(ship=ship))
+
+        # we can buy as much as we have room for, and can afford
+        cargo_free = ship.cargo_free()
+        credits = ship.owner.credits if ship.owner is not None else 0
+
+        self.imports = []
+        self.exports = []
+
+        for good in goods:
+            max_buy = cargo_free
+            if good.price > 0:
+                max_buy = max(0, min(cargo_free, int(credits // good.price)))
+
+            entry = MarketGood(good, cargo.get(good.name), max_buy)
+
+            if good.is_import:
+                self.imports.append(entry)
+            if good.is_export:
+                self.exports.append(entry)
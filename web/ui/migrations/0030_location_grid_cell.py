@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 16:17
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0029_auto_20170819_2116'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='grid_x',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='grid_y',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='location',
+            index_together=set([('grid_x', 'grid_y')]),
+        ),
+        # backfill the grid cells of existing locations (100 unit cells, see ui.spatial)
+        migrations.RunSQL(
+            "UPDATE ui_location SET grid_x = floor(x_coordinate / 100.0), grid_y = floor(y_coordinate / 100.0)",
+            migrations.RunSQL.noop
+        ),
+    ]
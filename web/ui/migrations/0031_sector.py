@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 16:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0030_location_grid_cell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sector',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sector_x', models.IntegerField()),
+                ('sector_y', models.IntegerField()),
+                ('seed', models.BigIntegerField()),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('realized', 'Realized')], default='pending', max_length=20)),
+                ('location_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('realized_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='sector',
+            unique_together=set([('sector_x', 'sector_y')]),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 16:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0031_sector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ship',
+            name='cargo_load',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ship',
+            name='upgrade_load',
+            field=models.IntegerField(default=0),
+        ),
+        # backfill the loads of existing ships (see the ship_loads command)
+        migrations.RunSQL(
+            "UPDATE ui_ship SET cargo_load = COALESCE((SELECT SUM(quantity) FROM ui_cargo WHERE ui_cargo.ship_id = ui_ship.id), 0)",
+            migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            "UPDATE ui_ship SET upgrade_load = COALESCE((SELECT SUM(capacity) FROM ui_shipupgrade WHERE ui_shipupgrade.ship_id = ui_ship.id), 0)",
+            migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 16:55
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def move_history_to_logs(apps, schema_editor):
+    """
+    Move the travel and cargo history out of each ship's computer and into
+    the log tables. The old history has no timestamps, so we space entries a
+    second apart to keep their order.
+    """
+    Ship = apps.get_model("ui", "Ship")
+    ShipTravelLog = apps.get_model("ui", "ShipTravelLog")
+    ShipCargoLog = apps.get_model("ui", "ShipCargoLog")
+
+    now = django.utils.timezone.now()
+
+    for ship in Ship.objects.all().iterator():
+        travel = ship.computer.pop("travel", {}).get("history", [])
+        cargo = ship.computer.pop("cargo", {}).get("history", [])
+
+        ShipTravelLog.objects.bulk_create([
+            ShipTravelLog(
+                ship_id=ship.id,
+                location_id=None,
+                location_name=entry["name"],
+                x_coordinate=entry["x_coordinate"],
+                y_coordinate=entry["y_coordinate"],
+                timestamp=now - timedelta(seconds=position)
+            )
+            for position, entry in enumerate(travel)
+        ])
+
+        ShipCargoLog.objects.bulk_create([
+            ShipCargoLog(
+                ship_id=ship.id,
+                mode=entry["mode"],
+                good=entry["good"],
+                quantity=entry["quantity"],
+                cost=entry["cost"],
+                location_id=None,
+                location_name=entry["planet"]["name"],
+                timestamp=now - timedelta(seconds=position)
+            )
+            for position, entry in enumerate(cargo)
+        ])
+
+        ship.save(update_fields=["computer"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0032_ship_loads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShipCargoLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('buy', 'Buy'), ('sell', 'Sell')], max_length=10)),
+                ('good', models.CharField(max_length=255)),
+                ('quantity', models.IntegerField(default=0)),
+                ('cost', models.FloatField(default=0.0)),
+                ('location_name', models.CharField(max_length=255)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ui.Location')),
+                ('ship', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cargo_log', to='ui.Ship')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShipTravelLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location_name', models.CharField(max_length=255)),
+                ('x_coordinate', models.IntegerField(default=0)),
+                ('y_coordinate', models.IntegerField(default=0)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ui.Location')),
+                ('ship', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='travel_log', to='ui.Ship')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='shiptravellog',
+            index_together=set([('ship', 'timestamp')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='shipcargolog',
+            index_together=set([('ship', 'timestamp')]),
+        ),
+        migrations.RunPython(move_history_to_logs, migrations.RunPython.noop),
+    ]
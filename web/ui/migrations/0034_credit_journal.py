@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 18:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0033_ship_logs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditJournal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(default=0)),
+                ('reason', models.CharField(blank=True, default='', max_length=255)),
+                ('settled', models.BooleanField(default=True)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credit_journal', to='ui.Profile')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='creditjournal',
+            index_together=set([('profile', 'timestamp'), ('settled', 'id')]),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Register the sectors of the universe that existed before lazy materialization
+# as realized, so ships looking into them don't generate them a second time.
+# Every sector in the bounding rectangle of our existing locations is
+# registered, including empty ones, as they were generated too, they just came
+# out empty. Sector coordinates follow ui.spatial.sector_for_coordinate.
+#
+# Everything is fixed here rather than read from settings or ui.spatial, so
+# the migration does the same thing on every deploy, whatever they change to
+# later: the sector size, and the galaxy seed the universe was generated with.
+# Empty sectors are only registered within a fixed span of sectors, so a stray
+# far off location can't have us register millions of them. Every sector that
+# holds a location is registered, wherever it is.
+SECTOR_SIZE = 1000
+SIMPLEX_SEED = 7222007
+MIN_SECTOR = -100
+MAX_SECTOR = 100
+
+REGISTER_SECTORS = """
+INSERT INTO ui_sector (sector_x, sector_y, seed, state, location_count, created_at, realized_at)
+SELECT sectors.sector_x, sectors.sector_y, %(seed)d, 'realized', COALESCE(placed.location_count, 0), now(), now()
+FROM (
+    SELECT sector_x, sector_y
+    FROM (
+        SELECT
+            GREATEST(FLOOR(MIN(x_coordinate) / %(size)d.0)::integer, %(min)d) AS min_x,
+            LEAST(FLOOR(MAX(x_coordinate) / %(size)d.0)::integer, %(max)d) AS max_x,
+            GREATEST(FLOOR(MIN(y_coordinate) / %(size)d.0)::integer, %(min)d) AS min_y,
+            LEAST(FLOOR(MAX(y_coordinate) / %(size)d.0)::integer, %(max)d) AS max_y
+        FROM ui_location
+    ) AS bounds
+    CROSS JOIN LATERAL generate_series(bounds.min_x, bounds.max_x) AS sector_x
+    CROSS JOIN LATERAL generate_series(bounds.min_y, bounds.max_y) AS sector_y
+    UNION
+    SELECT
+        FLOOR(x_coordinate / %(size)d.0)::integer,
+        FLOOR(y_coordinate / %(size)d.0)::integer
+    FROM ui_location
+) AS sectors
+LEFT JOIN (
+    SELECT
+        FLOOR(x_coordinate / %(size)d.0)::integer AS placed_x,
+        FLOOR(y_coordinate / %(size)d.0)::integer AS placed_y,
+        COUNT(*) AS location_count
+    FROM ui_location
+    GROUP BY placed_x, placed_y
+) AS placed ON placed.placed_x = sectors.sector_x AND placed.placed_y = sectors.sector_y
+ON CONFLICT (sector_x, sector_y) DO NOTHING
+""" % {"seed": SIMPLEX_SEED, "size": SECTOR_SIZE, "min": MIN_SECTOR, "max": MAX_SECTOR}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0034_credit_journal'),
+    ]
+
+    operations = [
+        migrations.RunSQL(REGISTER_SECTORS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0035_register_existing_sectors'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='location',
+            index_together=set([('grid_x', 'grid_y'), ('location_type', 'id')]),
+        ),
+    ]
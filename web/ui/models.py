@@ -1,6 +1,9 @@
 from __future__ import unicode_literals
 
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models.functions import Greatest
+from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth.signals import user_logged_in
 from django.contrib.auth.models import User
 from django.dispatch import receiver
@@ -8,39 +11,20 @@ from django.contrib.postgres.fields import JSONField
 
 import random
 import string
-import json
-import os
 import math
+import time
+import numpy
+from datetime import datetime
 
+from ui import spatial
+from ui import reachability
+from ui.generation import resource_registry
 
-# LOCATION CONTROLS
-
-## Images
-
-# Planets
-planet_range = range(1,8) + range(10, 21)
-PLANET_IMAGES = ["planet%d.png" % i for i in planet_range]
-
-# Stars
-STAR_IMAGES = [star for star in os.listdir("ui/static/ui/images/stars") if star.endswith("png")]
-
-# Nebula
-NEBULA_IMAGES = [n for n in os.listdir("ui/static/ui/images/nebulas") if n.endswith("png")]
-
-# SHIP Images
-SHIP_IMAGES = [ship for ship in os.listdir("ui/static/ui/images/ships") if ship.endswith("png")]
-
-# Asteroid Images
-ASTEROID_IMAGES = [a for a in os.listdir("ui/static/ui/images/asteroids") if a.endswith("png")]
-
-# Moon Images
-MOON_IMAGES = [m for m in os.listdir("ui/static/ui/images/moons") if m.endswith("png")]
 
-## Names
+# LOCATION CONTROLS
 
-# Star/Planet System name prefixes
-with open("ui/resources/planet_prefix.list", "r") as prefixes:
-    SYSTEM_PREFIXES = [prefix.strip() for prefix in prefixes.readlines()]
+# Images, system name prefixes, and the other game data catalogues are loaded
+# on first use, see ui.generation.resource_registry
 
 # What kind of locations do we have?
 LOCATION_CHOICES = (
@@ -52,20 +36,6 @@ LOCATION_CHOICES = (
 )
 
 
-## Procedural Generation Settings
-
-# Shipyards
-SHIPYARDS = json.load(open("ui/resources/shipyards.json", "r"))
-
-# Ship types
-SHIP_TEMPLATES = json.load(open("ui/resources/shiptypes.json", "r"))
-
-# LOAD THE GOODS!
-GOODS = json.load(open("ui/resources/goods.json", "r"))
-
-# What are our upgrade qualities?
-UPGRADES = json.load(open("ui/resources/upgrades.json", "r"))
-
 ## Runtime Configuration
 
 # Fuel base cost
@@ -94,17 +64,192 @@ class Profile(models.Model):
 
         return v
 
-    def add_credits(self, creds):
-        self.credits += creds
-        self.save()
+    def add_credits(self, creds, reason=""):
+        """
+        Add credits to our balance. See `CreditJournalManager::apply`.
 
-    def subtract_credits(self, creds, go_negative=False):
-        self.credits -= creds
+        :param creds:
+        :param reason: what the credits are for, for the journal
+        :return:
+        """
+        CreditJournal.objects.apply(self, creds, reason=reason)
 
-        if self.credits < 0 and not go_negative:
-            self.credits = 0
+    def subtract_credits(self, creds, go_negative=False, reason=""):
+        """
+        Take credits from our balance, which drops to 0 rather than going
+        negative, unless we say otherwise.
 
-        self.save()
+        :param creds:
+        :param go_negative:
+        :param reason: what the credits are for, for the journal
+        :return:
+        """
+        CreditJournal.objects.apply(self, -creds, reason=reason, floor=None if go_negative else 0)
+
+    def spend_credits(self, creds, reason=""):
+        """
+        Take credits from our balance only if we can afford them, checked in
+        the same update that takes them.
+
+        :param creds:
+        :param reason: what the credits are for, for the journal
+        :return: True if we could afford it
+        """
+        return CreditJournal.objects.debit(self, creds, reason=reason)
+
+    def post_credits(self, creds, reason=""):
+        """
+        Queue a change to our balance, to be settled in a batch later. See
+        `CreditJournalManager::post`.
+
+        :param creds: positive or negative
+        :param reason: what the credits are for, for the journal
+        :return:
+        """
+        return CreditJournal.objects.post(self, creds, reason=reason)
+
+    def pending_credits(self):
+        """
+        How many credits are posted to us, but not yet settled?
+
+        :return:
+        """
+        return self.credit_journal.filter(settled=False).aggregate(total=models.Sum("amount"))["total"] or 0
+
+
+class CreditJournalManager(models.Manager):
+    """
+    Change profile credit balances, keeping a journal of every change.
+
+    Balances are only ever changed with a single UPDATE using an F()
+    expression, so concurrent changes to the same profile can't overwrite
+    each other, and nothing else on the profile row is rewritten. The UPDATE
+    and its journal entry are written in one transaction, so a balance never
+    changes without its entry.
+
+    Hot accounts can skip the profile row entirely, by posting changes to the
+    journal and settling them in batches, with one UPDATE per profile:
+
+        >>> profile.post_credits(1200, reason="sell")
+        >>> CreditJournal.objects.settle()
+        (1, 1)
+    """
+
+    def apply(self, profile, amount, reason="", floor=None):
+        """
+        Change a balance right away.
+
+        :param profile: Profile
+        :param amount: positive or negative number of credits
+        :param reason: what the credits are for
+        :param floor: lowest the balance can go, or None for no limit
+        :return: the journal entry, which records what was actually applied after the floor
+        """
+        amount = int(amount)
+
+        if floor is None:
+            with transaction.atomic():
+                Profile.objects.filter(pk=profile.pk).update(credits=models.F("credits") + amount)
+                profile.refresh_from_db(fields=["credits"])
+
+                return self.create(profile=profile, amount=amount, reason=reason)
+
+        # the floor can clip the change, so we need the balance either side of it
+        with transaction.atomic():
+            before = Profile.objects.select_for_update().filter(pk=profile.pk).values_list("credits", flat=True).get()
+
+            Profile.objects.filter(pk=profile.pk).update(credits=Greatest(models.F("credits") + amount, floor))
+            profile.refresh_from_db(fields=["credits"])
+
+            return self.create(profile=profile, amount=profile.credits - before, reason=reason)
+
+    def debit(self, profile, amount, reason=""):
+        """
+        Take credits from a balance, but only if it can cover them.
+
+        :param profile: Profile
+        :param amount: credits to take
+        :param reason: what the credits are for
+        :return: True if the balance covered the amount
+        """
+        amount = int(amount)
+
+        with transaction.atomic():
+            updated = Profile.objects.filter(pk=profile.pk, credits__gte=amount).update(credits=models.F("credits") - amount)
+            profile.refresh_from_db(fields=["credits"])
+
+            if updated == 0:
+                return False
+
+            self.create(profile=profile, amount=-amount, reason=reason)
+
+        return True
+
+    def post(self, profile, amount, reason=""):
+        """
+        Journal a change to a balance, without touching the balance. The
+        change is applied by `settle`, so there's no affordability check;
+        post credits, or debits that have already been checked.
+
+        :param profile: Profile
+        :param amount: positive or negative number of credits
+        :param reason: what the credits are for
+        :return: the journal entry
+        """
+        return self.create(profile=profile, amount=int(amount), reason=reason, settled=False)
+
+    def settle(self, limit=5000):
+        """
+        Apply a batch of posted changes to their balances, with one UPDATE
+        per profile. Profiles are updated in id order, so concurrent
+        settlements, and other transactions doing the same, can't deadlock,
+        and entries already being settled elsewhere are skipped.
+
+        :param limit: most entries to settle
+        :return: tuple of (entries settled, profiles updated)
+        """
+        with transaction.atomic():
+            pending = list(
+                self.select_for_update(skip_locked=True).filter(settled=False).order_by("id").values_list("id", "profile_id", "amount")[:limit]
+            )
+
+            if len(pending) == 0:
+                return 0, 0
+
+            totals = {}
+            for entry_id, profile_id, amount in pending:
+                totals[profile_id] = totals.get(profile_id, 0) + amount
+
+            for profile_id in sorted(totals.keys()):
+                Profile.objects.filter(pk=profile_id).update(credits=models.F("credits") + totals[profile_id])
+
+            self.filter(id__in=[entry[0] for entry in pending]).update(settled=True)
+
+        return len(pending), len(totals)
+
+
+class CreditJournal(models.Model):
+    """
+    A single change to a profile's credits.
+    """
+    objects = CreditJournalManager()
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="credit_journal")
+
+    # positive for credits in, negative for credits out
+    amount = models.IntegerField(default=0, null=False)
+    reason = models.CharField(max_length=255, null=False, blank=True, default="")
+
+    # has this change been applied to the profile's balance?
+    settled = models.BooleanField(default=True)
+
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        index_together = [
+            ["profile", "timestamp"],
+            ["settled", "id"]
+        ]
 
 
 @receiver(user_logged_in)
@@ -137,22 +282,75 @@ class LocationManager(models.Manager):
     Query, build, and otherwise manipulate the different Location types.
     """
 
+    # how many random ids does pick_random probe before picking by offset?
+    pick_probes = 8
+
     def delete_unoccupied(self):
         """
         Delete any locations that don't have a player in orbit.
 
         :return:
         """
-        self.exclude(orbiters__owner__isnull=False).exclude(registrants__owner__isnull=False).delete()
+        unoccupied = self.exclude(orbiters__owner__isnull=False).exclude(registrants__owner__isnull=False)
+
+        # anything that could reach these locations needs to forget them
+        points = list(unoccupied.values_list("x_coordinate", "y_coordinate").distinct())
+
+        unoccupied.delete()
+        reachability.invalidate(points)
 
-    def pick_random(self):
+    def pick_random(self, root_only=False, **filters):
         """
-        Pick a random location that we already have available.
+        Pick a random location that we already have available, optionally
+        filtered, like:
 
-        :return:
+            Location.objects.pick_random(location_type="planet")
+            Location.objects.pick_random(root_only=True)
+
+        Rather than pulling every location, we probe random ids between the
+        smallest and largest matching ids, and keep the first probe that
+        hits a matching location. Every matching location is as likely as
+        any other, however big the gaps left by `delete_unoccupied` (or by
+        the locations our filters skip), and each probe is a single primary
+        key lookup. If our ids are too sparse for probing to pay off, we
+        fall back to picking an offset into the matching locations.
+
+        :param root_only: only pick locations without a parent
+        :param filters: any other Location field filters
+        :return: Location, or None if nothing matches
+        """
+        locations = self.filter(**filters)
+
+        if root_only:
+            locations = locations.filter(parent__isnull=True)
+
+        bounds = locations.aggregate(low=models.Min("id"), high=models.Max("id"))
+
+        if bounds["low"] is None:
+            return None
+
+        for attempt in range(self.pick_probes):
+            location = locations.filter(id=random.randint(bounds["low"], bounds["high"])).first()
+            if location is not None:
+                return location
+
+        count = locations.count()
+        if count == 0:
+            return None
+
+        return locations.order_by("id")[random.randrange(count)]
+
+    def within_range(self, x, y, radius):
+        """
+        Find the locations within the radius of a point, using our spatial
+        grid. See `ui.spatial.within_range` for the result structure.
+
+        :param x:
+        :param y:
+        :param radius:
+        :return: list of dicts, sorted by distance
         """
-        id = random.sample(self.only("id").all(), 1)
-        return id[0]
+        return spatial.within_range(self.all(), x, y, radius)
 
     def create_random(self, has_shipyard=True, has_marketplace=True):
         """
@@ -181,7 +379,7 @@ class LocationManager(models.Manager):
             location_name = self.random_planet_name()
 
             # we also need to pick out an image
-            location_image = random.sample(PLANET_IMAGES,1)[0]
+            location_image = random.sample(resource_registry.images("planet"), 1)[0]
 
         elif location_type == "moon":
 
@@ -193,7 +391,7 @@ class LocationManager(models.Manager):
             location_name = "S/%d %s %d" % (m_year, m_plan, m_inc)
 
             # grab our image
-            location_image = random.sample(MOON_IMAGES, 1)[0]
+            location_image = random.sample(resource_registry.images("moon"), 1)[0]
 
         elif location_type == "asteroid":
 
@@ -206,7 +404,7 @@ class LocationManager(models.Manager):
             location_name = "%d %s %s-%d" % (ast_year, ast_la, ast_lb, ast_cy)
 
             # we also need to pick out an image
-            location_image = random.sample(ASTEROID_IMAGES, 1)[0]
+            location_image = random.sample(resource_registry.images("asteroid"), 1)[0]
 
         elif location_type == "nebula":
 
@@ -214,7 +412,7 @@ class LocationManager(models.Manager):
             location_name = "NGC %d" % (random.randrange(10,10000))
 
             # we also need to pick out an image
-            location_image = random.sample(NEBULA_IMAGES, 1)[0]
+            location_image = random.sample(resource_registry.images("nebula"), 1)[0]
 
         elif location_type == "star":
 
@@ -222,7 +420,7 @@ class LocationManager(models.Manager):
             location_name = self.random_star_name()
 
             # pick a star, any star
-            location_image = random.sample(STAR_IMAGES, 1)[0]
+            location_image = random.sample(resource_registry.images("star"), 1)[0]
         else:
             print "! Generator Error [models::LocationManager::create_random] - No idea how to create a random [%s]" % (location_type,)
 
@@ -243,7 +441,7 @@ class LocationManager(models.Manager):
 
             # let's add some imports
             num_imports = random.randint(3, 6)
-            ims = random.sample(GOODS, num_imports)
+            ims = random.sample(resource_registry.goods(), num_imports)
             for im in ims:
                 candidate = random.random()
                 if candidate >= im["liklihood"]["import"]:
@@ -257,7 +455,7 @@ class LocationManager(models.Manager):
 
             # let's add some exports
             num_imports = random.randint(3, 6)
-            ims = random.sample(GOODS, num_imports)
+            ims = random.sample(resource_registry.goods(), num_imports)
             for im in ims:
                 candidate = random.random()
                 if candidate >= im["liklihood"]["export"]:
@@ -283,7 +481,7 @@ class LocationManager(models.Manager):
         """
 
         # get a good prefix
-        planet_prefix = random.sample(SYSTEM_PREFIXES, 1)[0]
+        planet_prefix = random.sample(resource_registry.system_prefixes(), 1)[0]
 
         # pick a designator
         planet_number = random.randint(1000, 10000)
@@ -301,7 +499,7 @@ class LocationManager(models.Manager):
         :return:
         """
         # get a good prefix
-        star_prefix = random.sample(SYSTEM_PREFIXES, 1)[0]
+        star_prefix = random.sample(resource_registry.system_prefixes(), 1)[0]
 
         # pick a designator
         star_number = random.randint(1000, 10000)
@@ -349,6 +547,31 @@ class Location(models.Model):
     # location hash let's us grab a whole set of related locations in a single query
     location_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
 
+    # spatial index grid cell, derived from our coordinates. See ui.spatial
+    grid_x = models.IntegerField(default=0, null=False, blank=False)
+    grid_y = models.IntegerField(default=0, null=False, blank=False)
+
+    class Meta:
+        index_together = [
+            ["grid_x", "grid_y"],
+            ["location_type", "id"]
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Keep our spatial grid cell in step with our coordinates, and let
+        cached reachability know about new locations.
+
+        :return:
+        """
+        adding = self._state.adding
+
+        spatial.assign_grid_cell(self)
+        super(Location, self).save(*args, **kwargs)
+
+        if adding:
+            reachability.invalidate([(self.x_coordinate, self.y_coordinate)])
+
     def imports(self):
         return self.goods.filter(is_import=True)
 
@@ -372,6 +595,108 @@ class Location(models.Model):
         return "ui/images/%ss/%s" % (self.location_type, self.image_name)
 
 
+###
+# Sectors
+###
+SECTOR_STATE_CHOICES = (
+    ("pending", "Pending"),
+    ("realized", "Realized")
+)
+
+
+class SectorManager(models.Manager):
+    """
+    Track which sectors of space have been generated.
+    """
+
+    def claim(self, sector_x, sector_y, seed):
+        """
+        Register a sector for generation. Only one caller can claim a sector,
+        so this returns the new Sector if we claimed it, or None if the
+        sector has already been claimed.
+
+        :param sector_x:
+        :param sector_y:
+        :param seed: simplex seed the sector will be generated with
+        :return:
+        """
+        sector, created = self.get_or_create(
+            sector_x=sector_x,
+            sector_y=sector_y,
+            defaults={
+                "seed": seed,
+                "state": "pending"
+            }
+        )
+
+        if created:
+            return sector
+        return None
+
+    def unregistered(self, sectors):
+        """
+        Which of the given (sector_x, sector_y) coordinates have never been claimed?
+
+        :param sectors: list of (sector_x, sector_y)
+        :return: list of (sector_x, sector_y), in the same order
+        """
+        if len(sectors) == 0:
+            return []
+
+        xs = [sector[0] for sector in sectors]
+        ys = [sector[1] for sector in sectors]
+
+        known = set(self.filter(
+            sector_x__gte=min(xs),
+            sector_x__lte=max(xs),
+            sector_y__gte=min(ys),
+            sector_y__lte=max(ys)
+        ).values_list("sector_x", "sector_y"))
+
+        return [sector for sector in sectors if sector not in known]
+
+
+class Sector(models.Model):
+    """
+    A sector of space that has been (or is being) generated and realized. See
+    ui.generation.materializer
+    """
+    objects = SectorManager()
+
+    # sector coordinates, see ui.spatial.sector_for_coordinate
+    sector_x = models.IntegerField(null=False, blank=False)
+    sector_y = models.IntegerField(null=False, blank=False)
+
+    # the simplex seed the sector was generated with
+    seed = models.BigIntegerField(null=False, blank=False)
+
+    # pending sectors are still being generated and realized
+    state = models.CharField(max_length=20, null=False, blank=False, choices=SECTOR_STATE_CHOICES, default="pending")
+
+    # how many locations did we realize?
+    location_count = models.IntegerField(default=0, null=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    realized_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = [
+            ["sector_x", "sector_y"]
+        ]
+
+    def mark_realized(self, location_count):
+        """
+        All of the locations in this sector now exist.
+
+        :param location_count: how many locations we realized
+        :return:
+        """
+        self.state = "realized"
+        self.location_count = location_count
+        self.realized_at = timezone.now()
+        self.save()
+
+
 ###
 # GOODS
 ###
@@ -429,41 +754,6 @@ class Cargo(models.Model):
         else:
             return self.total_value / self.quantity
 
-    def buy(self, good, quantity):
-        """
-        We're buying more of something! Hooray! Let's do some house keeping.
-
-        :param good:
-        :param quantity:
-        :return:
-        """
-        self.quantity += quantity
-
-        # how much have we paid, in total, for all of this?
-        self.total_value += (quantity * good.price)
-
-        self.save()
-
-    def sell(self, good, quantity):
-        """
-        We're selling something off. Update the quantity and average total value.
-
-        :param good:
-        :param quantity:
-        :return:
-        """
-
-        # keep track of our average
-        avg_price = self.total_value / self.quantity
-
-        # update cargo
-        self.quantity -= quantity
-
-        # update total value with avg price
-        self.total_value = self.quantity * avg_price
-
-        self.save()
-
 
 ###
 # SHIPS
@@ -477,7 +767,7 @@ class ShipManager(models.Manager):
     Work with ships.
     """
 
-    def __choose_ship_stats(self):
+    def __choose_ship_stats(self, template=None):
         """
         Use our stats in the shiptypes.json to build the
         basic features of a ship. We return a dict that
@@ -490,7 +780,13 @@ class ShipManager(models.Manager):
             3. If C is <= random ship availability, continue with ship
             4. goto 1
         
-        when we have a ship template from 3, we then random choose
+        That loop picks ship types weighted by availability, so we draw from
+        an alias table with the same weights instead, see
+        `resource_registry.ship_template_table`. When building many ships at
+        once, draw their templates together with `AliasTable::draw_many`, and
+        pass them in.
+        
+        when we have a ship template, we then random choose
         values from the:
             
             - range
@@ -501,26 +797,19 @@ class ShipManager(models.Manager):
         calculate the size of each value, as well as the overall
         cost of the ship.
         
+        :param template: ship template, or None to pick one
         :return: 
         """
 
-        # find a good ship template
-        have_template = False
-        template = None
-
-        while not have_template:
-
-            template_candidate = random.choice(SHIP_TEMPLATES["ships"])
-            mc_candidate = random.random()
-
-            if mc_candidate <= template_candidate["availability"]:
-                have_template = True
-                template = template_candidate
+        # find a good ship template, weighted by availability
+        if template is None:
+            template = resource_registry.pick_ship_template()
+        sizes = resource_registry.ship_templates()["sizes"]
 
         # do some basic selections from our possible settings
-        range_data = SHIP_TEMPLATES["sizes"][random.choice(template["range"])]
-        cargo_data = SHIP_TEMPLATES["sizes"][random.choice(template["cargo"])]
-        upgrade_data = SHIP_TEMPLATES["sizes"][random.choice(template["upgrade"])]
+        range_data = sizes[random.choice(template["range"])]
+        cargo_data = sizes[random.choice(template["cargo"])]
+        upgrade_data = sizes[random.choice(template["upgrade"])]
 
         # do some cost coversions and build our template
         price_factor = range_data["cost"] + cargo_data["cost"] + upgrade_data["cost"]
@@ -534,16 +823,101 @@ class ShipManager(models.Manager):
             "cost": ( 2 ** price_factor) * 250
         }
 
+    def locations_in_range(self, ships=None, block_size=1024):
+        """
+        Find the locations in range of many ships at once, in a single pass
+        over the locations. This is the batch version of
+        `Ship::locations_in_range`, and uses the same current range (max
+        range scaled by fuel level) for each ship. We only load the locations
+        inside the bounding box of every ship's range, using the spatial
+        grid. Results have the same shape as `Ship::locations_in_range`:
+
+            {
+                <ship id>: [
+                    {
+                        "id": <location id>,
+                        "name": <string>,
+                        "location_type": <string>,
+                        "distance": <float>,
+                        "fuel_burned_percent": <float>
+                    },
+                    ...
+                ]
+            }
+
+        with each ship's locations sorted by distance.
+
+        :param ships: QuerySet of Ship objects, defaults to every ship
+        :param block_size: how many ships, and locations, are compared at once
+        :return: dict of ship id -> list of dicts
+        """
+        if ships is None:
+            ships = self.all()
+
+        rows = list(ships.values_list("id", "location__x_coordinate", "location__y_coordinate", "max_range", "fuel_level"))
+
+        if len(rows) == 0:
+            return {}
+
+        ship_ids = [row[0] for row in rows]
+        points = numpy.array([(row[1], row[2]) for row in rows], dtype=numpy.float64)
+        radii = numpy.array([row[3] * (row[4] / 100.0) for row in rows], dtype=numpy.float64)
+
+        # ships that are reaaaaaally low on fuel can't go anywhere, so don't widen our search
+        moving = radii >= 1
+
+        if moving.any():
+            min_gx, min_gy = spatial.grid_cell((points[moving, 0] - radii[moving]).min(), (points[moving, 1] - radii[moving]).min())
+            max_gx, max_gy = spatial.grid_cell((points[moving, 0] + radii[moving]).max(), (points[moving, 1] + radii[moving]).max())
+
+            rows = list(Location.objects.filter(
+                grid_x__gte=min_gx,
+                grid_x__lte=max_gx,
+                grid_y__gte=min_gy,
+                grid_y__lte=max_gy
+            ).values_list("id", "x_coordinate", "y_coordinate", "name", "location_type"))
+        else:
+            rows = []
+
+        locations = numpy.array([row[:3] for row in rows], dtype=numpy.int64).reshape(-1, 3)
+        details = dict((row[0], row[3:]) for row in rows)
+
+        in_range = spatial.within_range_batch(points, radii, locations[:, 0], locations[:, 1], locations[:, 2], block_size=block_size)
+
+        results = {}
+        for ship_id, radius, found in zip(ship_ids, radii, in_range):
+
+            # just like a single ship, we can't go anywhere if we're reaaaaaally low on fuel
+            if radius < 1:
+                results[ship_id] = []
+                continue
+
+            results[ship_id] = [
+                {
+                    "id": location_id,
+                    "name": details[location_id][0],
+                    "location_type": details[location_id][1],
+                    "distance": distance,
+                    "fuel_burned_percent": distance / radius * 100.0
+                }
+                for location_id, distance in found
+            ]
+
+        return results
+
     def seed_ship_for_profile(self, profile):
         """
         Generate a ship for the given profile (could be user or NPC).
 
         :param profile:
-        :return:
+        :return: the new Ship, or None if there's nowhere to put it
         """
         # what location is this?
         location = Location.objects.pick_random()
 
+        if location is None:
+            return None
+
         # get our template
         ship_template = self.__choose_ship_stats()
 
@@ -557,7 +931,7 @@ class ShipManager(models.Manager):
         ship_fuel_level = 100.0
         ship_cargo_capacity = ship_template["cargo_capacity"]
         ship_upgrade_capacity = ship_template["upgrade_capacity"]
-        ship_image = random.sample(SHIP_IMAGES, 1)[0]
+        ship_image = random.sample(resource_registry.images("ship"), 1)[0]
         ship_value = ship_template["cost"]
 
         ship = self.create(
@@ -583,42 +957,51 @@ class ShipManager(models.Manager):
         :param shipyard: 
         :return: 
         """
+        ship = self.build_ship_at_shipyard(shipyard.id, shipyard.location_id)
+        ship.save()
 
-        # what location is this?
-        location = shipyard.location
+        return ship
+
+    def build_ship_at_shipyard(self, shipyard_id, location_id, template=None):
+        """
+        Build, but don't save, a new ship for a shipyard. We work with ids, so
+        ships for many shipyards can be built without loading the yards, and
+        then inserted together with bulk_create.
+
+        :param shipyard_id:
+        :param location_id: location of the shipyard
+        :param template: ship template to build from, or None to pick one
+        :return:
+        """
 
         # get our template
-        ship_template = self.__choose_ship_stats()
+        ship_template = self.__choose_ship_stats(template=template)
 
         # set up all of the various variables we'll use in
         # model construction
         ship_name = ship_template["name"]
         ship_model = ship_template["name"]
-        ship_location = location
-        ship_home_location = location
         ship_range = ship_template["max_range"]
         ship_fuel_level = 100.0
         ship_cargo_capacity = ship_template["cargo_capacity"]
         ship_upgrade_capacity = ship_template["upgrade_capacity"]
-        ship_image = random.sample(SHIP_IMAGES, 1)[0]
+        ship_image = random.sample(resource_registry.images("ship"), 1)[0]
         ship_value = ship_template["cost"]
 
-        ship = self.create(
+        return self.model(
             name = ship_name,
             model = ship_model,
-            location = ship_location,
-            home_location = ship_home_location,
+            location_id = location_id,
+            home_location_id = location_id,
             max_range = ship_range,
             fuel_level = ship_fuel_level,
             cargo_capacity = ship_cargo_capacity,
             upgrade_capacity = ship_upgrade_capacity,
             image_name = ship_image,
             value = ship_value,
-            shipyard = shipyard
+            shipyard_id = shipyard_id
         )
 
-        return ship
-
 
 class ShipUpgradeManager(models.Manager):
     """
@@ -632,7 +1015,7 @@ class ShipUpgradeManager(models.Manager):
         :return: 
         """
         blurb = "<ul>"
-        for upgrade in UPGRADES["grades"]:
+        for upgrade in resource_registry.upgrades()["grades"]:
             blurb += "<li> <strong>%s</strong> - <em>Also known as %s grade.</em> %s</li>" % (upgrade["name"], upgrade["id"], upgrade["description"])
         blurb += "</ul>"
         return blurb
@@ -651,23 +1034,34 @@ class ShipUpgradeManager(models.Manager):
         
         :return: 
         """
+        upgrades = self.build_cargo_upgrades()
+        self.bulk_create(upgrades)
+
+        return upgrades
+
+    def build_cargo_upgrades(self, shipyard_id=None):
+        """
+        Build, but don't save, a set of cargo upgrades, just like
+        `create_cargo_upgrades`, so upgrades for many shipyards can be
+        inserted together with bulk_create.
+
+        :param shipyard_id: shipyard stocking the upgrades, if any
+        :return: list of ShipUpgrade
+        """
         upgrades = []
 
         # let's iterate over our components
-        for component in UPGRADES["components"]["cargo"]:
+        for component in resource_registry.upgrades()["components"]["cargo"]:
 
             # let's iterate over our grades
-            for grade in UPGRADES["grades"]:
+            for grade in resource_registry.upgrades()["grades"]:
 
                 # is this available?
                 candidate = random.random()
 
                 if candidate <= grade["availability"]:
-                    print json.dumps(component)
-                    print json.dumps(grade)
                     # we carry this good!
-                    upgrade = self._create_cargo_upgrade(component, grade)
-                    upgrades.append(upgrade)
+                    upgrades.append(self._build_cargo_upgrade(component, grade, shipyard_id=shipyard_id))
 
         return upgrades
 
@@ -679,10 +1073,24 @@ class ShipUpgradeManager(models.Manager):
         :param grade: 
         :return: 
         """
-        upgrade = self.create(
+        upgrade = self._build_cargo_upgrade(component, grade)
+        upgrade.save()
+        return upgrade
+
+    def _build_cargo_upgrade(self, component, grade, shipyard_id=None):
+        """
+        Combine the component and grade to build, but not save, a new upgrade.
+
+        :param component:
+        :param grade:
+        :param shipyard_id: shipyard stocking the upgrade, if any
+        :return:
+        """
+        return self.model(
             size=component["base_size"] * grade["size_modifier"],
             target="cargo",
             ship=None,
+            shipyard_id=shipyard_id,
             cost=component["base_cost"] * grade["cost_modifier"],
             name=component["name"] + ", " + grade["name"] + " grade",
             quality=grade["name"],
@@ -694,30 +1102,90 @@ class ShipUpgradeManager(models.Manager):
     def create_cargo_upgrade(self):
         """
         Create a single cargo upgrade to restock or expand the availability at a shipyard. We
-        randomly select component type and upgrade until we get a candidate match.
+        randomly select a component type, and draw a grade weighted by availability.
          
         :return: 
         """
 
-        while True:
-            component = random.choice(UPGRADES["components"]["cargo"])
-            grade = random.choice(UPGRADES["grades"])
-            candidate = random.random()
+        upgrade = self.build_cargo_upgrade()
+        upgrade.save()
+        return upgrade
+
+    def build_cargo_upgrade(self, shipyard_id=None):
+        """
+        Build, but don't save, a single cargo upgrade, just like
+        `create_cargo_upgrade`.
+
+        :param shipyard_id: shipyard stocking the upgrade, if any
+        :return:
+        """
+        component = random.choice(resource_registry.upgrades()["components"]["cargo"])
+        grade = resource_registry.pick_upgrade_grade()
 
-            if candidate <= grade["availability"]:
-                # we got one!
-                return self._create_cargo_upgrade(component, grade)
+        return self._build_cargo_upgrade(component, grade, shipyard_id=shipyard_id)
 
 
 class ShipYardManager(models.Manager):
 
-    def too_few_ships_available(self):
+    def too_few_ships_available(self, up_to=3):
         """
         Find ship yards with an insufficient number of ships available.
 
+        :param up_to: how many ships should a yard have?
         :return: QuerySet of ShipYard objects
         """
-        return self.annotate(ship_count=models.Count('ships')).filter(ship_count__lt=3)
+        return self.annotate(ship_count=models.Count('ships')).filter(ship_count__lt=up_to)
+
+    def in_shard(self, shard_index, shard_count):
+        """
+        Partition ship yards by id, for splitting work between workers.
+
+        :param shard_index:
+        :param shard_count:
+        :return: QuerySet of ShipYard objects
+        """
+        return self.annotate(shard=models.ExpressionWrapper(models.F("id") % shard_count, output_field=models.IntegerField())).filter(shard=shard_index)
+
+    def restock_ships(self, up_to=3, chunk_size=500, time_budget=None, shard=None):
+        """
+        Restock every ship yard that has too few ships. All of the deficient
+        yards are found in one query, and their missing ships are inserted
+        with one bulk insert per chunk of yards. If we have a time budget, we
+        stop between chunks once we've used it up, and leave the rest for
+        the next pass.
+
+        :param up_to: how many ships should a yard have?
+        :param chunk_size: how many yards do we restock at once?
+        :param time_budget: seconds we can spend restocking, or None to restock everything
+        :param shard: tuple of (shard index, shard count) to only restock a partition of the yards
+        :return: tuple of (yards restocked, ships created)
+        """
+        start = time.time()
+
+        yards = self.all() if shard is None else self.in_shard(*shard)
+        deficient = list(yards.annotate(ship_count=models.Count('ships')).filter(ship_count__lt=up_to).order_by("id").values_list("id", "location_id", "ship_count"))
+
+        yard_count = 0
+        ship_count = 0
+
+        for offset in range(0, len(deficient), chunk_size):
+
+            if time_budget is not None and time.time() - start > time_budget:
+                break
+
+            chunk = deficient[offset:offset + chunk_size]
+
+            ships = []
+            for yard_id, location_id, current_count in chunk:
+                for nc in range(up_to - current_count):
+                    ships.append(Ship.objects.build_ship_at_shipyard(yard_id, location_id))
+
+            Ship.objects.bulk_create(ships)
+
+            yard_count += len(chunk)
+            ship_count += len(ships)
+
+        return yard_count, ship_count
 
     def create_random_on_location(self, location):
         """
@@ -729,19 +1197,46 @@ class ShipYardManager(models.Manager):
         
         :return: 
         """
-        yard = self.create(
-            name=self._create_name(),
-            location=location
-        )
-        yard.save()
+        return self.seed_locations([location])[0]
 
-        # seed upgrades
-        yard.seed_upgrades()
+    def seed_locations(self, locations, ships=3, batch_size=1000):
+        """
+        Generate a new ship yard, stocked with upgrades and ships, on each of
+        many locations. Everything is built in memory first, and then
+        inserted with one bulk insert for each of the yards, the upgrades,
+        and the ships.
 
-        # seed ships
-        yard.seed_ships(3)
+        :param locations: list of Location objects, or location ids
+        :param ships: how many ships to stock at each yard
+        :param batch_size: most rows in a single insert
+        :return: list of ShipYard
+        """
+        yards = [
+            self.model(name=self._create_name(), location_id=getattr(location, "id", location))
+            for location in locations
+        ]
+
+        if len(yards) == 0:
+            return yards
+
+        with transaction.atomic():
+            # on Postgres, bulk_create gives us back our yard ids
+            self.bulk_create(yards, batch_size=batch_size)
+
+            upgrades = []
+            for yard in yards:
+                upgrades += ShipUpgrade.objects.build_cargo_upgrades(shipyard_id=yard.id)
+            ShipUpgrade.objects.bulk_create(upgrades, batch_size=batch_size)
 
-        return yard
+            # draw the templates for every ship we stock in one go
+            templates = iter(resource_registry.ship_template_table().draw_many(len(yards) * ships))
+            stock = [
+                Ship.objects.build_ship_at_shipyard(yard.id, yard.location_id, template=next(templates))
+                for yard in yards for nc in range(ships)
+            ]
+            Ship.objects.bulk_create(stock, batch_size=batch_size)
+
+        return yards
 
     def _create_name(self):
         """
@@ -750,7 +1245,8 @@ class ShipYardManager(models.Manager):
         
          - Walk through the list of prefix/suffix in order, and generate a candidate
            random normal. If that candidate < the prefix/suffix _probability_, then
-           we use that prefix/suffix.
+           we use that prefix/suffix. That walk is precomputed into an alias table,
+           so we make a single draw, see `resource_registry.shipyard_name_table`.
            
          - Randomly choose values from the SHIPYARDS::names::names
          
@@ -759,33 +1255,14 @@ class ShipYardManager(models.Manager):
 
         name_count = random.choice([1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 3])
 
+        names = resource_registry.shipyards()["names"]
 
-        # prefix
-        name_prefix = ""
-
-        for prefix in SHIPYARDS["names"]["prefixes"]:
-
-            # should we use this value?
-            candidate = random.random()
-
-            if candidate < prefix["probability"]:
-                name_prefix = prefix["prefix"]
-                break
-
-        # suffix
-        name_suffix = ""
-
-        for suffix in SHIPYARDS["names"]["suffixes"]:
-
-            # should we use this value?
-            candidate = random.random()
-
-            if candidate < suffix["probability"]:
-                name_suffix = suffix["suffix"]
-                break
+        # prefix and suffix
+        name_prefix = resource_registry.shipyard_name_table("prefix").draw()
+        name_suffix = resource_registry.shipyard_name_table("suffix").draw()
 
         # choice of name components
-        base_name = random.sample(SHIPYARDS["names"]["names"], name_count)
+        base_name = random.sample(names["names"], name_count)
 
         return " ".join([name_prefix] + base_name + [name_suffix])
 
@@ -833,15 +1310,9 @@ class ShipYard(models.Model):
         :return: 
         """
 
-        # get our upgrades
-        upgrades = ShipUpgrade.objects.create_cargo_upgrades()
-
-        # add them to our shipyard
-        for upgrade in upgrades:
-            upgrade.shipyard = self
-            upgrade.save()
-
-        print "Seeded shipyard [%s] with %d upgrades" % (self.name, len(upgrades))
+        # get our upgrades, already stocked at our shipyard
+        upgrades = ShipUpgrade.objects.build_cargo_upgrades(shipyard_id=self.id)
+        ShipUpgrade.objects.bulk_create(upgrades)
 
     def restock_upgrades(self, quantity=None):
         """
@@ -854,10 +1325,7 @@ class ShipYard(models.Model):
         if quantity is None:
             quantity = random.choice([1,2,3,4,5,6])
 
-        for x in range(quantity):
-            upgrade = ShipUpgrade.objects.create_cargo_upgrade()
-            upgrade.shipyard = self
-            upgrade.save()
+        ShipUpgrade.objects.bulk_create([ShipUpgrade.objects.build_cargo_upgrade(shipyard_id=self.id) for x in range(quantity)])
 
     def seed_ships(self, quantity=1):
         """
@@ -866,8 +1334,7 @@ class ShipYard(models.Model):
         :return: 
         """
 
-        for x in range(quantity):
-            Ship.objects.seed_ship_at_shipyard(self)
+        Ship.objects.bulk_create([Ship.objects.build_ship_at_shipyard(self.id, self.location_id) for x in range(quantity)])
 
 
     def restock_ships(self, up_to=3):
@@ -878,8 +1345,8 @@ class ShipYard(models.Model):
         """
         current_count = self.ships.count()
 
-        for nc in range(up_to-current_count):
-            Ship.objects.seed_ship_at_shipyard(self)
+        if current_count < up_to:
+            self.seed_ships(up_to - current_count)
 
         return up_to - current_count
 
@@ -936,60 +1403,18 @@ class ShipUpgrade(models.Model):
     # which shipyard is this upgrade stocked at?
     shipyard = models.ForeignKey("ShipYard", blank=True, null=True, on_delete=models.CASCADE, related_name="upgrades")
 
-    def buy(self):
-        """
-        We've been purchased!
-        
-        We need to remove our self from the shipyard. We'll also tell the yard to restock
-        an item(s).
-        
-        :return: 
-        """
-        yard = self.shipyard
-
-        # let our shipyard know
-        yard.restock_upgrades()
-
-        # we're no longer for purchase!
-        self.shipyard = None
-        self.save()
-
 
 
 def default_ship_computer():
     """
-    Build the default ships computer structure.
+    Build the default ships computer structure. The computer only holds
+    configuration, the history itself lives in the ShipTravelLog and
+    ShipCargoLog tables.
     
     Fields:
         
-        limits.travel.history: ships memory for past travel
-        limits.cargo.history: ships memory for past cargo transactions
-        travel.history: fifo, head oriented list of most recent travel `limits.history.travel` defines max length
-        cargo.history:: fifo, head oriented list of recent cargo manifest changes `limits.cargo.history` defines max length
-        
-    Field content descriptions:
-    
-        travel.history:
-            
-            {
-                "name": "Planet Name"
-                "id": <integer>Planet ID
-                "x_coordinate": <integer>
-                "y_coordinate": <integer>
-            }
-
-        cargo.history:
-
-            {
-                "mode": buy | sell,
-                "good": <string>,
-                "quantity": <integer>,
-                "planet": {
-                    "name": planet.name,
-                    "id": planet.id
-                },
-                "cost": <integer>
-            }
+        limits.travel.history: ships memory for past travel, how many travel log entries we show at once
+        limits.cargo.history: ships memory for past cargo transactions, how many cargo log entries we show at once
 
     :return: 
     """
@@ -1001,12 +1426,6 @@ def default_ship_computer():
             "cargo":{
                 "history": 5
             }
-        },
-        "travel": {
-            "history": []
-        },
-        "cargo": {
-            "history": []
         }
     }
 
@@ -1057,6 +1476,49 @@ class Ship(models.Model):
     # ships computer, tracks features of the ship
     computer = JSONField(null=False, blank=False, default=default_ship_computer)
 
+    # running totals of our cargo quantity and installed upgrade capacity, so we don't need to
+    # add them up on every render. Use `adjust_loads` to change these, and the `ship_loads`
+    # command to check or rebuild them
+    cargo_load = models.IntegerField(null=False, blank=False, default=0)
+    upgrade_load = models.IntegerField(null=False, blank=False, default=0)
+
+    # fields only ever changed with F() updates, see `save`
+    LOAD_FIELDS = ["cargo_load", "upgrade_load"]
+
+    def save(self, *args, **kwargs):
+        """
+        Saving an existing ship writes every field except our loads, unless
+        they're asked for by name in `update_fields`. Our copy of the loads
+        may be stale, and writing it back would undo any `adjust_loads` made
+        since we were loaded.
+
+        :return:
+        """
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert", False):
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.LOAD_FIELDS
+            ]
+
+        super(Ship, self).save(*args, **kwargs)
+
+    def adjust_loads(self, cargo=0, upgrades=0):
+        """
+        Change our cargo and upgrade loads, both in the database and on
+        this object.
+
+        :param cargo: change in cargo quantity
+        :param upgrades: change in installed upgrade capacity
+        :return:
+        """
+        Ship.objects.filter(pk=self.pk).update(
+            cargo_load=models.F("cargo_load") + cargo,
+            upgrade_load=models.F("upgrade_load") + upgrades
+        )
+
+        self.cargo_load += cargo
+        self.upgrade_load += upgrades
+
     def upgrade_size_cargo(self):
         """
         How much bigger is our cargo with installed upgrades.
@@ -1074,10 +1536,7 @@ class Ship(models.Model):
         
         :return: 
         """
-        used = self.upgrades.only("capacity").aggregate(models.Sum("capacity"))["capacity__sum"]
-        if used is None:
-            used = 0
-        return used
+        return self.upgrade_load
 
     def upgrade_capacity_free(self):
         """
@@ -1101,60 +1560,6 @@ class Ship(models.Model):
         else:
             return (numer * 1.0) / denom * 100.0
 
-    def buy_upgrade(self, ship_upgrade):
-        """
-        A few things we need to do when buying an upgrade:
-        
-            1. Can we install it?
-            2. Install it
-            3. Use ShipUpgrade::buy to complete the transaction
-            
-        :param upgrade: 
-        :return: 
-        """
-
-        # enough space for it?
-        if not self.can_install_upgrade(ship_upgrade):
-            return
-
-        # ok - let's do this.
-
-        #  - install
-        self.install_upgrade(ship_upgrade)
-
-        #  - buy it
-        ship_upgrade.buy()
-
-        # we're good.
-
-
-    def install_upgrade(self, ship_upgrade):
-        """
-        Apply an upgrade to our ship, copy the object, and bind it to our ship object.
-            
-            1. set ship of ship_upgrade
-            2. update proper component value of ship. From ShipUpgrade:
-            
-                # how much does this change our ship
-                size = models.IntegerField(null=False, blank=False, default=10)
-                
-                # what on our ship does this change?
-                target = models.CharField(max_length=100, null=False, blank=False, default="cargo")
-
-            
-        :param ship_upgrade: 
-        :return: 
-        """
-
-        # it's ours!
-        ship_upgrade.ship = self
-        ship_upgrade.save()
-
-        # let's do some install
-        if ship_upgrade.target == "cargo":
-            self.cargo_capacity += ship_upgrade.size
-            self.save()
-
     def can_install_upgrade(self, ship_upgrade):
         """
         Can we apply this upgrade? We check:
@@ -1220,13 +1625,7 @@ class Ship(models.Model):
         What's the size of our currently used cargo?
         :return:
         """
-
-        # add up all of our cargo
-        cargo_count = 0
-
-        for c in self.cargo.only("quantity").all():
-            cargo_count += c.quantity
-        return cargo_count
+        return self.cargo_load
 
     def cargo_free(self):
         """
@@ -1244,179 +1643,51 @@ class Ship(models.Model):
         """
         return self.cargo_used() * 1.0 / self.cargo_capacity * 100.0
 
-    def sell_cargo(self, good, quantity):
-        """
-        Let's sell some things. We need to:
-
-            1. Determine if we have any of this good
-            2. If we do, make sure we have enough to sell
-            3. Subtract from cargo
-            4. If cargo type is empty, delete it
-
-        :param good:
-        :param quantity:
-        :return:
-        """
-        cargo = self.cargo.filter(name=good.name).first()
-
-        # do we even have this?
-        if cargo is None:
-            return
-
-        # do we have enough to sell
-        if quantity > cargo.quantity:
-            return
-
-        # great, let's sell
-        cargo.sell(good, quantity)
-
-        # neat. done. let's record this for posterity
-        self.record_cargo_sell(good, quantity, good.location, good.price * quantity)
-
-        # is this cargo empty?
-        if cargo.quantity == 0:
-            cargo.delete()
-
-    def buy_cargo(self, good, quantity):
-        """
-        Let's buy some goods. We need to:
-
-            1. Determine if we already have some of this good
-            2. Determine if we have space for this good
-            3. If we don't have this good, add it to our cargo
-            4. Use the cargo buy method to update the cargo
-
-        :param good:
-        :param quantity:
-        :return:
-        """
-
-        # do we have space?
-        if quantity > self.cargo_free():
-            return
-
-        # grab it if we've got it
-        cargo = self.cargo.filter(name = good.name).first()
-
-        # doesn't exist? Let's add it
-        if cargo is None:
-            cargo = Cargo.objects.create(
-                ship = self,
-                name = good.name
-            )
-            cargo.save()
-
-        # great, now let's buy
-        cargo.buy(good, quantity)
-
-        # neat. done. let's record this for posterity
-        self.record_cargo_buy(good, quantity, good.location, good.price * quantity)
-
     def locations_in_range(self):
         """
         Find the locations that are in range, and compute a bit of data
         :return:
         """
-        plist = []
 
         # figure out how far we can go
         max_range = self.current_range()
 
         # bail out if we're reaaaaaally low on fuel
         if max_range < 1:
-            return plist
-
-        # preselect a set of locations in the box that our max range describes
-        min_x = self.location.x_coordinate - max_range
-        max_x = self.location.x_coordinate + max_range
-        min_y = self.location.y_coordinate - max_range
-        max_y = self.location.y_coordinate + max_range
-
-        close_enough = Location.objects.filter(
-            x_coordinate__gte=min_x,
-            x_coordinate__lte=max_x,
-            y_coordinate__gte=min_y,
-            y_coordinate__lte=max_y
-        ).all()
-
-        for location in close_enough:
-
-            # now do a real distance calculation
-            real_dist = self.distance_to(location)
-            if real_dist > self.current_range():
-                continue
+            return []
 
-            # ok! our location is close enough
-            plist.append(
-                {
-                    "name": location.name,
-                    "id": location.id,
-                    "distance": real_dist,
-                    "fuel_burned_percent": real_dist / max_range * 100.0,
-                    "location_type": location.location_type
-                }
-            )
-        plist.sort(key=lambda s: s["distance"])
+        # make sure the space around us exists, the rest of our range is queued for prefetch
+        if settings.SBO_SECTORS["lazy"]:
+            from ui.generation.materializer import SectorMaterializer
+            SectorMaterializer().ensure_radius(self.location.x_coordinate, self.location.y_coordinate, max_range)
+
+        # cached per range tier, falling back to the spatial index
+        plist = reachability.within_range(self.location, max_range)
+
+        for location in plist:
+            location["fuel_burned_percent"] = location["distance"] / max_range * 100.0
 
         return plist
 
-    def distance_to(self, location):
+    def plan_route(self, destination):
         """
-        How far is it to the given location.
+        Plan a multi-hop route to a location, refueling along the way as
+        needed. See `ui.routes.RoutePlanner`.
 
-        :param location:
-        :return:
+        :param destination:
+        :return: ui.routes.Route, or None if we can't get there
         """
-        return math.sqrt(((self.location.x_coordinate - location.x_coordinate)**2) + ((self.location.y_coordinate - location.y_coordinate)**2))
+        from ui.routes import RoutePlanner
+        return RoutePlanner(self.max_range).plan(self.location, destination, fuel_range=self.current_range())
 
-    def record_cargo_buy(self, good, quantity, location, cost):
-        """
-        Add a record to our cargo log.
-        
-        :param good: 
-        :param quantity: 
-        :param location:
-        :param cost: 
-        :return: 
+    def distance_to(self, location):
         """
-        self._record_cargo("buy", good, quantity, location, cost)
+        How far is it to the given location.
 
-    def record_cargo_sell(self, good, quantity, location, cost):
-        """
-        Add a record to our cargo log.
-            
-        :param good: 
-        :param quantity: 
         :param location:
-        :param cost: 
-        :return: 
-        """
-        self._record_cargo("sell", good, quantity, location, cost)
-
-    def _record_cargo(self, mode, good, quantity, location, cost):
-        """
-        Add a record to our cargo log, and trim it down if need be. 
-         
-        :param mode: 
-        :param good: 
-        :param quantity: 
-        :param plant: 
-        :param cost: 
-        :return: 
+        :return:
         """
-        rec = {
-            "mode": mode,
-            "good": good.name,
-            "quantity": quantity,
-            "planet": {
-                "name": location.name,
-                "id": location.id
-            },
-            "cost": cost
-        }
-        self.computer["cargo"]["history"].insert(0, rec)
-        self.computer["cargo"]["history"] = self.computer["cargo"]["history"][:self.computer["limits"]["cargo"]["history"]]
-        self.save()
+        return math.sqrt(((self.location.x_coordinate - location.x_coordinate)**2) + ((self.location.y_coordinate - location.y_coordinate)**2))
 
     def travel_to(self, location):
         """
@@ -1429,19 +1700,38 @@ class Ship(models.Model):
         """
 
         # update our travel history
-        last_location = {
-            "name": self.location.name,
-            "id": self.location.id,
-            "x_coordinate": self.location.x_coordinate,
-            "y_coordinate": self.location.y_coordinate
-        }
-        self.computer["travel"]["history"].insert(0,last_location)
-        self.computer["travel"]["history"] = self.computer["travel"]["history"][:self.computer["limits"]["travel"]["history"]]
+        ShipTravelLog.objects.create(
+            ship=self,
+            location=self.location,
+            location_name=self.location.name,
+            x_coordinate=self.location.x_coordinate,
+            y_coordinate=self.location.y_coordinate
+        )
 
         # travel
         self.location = location
         self.save()
 
+    def travel_history(self, cursor=None):
+        """
+        A page of our most recent travel, sized by our computer limits. See
+        `ShipLogManager::page`.
+
+        :param cursor: page cursor from a previous page
+        :return: tuple of (list of ShipTravelLog, next page cursor)
+        """
+        return ShipTravelLog.objects.page(self, cursor=cursor, limit=self.computer["limits"]["travel"]["history"])
+
+    def cargo_history(self, cursor=None):
+        """
+        A page of our most recent cargo transactions, sized by our computer
+        limits. See `ShipLogManager::page`.
+
+        :param cursor: page cursor from a previous page
+        :return: tuple of (list of ShipCargoLog, next page cursor)
+        """
+        return ShipCargoLog.objects.page(self, cursor=cursor, limit=self.computer["limits"]["cargo"]["history"])
+
     def is_home_location_in_range(self):
         """
         Is our home location within travel distance?
@@ -1522,3 +1812,146 @@ class Ship(models.Model):
         refuel_perc = refuel_units / self.max_range * 100.0
         self.fuel_level += refuel_perc
         self.save()
+
+
+###
+# SHIP LOGS
+###
+class ShipLogManager(models.Manager):
+    """
+    Read and prune append only ship logs. Logs are read newest first, and
+    paged with a (timestamp, id) cursor, so reading any page is an index
+    range scan no matter how deep into the log we are.
+    """
+
+    def page(self, ship, cursor=None, limit=5):
+        """
+        Read a page of a ship's log, newest first.
+
+        :param ship:
+        :param cursor: the cursor returned with the previous page, or None for the first page
+        :param limit: how many entries are in a page
+        :return: tuple of (list of entries, cursor for the next page or None)
+        """
+        entries = self.filter(ship=ship)
+
+        if cursor is not None:
+            timestamp, entry_id = self._decode_cursor(cursor)
+            entries = entries.filter(
+                models.Q(timestamp__lt=timestamp) | models.Q(timestamp=timestamp, id__lt=entry_id)
+            )
+
+        # grab one extra entry, so we know if there's another page
+        entries = list(entries.order_by("-timestamp", "-id")[:limit + 1])
+
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            next_cursor = self._encode_cursor(entries[-1])
+
+        return entries, next_cursor
+
+    def prune(self, keep=None, before=None):
+        """
+        Bulk delete old log entries, either beyond the `keep` most recent
+        entries of each ship, or older than `before`, or both.
+
+        :param keep: how many entries to keep for each ship
+        :param before: datetime, delete entries older than this
+        :return: number of entries deleted
+        """
+        deleted = 0
+
+        if before is not None:
+            deleted += self.filter(timestamp__lt=before).delete()[0]
+
+        if keep is not None:
+            table = self.model._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM " + table + " WHERE id IN ("
+                    "SELECT id FROM (SELECT id, row_number() OVER (PARTITION BY ship_id ORDER BY timestamp DESC, id DESC) AS position FROM " + table + ") ranked "
+                    "WHERE position > %s)",
+                    [keep]
+                )
+                deleted += cursor.rowcount
+
+        return deleted
+
+    def _encode_cursor(self, entry):
+        """
+        Build the page cursor that follows an entry.
+
+        :param entry:
+        :return:
+        """
+        return "%s_%d" % (entry.timestamp.strftime("%Y%m%d%H%M%S%f"), entry.id)
+
+    def _decode_cursor(self, cursor):
+        """
+        Split a page cursor back into its timestamp and id.
+
+        :param cursor:
+        :return: tuple of (datetime, id)
+        """
+        try:
+            timestamp, entry_id = cursor.split("_")
+            timestamp = datetime.strptime(timestamp, "%Y%m%d%H%M%S%f")
+            if settings.USE_TZ:
+                timestamp = timezone.make_aware(timestamp, timezone.utc)
+            return timestamp, int(entry_id)
+        except ValueError:
+            raise ValueError("Malformed ship log cursor [%s]" % (cursor,))
+
+
+class ShipTravelLog(models.Model):
+    """
+    A location a ship has traveled from.
+    """
+    objects = ShipLogManager()
+
+    ship = models.ForeignKey(Ship, on_delete=models.CASCADE, related_name="travel_log")
+
+    # where were we? We keep a copy of the location details, in case the location is removed
+    location = models.ForeignKey(Location, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    location_name = models.CharField(max_length=255, null=False, blank=False)
+    x_coordinate = models.IntegerField(default=0, null=False, blank=False)
+    y_coordinate = models.IntegerField(default=0, null=False, blank=False)
+
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        index_together = [
+            ["ship", "timestamp"]
+        ]
+
+
+CARGO_LOG_MODE_CHOICES = (
+    ("buy", "Buy"),
+    ("sell", "Sell")
+)
+
+
+class ShipCargoLog(models.Model):
+    """
+    Cargo bought or sold by a ship.
+    """
+    objects = ShipLogManager()
+
+    ship = models.ForeignKey(Ship, on_delete=models.CASCADE, related_name="cargo_log")
+
+    mode = models.CharField(max_length=10, null=False, blank=False, choices=CARGO_LOG_MODE_CHOICES)
+    good = models.CharField(max_length=255, null=False, blank=False)
+    quantity = models.IntegerField(default=0, null=False)
+    cost = models.FloatField(null=False, blank=False, default=0.0)
+
+    # where did we trade? We keep a copy of the location name, in case the location is removed
+    location = models.ForeignKey(Location, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    location_name = models.CharField(max_length=255, null=False, blank=False)
+
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        index_together = [
+            ["ship", "timestamp"]
+        ]
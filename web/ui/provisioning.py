@@ -0,0 +1,153 @@
+"""
+Background ship yard provisioning.
+
+Seeding a ship yard (the yard, its upgrades, and its ships) is too much work
+to do inside a page request, so when a ship arrives somewhere without a yard
+we queue the location, and a task on the async runtime (see `async_tasks`)
+seeds queued yards in bulk. The queue is a Redis set, so a location is only
+ever queued once, however many ships arrive before it's provisioned.
+
+We also count arrivals at each location. Busy locations, and the locations
+in range of them that ships are likely to head to next, are provisioned
+ahead of time, so most first arrivals find a yard already waiting. Counts
+decay over time, so traffic follows where players are now:
+
+    >>> provisioning.record_arrival(location.id)
+    >>> provisioning.request_shipyard(location.id)
+    >>> ShipyardProvisioner().provision_pending()
+    3
+    >>> ShipyardProvisioner().provision_hot(top=20, neighbours=10, radius=250)
+    41
+"""
+from django.db import transaction
+
+import redis
+
+from ui.async_runtime import redis_pool
+from ui.models import Location, ShipYard
+from ui import reachability
+
+# locations waiting for a ship yard
+PENDING_KEY = "provisioning:shipyards:pending"
+
+# arrivals at each location, a sorted set scored by decayed arrival count
+TRAFFIC_KEY = "provisioning:traffic"
+
+
+def _redis():
+    return redis.StrictRedis(connection_pool=redis_pool())
+
+
+def record_arrival(location_id):
+    """
+    Count a ship arriving at a location.
+
+    :param location_id:
+    :return:
+    """
+    try:
+        _redis().zincrby(TRAFFIC_KEY, 1, location_id)
+    except redis.RedisError:
+        # traffic is only a hint, we can live without it
+        pass
+
+
+def request_shipyard(location_id):
+    """
+    Queue a location for a ship yard. If we can't reach the queue, we
+    provision the yard right away, like we used to.
+
+    :param location_id:
+    :return: True if queued, False if provisioned in place
+    """
+    try:
+        _redis().sadd(PENDING_KEY, location_id)
+        return True
+    except redis.RedisError:
+        seed_missing([location_id])
+        return False
+
+
+def seed_missing(location_ids):
+    """
+    Seed yards at whichever of these locations still don't have one. The
+    locations are locked while we check and seed them, so a location being
+    provisioned from two places at once only gets one yard.
+
+    :param location_ids:
+    :return: list of ShipYard
+    """
+    if len(location_ids) == 0:
+        return []
+
+    with transaction.atomic():
+        # lock first, FOR UPDATE can't go through the outer join to shipyards
+        locked = list(
+            Location.objects.select_for_update().filter(id__in=set(location_ids)).order_by("id").values_list("id", flat=True)
+        )
+        missing = list(
+            Location.objects.filter(id__in=locked, shipyards__isnull=True).order_by("id").values_list("id", flat=True)
+        )
+        return ShipYard.objects.seed_locations(missing)
+
+
+class ShipyardProvisioner(object):
+    """
+    Work through the provisioning queue, and provision hot locations ahead of
+    time.
+    """
+
+    def __init__(self, redis_client=None):
+        """
+        :param redis_client: defaults to a client on the shared pool
+        """
+        self.redis = redis_client if redis_client is not None else _redis()
+
+    def provision_pending(self, limit=500):
+        """
+        Seed yards for up to `limit` queued locations. If seeding fails, the
+        locations go back on the queue for next time.
+
+        :param limit:
+        :return: number of yards seeded
+        """
+        location_ids = [int(location_id) for location_id in self.redis.spop(PENDING_KEY, limit) or []]
+
+        try:
+            return len(seed_missing(location_ids))
+        except Exception:
+            if len(location_ids) > 0:
+                self.redis.sadd(PENDING_KEY, *location_ids)
+            raise
+
+    def provision_hot(self, top=20, neighbours=10, radius=250):
+        """
+        Seed yards at the `top` busiest locations, and the `neighbours`
+        nearest locations within `radius` of each of them.
+
+        :param top:
+        :param neighbours:
+        :param radius:
+        :return: number of yards seeded
+        """
+        hot_ids = [int(location_id) for location_id in self.redis.zrevrange(TRAFFIC_KEY, 0, top - 1)]
+
+        location_ids = list(hot_ids)
+        for location in Location.objects.filter(id__in=hot_ids):
+            location_ids += [nearby["id"] for nearby in reachability.within_range(location, radius)[:neighbours + 1]]
+
+        return len(seed_missing(location_ids))
+
+    def decay_traffic(self, factor=0.5, floor=0.1):
+        """
+        Scale down every traffic count, and forget locations that have gone
+        quiet.
+
+        :param factor: multiplier for every count
+        :param floor: counts below this are dropped
+        :return:
+        """
+        pipeline = self.redis.pipeline()
+        pipeline.zunionstore(TRAFFIC_KEY, {TRAFFIC_KEY: factor})
+        pipeline.zremrangebyscore(TRAFFIC_KEY, "-inf", "(%f" % (floor,))
+        pipeline.execute()
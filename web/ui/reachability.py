@@ -0,0 +1,192 @@
+"""
+Cached reachability of locations.
+
+Ships can only have so many ranges; a ship's max range is one of the `sizes`
+in shiptypes.json (times 5, see `ShipManager::__choose_ship_stats`). For each
+of those range tiers we cache, per location, the list of locations within that
+range, sorted by distance. A travel lookup then picks the smallest tier that
+covers the ship's current range, and trims the cached list, so it only needs
+the cache, and not a range query.
+
+A miss runs the range query for the whole tier, so we only go through the
+cache when that isn't much more work than the query for the radius itself:
+when the tier is no more than `MAX_TIER_SLACK` times the radius, and no bigger
+than `MAX_CACHED_TIER`, as the biggest tiers hold more locations than we want
+in a single cache entry. Anything else goes straight to the spatial index.
+
+Cache entries are invalidated by region rather than one by one. Space is split
+into square regions as big as each tier's range, and every region has a version
+number. A cached entry is keyed by the versions of the regions its range
+circle overlaps (at most 3x3 of them), so adding or removing a location only
+needs to bump the version of the one region it sits in, at each tier:
+
+    >>> reachability.within_range(location, 340.0)
+    [{"id": 12, "name": "...", "location_type": "star", "distance": 12.2}, ...]
+    >>> reachability.invalidate([(location.x_coordinate, location.y_coordinate)])
+
+Versions are bumped once the transaction making the change commits, so a
+lookup running alongside it can't cache the locations from before the commit
+under the new versions. The cache is the shared Redis cache (see `CACHES` in
+settings), so a change made by any process is seen by every other.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from ui import spatial
+from ui.generation import resource_registry
+
+import bisect
+import math
+
+# how long cached entries live, in seconds, in case a change slips past invalidation
+ENTRY_TIMEOUT = 60 * 60
+
+# most a tier can be over the radius we're looking up, for us to query and cache the whole tier
+MAX_TIER_SLACK = 1.5
+
+# biggest tier we cache, bigger tiers hold too many locations for one entry
+MAX_CACHED_TIER = 1250
+
+# cache key prefixes
+VERSION_PREFIX = "reach:version"
+ENTRY_PREFIX = "reach:entry"
+
+_tiers = None
+
+
+def tiers():
+    """
+    Our range tiers, smallest first, from the ship sizes in shiptypes.json.
+
+    :return: list of ranges
+    """
+    global _tiers
+
+    if _tiers is None:
+        sizes = resource_registry.ship_templates()["sizes"]
+        _tiers = sorted(set([size["size"] * 5 for size in sizes.values() if size["size"] > 0]))
+
+    return _tiers
+
+
+def cached_tiers():
+    """
+    The tiers we cache, smallest first.
+
+    :return: list of ranges
+    """
+    return [tier for tier in tiers() if tier <= MAX_CACHED_TIER]
+
+
+def tier_for(radius):
+    """
+    The smallest tier that covers a radius, if it's worth caching.
+
+    :param radius:
+    :return: tier range, or None if we don't cache this radius
+    """
+    available = cached_tiers()
+    index = bisect.bisect_left(available, radius)
+
+    if index >= len(available) or available[index] > radius * MAX_TIER_SLACK:
+        return None
+    return available[index]
+
+
+def _region(tier, x, y):
+    """
+    Which region of a tier holds a point?
+
+    :param tier:
+    :param x:
+    :param y:
+    :return: tuple of (region x, region y)
+    """
+    return int(math.floor(x * 1.0 / tier)), int(math.floor(y * 1.0 / tier))
+
+
+def _version_key(tier, region):
+    return "%s:%d:%d:%d" % (VERSION_PREFIX, tier, region[0], region[1])
+
+
+def _regions_for_radius(tier, x, y):
+    """
+    The regions of a tier overlapped by a circle with the tier's radius.
+
+    :param tier:
+    :param x:
+    :param y:
+    :return: list of (region x, region y)
+    """
+    min_rx, min_ry = _region(tier, x - tier, y - tier)
+    max_rx, max_ry = _region(tier, x + tier, y + tier)
+    return [(rx, ry) for ry in range(min_ry, max_ry + 1) for rx in range(min_rx, max_rx + 1)]
+
+
+def within_range(location, radius):
+    """
+    Find the locations within a radius of a location. See
+    `ui.spatial.within_range` for the result structure.
+
+    :param location: Location
+    :param radius:
+    :return: list of dicts, sorted by distance
+    """
+    from ui.models import Location
+
+    tier = tier_for(radius)
+
+    # nothing cached for this radius, go straight to the spatial index
+    if tier is None:
+        return spatial.within_range(Location.objects.all(), location.x_coordinate, location.y_coordinate, radius)
+
+    # our entry is only good for the current versions of the regions around us
+    version_keys = [_version_key(tier, region) for region in _regions_for_radius(tier, location.x_coordinate, location.y_coordinate)]
+    versions = cache.get_many(version_keys)
+    entry_key = "%s:%d:%d:%s" % (ENTRY_PREFIX, tier, location.id, "-".join([str(versions.get(key, 0)) for key in version_keys]))
+
+    reachable = cache.get(entry_key)
+
+    if reachable is None:
+        reachable = spatial.within_range(Location.objects.all(), location.x_coordinate, location.y_coordinate, tier)
+        cache.set(entry_key, reachable, ENTRY_TIMEOUT)
+
+    # trim the tier down to our radius
+    cut = bisect.bisect_right([found["distance"] for found in reachable], radius)
+    return [dict(found) for found in reachable[:cut]]
+
+
+def invalidate(points):
+    """
+    Locations have been added or removed at these points, so any cached
+    reachability around them is stale, as soon as the current transaction (if
+    any) commits.
+
+    :param points: iterable of (x, y)
+    :return:
+    """
+    version_keys = set()
+
+    for x, y in points:
+        for tier in cached_tiers():
+            version_keys.add(_version_key(tier, _region(tier, x, y)))
+
+    if len(version_keys) > 0:
+        transaction.on_commit(lambda: _bump(version_keys))
+
+
+def _bump(version_keys):
+    """
+    Bump region versions.
+
+    :param version_keys:
+    :return:
+    """
+    for key in version_keys:
+        # versions never expire, so stale entries can't come back
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted between add and incr
+            cache.set(key, 1, None)
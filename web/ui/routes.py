@@ -0,0 +1,371 @@
+"""
+Multi-hop route planning between locations.
+
+Ships can only jump as far as a full tank of fuel takes them, so getting
+anywhere far away means hopping between locations, refueling along the way.
+The `RoutePlanner` runs A* over the graph of locations, where two locations
+are connected if they are within a ship's max range of each other.
+
+Fuel is part of the search. A search state is a location plus the fuel left
+in the tank, and every hop either goes on the fuel we have, fills the tank
+before leaving, or buys just enough fuel to make the hop. The cost of a hop is
+its distance plus the fuel we bought for it, priced with the `fuel_markup` of
+the location we bought it at (like `Ship::refuel_cost`), and weighed against
+distance with `fuel_weight`, so a route through cheap fuel can beat a shorter
+route through expensive fuel. Our heuristic is the straight line distance to
+the destination, plus the fuel we're short of at the cheapest markup of any
+location. Every route has to cover at least that distance, and buy at least
+that much fuel, so the heuristic never overestimates, and the route we find
+is the cheapest.
+
+The fuel left in the tank is tracked in `fuel_steps` levels, rounded down, so
+there are only so many states at each location. Once we have a route, the
+fuel along it is worked out exactly.
+
+Locations that share coordinates (a star, its planets, and their moons) are a
+single stop, where we refuel at whichever location has the cheapest fuel.
+
+Rather than building the whole graph, the neighbours of each stop are found
+as the search reaches it. Space is split into blocks as big as the max range,
+so every neighbour of a stop is in the 3x3 blocks around it, and blocks are
+loaded with a spatial grid query (see `ui.spatial`) the first time the search
+needs them. The search only ever loads the blocks along the way it explores:
+
+    >>> planner = RoutePlanner(max_range=500)
+    >>> route = planner.plan(ship.location, destination, fuel_range=ship.current_range())
+    >>> route.distance, route.refuel_cost, [leg["location"]["name"] for leg in route.legs]
+    (1732.4, 8412.7, ["Mira 2211", "NGC 812", "Tarsis 4410-C"])
+"""
+from django.db import models
+
+from ui.models import Location, FUEL_UNIT_COST
+from ui import spatial
+
+import heapq
+import math
+
+# refuel choices before each hop
+GO_ON = "go_on"
+FILL_UP = "fill_up"
+TOP_UP = "top_up"
+
+
+class Route(object):
+    """
+    A planned route. Each leg looks like:
+
+        {
+            "location": {"id", "name", "x_coordinate", "y_coordinate", "fuel_markup"},
+            "distance": <float>, distance of this leg
+            "refuel_before": <float>, fuel units bought before setting off on this leg
+            "refuel_cost": <float>, what that fuel costs at the location we're leaving
+        }
+    """
+
+    def __init__(self, start, legs):
+        self.start = start
+        self.legs = legs
+
+        self.distance = sum([leg["distance"] for leg in legs])
+        self.refuel_cost = sum([leg["refuel_cost"] for leg in legs])
+        self.refuel_stops = len([leg for leg in legs if leg["refuel_before"] > 0])
+
+
+class RoutePlanner(object):
+    """
+    Plan fuel aware routes for a ship with a given max range.
+    """
+
+    # location fields we need for planning
+    fields = ("id", "name", "x_coordinate", "y_coordinate", "fuel_markup")
+
+    def __init__(self, max_range, fuel_weight=None, fuel_steps=10, max_expansions=20000, min_fuel_markup=None):
+        """
+        :param max_range: how far the ship can go on a full tank
+        :param fuel_weight: how much a credit spent on fuel weighs against a unit of distance, defaults to a
+                            unit of fuel at standard price weighing the same as a unit of distance
+        :param fuel_steps: how many levels of fuel we track, between empty and full
+        :param max_expansions: how many search states we expand before giving up
+        :param min_fuel_markup: the cheapest fuel markup at any location, looked up when we first plan
+                                if we aren't given it. This has to be a lower bound, or routes may not be the cheapest
+        """
+        self.max_range = float(max_range)
+        self.fuel_weight = fuel_weight if fuel_weight is not None else 1.0 / FUEL_UNIT_COST
+        self.fuel_steps = fuel_steps
+        self.max_expansions = max_expansions
+        self.min_fuel_markup = min_fuel_markup
+
+        # (x, y) -> stop, see _add_location
+        self._stops = {}
+
+        # (block x, block y) -> list of stop coordinates, for every block we've loaded
+        self._blocks = {}
+
+        # (x, y) -> list of ((x, y), distance), for every stop we've expanded
+        self._neighbour_cache = {}
+
+    def plan(self, start, destination, fuel_range=None):
+        """
+        Find the cheapest route from one location to another, and where we
+        refuel along the way.
+
+        :param start: Location
+        :param destination: Location
+        :param fuel_range: how far we can go on the fuel we have now, defaults to a full tank
+        :return: Route, or None if the destination can't be reached
+        """
+        if self.max_range <= 0:
+            return None
+
+        if fuel_range is None:
+            fuel_range = self.max_range
+        fuel_range = max(0.0, min(float(fuel_range), self.max_range))
+
+        origin = (start.x_coordinate, start.y_coordinate)
+        goal = (destination.x_coordinate, destination.y_coordinate)
+
+        self._load_blocks([self._block(origin)])
+
+        if origin not in self._stops:
+            return None
+
+        if self.min_fuel_markup is None:
+            self.min_fuel_markup = self._cheapest_markup()
+
+        step = self.max_range / self.fuel_steps
+        cheapest_fuel = self.fuel_weight * FUEL_UNIT_COST * max(0.0, self.min_fuel_markup)
+
+        def heuristic(point, fuel):
+            distance = math.hypot(point[0] - goal[0], point[1] - goal[1])
+            return distance + cheapest_fuel * max(0.0, distance - fuel)
+
+        # states are (stop, fuel level), where fuel is never negative, so int() rounds down
+        start_state = (origin, int(fuel_range / step + 1e-9))
+        best = {start_state: 0.0}
+
+        # state -> (previous state, refuel choice, hop distance)
+        came_from = {}
+        closed = set()
+
+        frontier = [(heuristic(origin, fuel_range), 0.0, start_state)]
+
+        while len(frontier) > 0:
+            estimate, cost, state = heapq.heappop(frontier)
+
+            if state in closed:
+                continue
+
+            point, fuel_level = state
+
+            if point == goal:
+                return self._route(self._path(came_from, state), start, destination, fuel_range)
+
+            closed.add(state)
+            if len(closed) > self.max_expansions:
+                return None
+
+            fuel = fuel_level * step
+            price = self.fuel_weight * FUEL_UNIT_COST * self._stops[point]["refuel"]["fuel_markup"]
+
+            for neighbour, hop in self._neighbours(point):
+
+                choices = []
+                if fuel >= hop:
+                    choices.append((GO_ON, fuel - hop, 0.0))
+                if fuel_level < self.fuel_steps:
+                    choices.append((FILL_UP, self.max_range - hop, self.max_range - fuel))
+                if fuel < hop:
+                    choices.append((TOP_UP, 0.0, hop - fuel))
+
+                for choice, fuel_left, refuel in choices:
+                    next_state = (neighbour, int(fuel_left / step + 1e-9))
+
+                    if next_state in closed:
+                        continue
+
+                    candidate = cost + hop + price * refuel
+                    if candidate < best.get(next_state, float("inf")):
+                        best[next_state] = candidate
+                        came_from[next_state] = (state, choice, hop)
+                        heapq.heappush(frontier, (candidate + heuristic(neighbour, next_state[1] * step), candidate, next_state))
+
+        return None
+
+    def _cheapest_markup(self):
+        """
+        The cheapest fuel markup at any location.
+
+        :return:
+        """
+        cheapest = Location.objects.aggregate(cheapest=models.Min("fuel_markup"))["cheapest"]
+        return cheapest if cheapest is not None else 0.0
+
+    def _block(self, point):
+        """
+        Which of our planning blocks holds a point?
+
+        :param point: (x, y)
+        :return:
+        """
+        return (
+            int(math.floor(point[0] / self.max_range)),
+            int(math.floor(point[1] / self.max_range))
+        )
+
+    def _neighbours(self, point):
+        """
+        Find the stops within a single jump of a stop, loading any blocks
+        around it we haven't seen yet.
+
+        :param point: (x, y)
+        :return: list of ((x, y), distance)
+        """
+        if point in self._neighbour_cache:
+            return self._neighbour_cache[point]
+
+        block_x, block_y = self._block(point)
+        around = [(block_x + dx, block_y + dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+
+        self._load_blocks([block for block in around if block not in self._blocks])
+
+        neighbours = []
+        for block in around:
+            for neighbour in self._blocks[block]:
+                hop = math.hypot(neighbour[0] - point[0], neighbour[1] - point[1])
+                if 0 < hop <= self.max_range:
+                    neighbours.append((neighbour, hop))
+
+        self._neighbour_cache[point] = neighbours
+        return neighbours
+
+    def _load_blocks(self, blocks):
+        """
+        Load the locations in a set of blocks, with a single spatial grid
+        query over the span of blocks.
+
+        :param blocks: list of (block x, block y)
+        :return:
+        """
+        if len(blocks) == 0:
+            return
+
+        for block in blocks:
+            self._blocks[block] = []
+
+        min_gx, min_gy = spatial.grid_cell(
+            min([block[0] for block in blocks]) * self.max_range,
+            min([block[1] for block in blocks]) * self.max_range
+        )
+        max_gx, max_gy = spatial.grid_cell(
+            (max([block[0] for block in blocks]) + 1) * self.max_range,
+            (max([block[1] for block in blocks]) + 1) * self.max_range
+        )
+
+        for row in self._query(min_gx, max_gx, min_gy, max_gy):
+            point = (row["x_coordinate"], row["y_coordinate"])
+            block = self._block(point)
+
+            # the span of grid cells can reach into blocks we've already loaded
+            if block in blocks:
+                self._add_location(block, point, row)
+
+    def _query(self, min_gx, max_gx, min_gy, max_gy):
+        """
+        The locations in a span of spatial grid cells.
+
+        :return: iterable of location dicts
+        """
+        return Location.objects.filter(
+            grid_x__gte=min_gx,
+            grid_x__lte=max_gx,
+            grid_y__gte=min_gy,
+            grid_y__lte=max_gy
+        ).values(*self.fields)
+
+    def _add_location(self, block, point, location):
+        """
+        Add a location to the stop at its coordinates.
+
+        :param block:
+        :param point:
+        :param location: location dict
+        :return:
+        """
+        stop = self._stops.get(point)
+
+        if stop is None:
+            stop = self._stops[point] = {"locations": {}, "refuel": location}
+            self._blocks[block].append(point)
+
+        stop["locations"][location["id"]] = location
+
+        if location["fuel_markup"] < stop["refuel"]["fuel_markup"]:
+            stop["refuel"] = location
+
+    def _path(self, came_from, state):
+        """
+        Walk back from the state that reached our destination.
+
+        :param came_from:
+        :param state:
+        :return: list of (stop, refuel choice before the hop there, hop distance), from the first hop
+        """
+        path = []
+
+        while state in came_from:
+            previous, choice, hop = came_from[state]
+            path.append((state[0], choice, hop))
+            state = previous
+
+        path.reverse()
+        return path
+
+    def _route(self, path, start, destination, fuel_range):
+        """
+        Turn a path into a Route, working out the fuel we buy along the way
+        exactly, rather than by fuel level.
+
+        :param path: see _path
+        :param start: Location
+        :param destination: Location
+        :param fuel_range: fuel we start with
+        :return: Route
+        """
+        origin = self._stops[(start.x_coordinate, start.y_coordinate)]
+        legs = []
+
+        # we refuel at the cheapest location at each stop, which may not be where we start
+        if len(path) > 0 and path[0][1] != GO_ON and origin["refuel"]["id"] != start.id:
+            legs.append({"location": origin["refuel"], "distance": 0.0, "refuel_before": 0.0, "refuel_cost": 0.0})
+
+        fuel = fuel_range
+        leaving = origin
+
+        for index, (point, choice, hop) in enumerate(path):
+            refuel = 0.0
+            if choice == FILL_UP:
+                refuel = self.max_range - fuel
+            elif choice == TOP_UP:
+                refuel = max(0.0, hop - fuel)
+
+            stop = self._stops[point]
+            if index == len(path) - 1:
+                location = stop["locations"].get(destination.id, stop["refuel"])
+            else:
+                location = stop["refuel"]
+
+            legs.append({
+                "location": location,
+                "distance": hop,
+                "refuel_before": refuel,
+                "refuel_cost": FUEL_UNIT_COST * leaving["refuel"]["fuel_markup"] * refuel
+            })
+
+            fuel = fuel + refuel - hop
+            leaving = stop
+
+        # sharing coordinates with our destination is a free hop
+        if len(legs) == 0 and start.id != destination.id:
+            legs.append({"location": origin["locations"].get(destination.id, origin["refuel"]), "distance": 0.0, "refuel_before": 0.0, "refuel_cost": 0.0})
+
+        return Route(origin["locations"].get(start.id, origin["refuel"]), legs)
@@ -0,0 +1,233 @@
+"""
+Spatial indexing for Locations.
+
+Every Location is bucketed into a grid cell, where each cell is the size of a
+single generator subsector (see `smooth_space_generator.SectorGenerator`). The
+cell of a location is stored with the location (`grid_x`, `grid_y`) and indexed
+together, so a radius query only has to touch the handful of cells that the
+search circle overlaps, rather than range scanning raw coordinates.
+
+Distances are computed in the database, so only the locations actually in
+range are pulled back into Python.
+
+    >>> from ui.models import Location
+    >>> Location.objects.within_range(150, 420, 250)
+    [{"id": 12, "name": "...", "location_type": "star", "distance": 12.2}, ...]
+"""
+from django.db import models
+
+import math
+
+import numpy
+
+# A sector is 1000x1000 units, broken into 10x10 subsectors
+SECTOR_SIZE = 1000
+SUBSECTOR_SIZE = 100
+
+# our grid cells are a subsector in size
+GRID_CELL_SIZE = SUBSECTOR_SIZE
+
+
+def sector_for_coordinate(x, y):
+    """
+    Which sector holds the given coordinate?
+
+    :param x:
+    :param y:
+    :return: tuple of (sector_x, sector_y)
+    """
+    return (
+        int(math.floor(x * 1.0 / SECTOR_SIZE)),
+        int(math.floor(y * 1.0 / SECTOR_SIZE))
+    )
+
+
+def sectors_for_radius(x, y, radius):
+    """
+    Find all of the sectors overlapped by the bounding box of a circle,
+    nearest sectors first.
+
+    :param x:
+    :param y:
+    :param radius:
+    :return: list of (sector_x, sector_y)
+    """
+    min_sx, min_sy = sector_for_coordinate(x - radius, y - radius)
+    max_sx, max_sy = sector_for_coordinate(x + radius, y + radius)
+
+    sectors = [(sx, sy) for sy in range(min_sy, max_sy + 1) for sx in range(min_sx, max_sx + 1)]
+
+    def center_distance(sector):
+        cx = (sector[0] + 0.5) * SECTOR_SIZE
+        cy = (sector[1] + 0.5) * SECTOR_SIZE
+        return (cx - x) ** 2 + (cy - y) ** 2
+
+    sectors.sort(key=center_distance)
+    return sectors
+
+
+def grid_cell(x, y):
+    """
+    Which grid cell holds the given coordinate?
+
+    :param x:
+    :param y:
+    :return: tuple of (grid_x, grid_y)
+    """
+    return (
+        int(math.floor(x * 1.0 / GRID_CELL_SIZE)),
+        int(math.floor(y * 1.0 / GRID_CELL_SIZE))
+    )
+
+
+def assign_grid_cell(location):
+    """
+    Update the grid cell of a location to match its coordinates. Anything
+    that bypasses `Location.save` (like bulk_create) needs to call this.
+
+    :param location:
+    :return: the location
+    """
+    location.grid_x, location.grid_y = grid_cell(location.x_coordinate, location.y_coordinate)
+    return location
+
+
+def grid_cells_for_radius(x, y, radius):
+    """
+    Find the span of grid cells overlapped by a circle.
+
+    :param x:
+    :param y:
+    :param radius:
+    :return: tuple of (min_grid_x, max_grid_x, min_grid_y, max_grid_y)
+    """
+    min_gx, min_gy = grid_cell(x - radius, y - radius)
+    max_gx, max_gy = grid_cell(x + radius, y + radius)
+    return min_gx, max_gx, min_gy, max_gy
+
+
+def distance_squared_expression(x, y):
+    """
+    Build the ORM expression for the squared distance from a point to
+    a location. We work in floating point so large coordinates don't
+    overflow integer math in the database.
+
+    :param x:
+    :param y:
+    :return:
+    """
+    dx = models.F("x_coordinate") - models.Value(float(x))
+    dy = models.F("y_coordinate") - models.Value(float(y))
+    return models.ExpressionWrapper(dx * dx + dy * dy, output_field=models.FloatField())
+
+
+def within_range(queryset, x, y, radius, fields=("id", "name", "location_type")):
+    """
+    Find all of the locations in the queryset within the radius of the
+    given point. Results are sorted by distance, and look like:
+
+        {
+            "id": <integer>,
+            "name": <string>,
+            "location_type": <string>,
+            "distance": <float>
+        }
+
+    Any extra `fields` are passed through from the location.
+
+    :param queryset: QuerySet of Location objects
+    :param x:
+    :param y:
+    :param radius:
+    :param fields: location fields to retrieve
+    :return: list of dicts
+    """
+    if radius < 0:
+        return []
+
+    min_gx, max_gx, min_gy, max_gy = grid_cells_for_radius(x, y, radius)
+
+    rows = queryset.filter(
+        grid_x__gte=min_gx,
+        grid_x__lte=max_gx,
+        grid_y__gte=min_gy,
+        grid_y__lte=max_gy
+    ).annotate(
+        distance_sq=distance_squared_expression(x, y)
+    ).filter(
+        distance_sq__lte=float(radius) ** 2
+    ).order_by("distance_sq").values(*(list(fields) + ["distance_sq"]))
+
+    results = []
+    for row in rows:
+        row["distance"] = math.sqrt(row.pop("distance_sq"))
+        results.append(row)
+
+    return results
+
+
+def within_range_batch(points, radii, location_ids, location_xs, location_ys, block_size=1024):
+    """
+    Find the locations within range of many points at once. Locations are
+    sorted by x coordinate, so each block of points only looks at the slice
+    of locations that could be in range of that block, and the pairwise
+    distance mask is built block by block, so memory stays bounded by
+    `block_size` squared no matter how many points or locations there are.
+
+    :param points: numpy array of (x, y), one row per point
+    :param radii: numpy array of the search radius of each point
+    :param location_ids: numpy array of location ids
+    :param location_xs: numpy array of location x coordinates
+    :param location_ys: numpy array of location y coordinates
+    :param block_size: how many points, and locations, we compare at once
+    :return: list, one per point, of lists of (location id, distance), sorted by distance
+    """
+    results = [[] for point in range(len(points))]
+
+    if len(points) == 0 or len(location_ids) == 0:
+        return results
+
+    points = numpy.asarray(points, dtype=numpy.float64)
+    radii = numpy.asarray(radii, dtype=numpy.float64)
+
+    by_x = numpy.argsort(location_xs, kind="mergesort")
+    location_ids = numpy.asarray(location_ids)[by_x]
+    location_xs = numpy.asarray(location_xs, dtype=numpy.float64)[by_x]
+    location_ys = numpy.asarray(location_ys, dtype=numpy.float64)[by_x]
+
+    # neighbouring points share more of the same locations
+    point_order = numpy.argsort(points[:, 0], kind="mergesort")
+
+    for point_offset in range(0, len(points), block_size):
+        block = point_order[point_offset:point_offset + block_size]
+        block_xs = points[block, 0]
+        block_ys = points[block, 1]
+        block_radii = radii[block]
+        block_radii_sq = block_radii ** 2
+
+        # only the locations within the x span of this block can be in range
+        low = numpy.searchsorted(location_xs, (block_xs - block_radii).min(), side="left")
+        high = numpy.searchsorted(location_xs, (block_xs + block_radii).max(), side="right")
+
+        found = [[] for point in range(len(block))]
+
+        for location_offset in range(low, high, block_size):
+            location_end = min(location_offset + block_size, high)
+
+            dx = block_xs[:, numpy.newaxis] - location_xs[numpy.newaxis, location_offset:location_end]
+            dy = block_ys[:, numpy.newaxis] - location_ys[numpy.newaxis, location_offset:location_end]
+            distance_sq = dx * dx + dy * dy
+
+            in_range = distance_sq <= block_radii_sq[:, numpy.newaxis]
+
+            for point_index, location_index in zip(*numpy.nonzero(in_range)):
+                found[point_index].append((
+                    location_ids[location_offset + location_index].item(),
+                    math.sqrt(distance_sq[point_index, location_index])
+                ))
+
+        for point_index, point in enumerate(block):
+            found[point_index].sort(key=lambda location: location[1])
+            results[point] = found[point_index]
+
+    return results
@@ -1,3 +1,499 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, models, transaction
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from opensimplex import OpenSimplex
+import math
+import numpy
+import random
+import threading
+
+from ui.generation.batch_noise import BatchNoise, FEATURES
+from ui.generation.galaxy import generate_sector
+from ui.generation.materializer import SectorMaterializer
+from ui.generation.sampling import AliasTable
+from ui.generation.smooth_space_generator import SectorGenerator, Coordinate
+from ui.models import Location, Sector, Ship, Profile, Good, Cargo, CreditJournal, ShipCargoLog, FUEL_UNIT_COST
+from ui.routes import RoutePlanner
+from ui.trade import TradeService, TradeOrder, TradeError
+from ui.instrumentation import view_stats
+from ui import reachability
+
+
+class SectorGenerationTest(SimpleTestCase):
+    """
+    Sectors are generated from their own seed, see ui.generation.galaxy
+    """
+
+    def test_sectors_are_reproducible(self):
+        self.assertEqual(generate_sector((2, -3, 7222007)), generate_sector((2, -3, 7222007)))
+
+    def test_generation_leaves_shared_random_alone(self):
+        random.seed(42)
+        expected = [random.random() for i in range(3)]
+
+        random.seed(42)
+        generate_sector((0, 0, 7222007))
+
+        self.assertEqual([random.random() for i in range(3)], expected)
+
+
+class BatchNoiseTest(SimpleTestCase):
+    """
+    Batch noise matches the scalar noise it was ported from, see ui.generation.batch_noise
+    """
+
+    seeds = [0, 42, 7222007]
+
+    def test_noise_matches_scalar(self):
+        x, y = numpy.meshgrid(numpy.linspace(-40.3, 40.7, 73), numpy.linspace(-35.9, 37.1, 59))
+
+        for seed in self.seeds:
+            simplex = OpenSimplex(seed=seed)
+            scalar = [[simplex.noise2d(x[row][col], y[row][col]) for col in range(x.shape[1])] for row in range(x.shape[0])]
+
+            self.assertEqual(BatchNoise(seed).noise2d(x, y).tolist(), scalar)
+
+    def test_features_match_scalar(self):
+        for seed in self.seeds:
+            for sector_x, sector_y in [(0, 0), (-3000, 2000), (5000, -7000)]:
+                generator = SectorGenerator()
+                generator.reseed(seed)
+                generator.sector_x = sector_x
+                generator.sector_y = sector_y
+                generator.x_subsectors = 50
+                generator.y_subsectors = 50
+
+                features = generator.feature_grid()
+                x_centers, y_centers = generator.subsector_centers()
+
+                for row, y in enumerate(y_centers):
+                    for col, x in enumerate(x_centers):
+                        noise = generator.noise_at_coordinate(Coordinate(x=x, y=y))
+                        self.assertEqual(FEATURES[features[row][col]], generator.feature_from_noise(noise))
+
+
+class AliasTableTest(SimpleTestCase):
+    """
+    Weighted draws from alias tables, see ui.generation.sampling
+    """
+
+    items = ["basic", "alpha", "omega", "never"]
+    weights = [1.0, 0.75, 0.03, 0.0]
+
+    def test_table_matches_weights(self):
+        table = AliasTable(self.items, self.weights)
+        total = sum(self.weights)
+
+        for probability, weight in zip(table.probabilities(), self.weights):
+            self.assertAlmostEqual(probability, weight / total)
+
+    def test_seeding_random_repeats_draws(self):
+        table = AliasTable(self.items, self.weights)
+
+        random.seed(3)
+        first = (table.draw_many(50), table.draw())
+        random.seed(3)
+
+        self.assertEqual((table.draw_many(50), table.draw()), first)
+
+    def test_draws_follow_weights(self):
+        table = AliasTable(self.items, self.weights)
+        draws = 200000
+        total = sum(self.weights)
+
+        random.seed(7)
+        single = [table.draw() for i in range(draws)]
+        many = table.draw_many(draws, rng=random.Random(7))
+
+        for drawn in [single, many]:
+            for item, weight in zip(self.items, self.weights):
+                expected = draws * weight / total
+                # five standard deviations either side
+                spread = 5 * (expected * (1 - weight / total)) ** 0.5
+                self.assertTrue(abs(drawn.count(item) - expected) <= spread, "%s drawn %d times, expected %.0f" % (item, drawn.count(item), expected))
+
+
+class SectorMaterializerTest(TestCase):
+    """
+    Sectors are materialized on demand, see ui.generation.materializer
+    """
+
+    def test_inline_work_is_capped(self):
+        materializer = SectorMaterializer(simplex_seed=7222007, prefetch=False, inline_sectors=1)
+        materialized = materializer.ensure_radius(150, 420, 2500)
+
+        self.assertEqual(materialized, [(0, 0)])
+        self.assertEqual(list(Sector.objects.values_list("sector_x", "sector_y")), [(0, 0)])
+
+
+class PickRandomLocationTest(TestCase):
+    """
+    LocationManager::pick_random
+    """
+
+    def test_nothing_to_pick(self):
+        self.assertIsNone(Location.objects.pick_random(location_type="planet"))
+
+    def test_picks_are_uniform_across_id_gaps(self):
+        # planets either side of a long run of stars
+        planets = [Location.objects.create(name="Planet A", image_name="planet1.png", location_type="planet")]
+        for i in range(200):
+            Location.objects.create(name="Star %d" % (i,), image_name="Star1.png", location_type="star")
+        planets += [
+            Location.objects.create(name="Planet %s" % (name,), image_name="planet1.png", location_type="planet")
+            for name in ["B", "C"]
+        ]
+
+        counts = dict((planet.id, 0) for planet in planets)
+        for i in range(3000):
+            counts[Location.objects.pick_random(location_type="planet").id] += 1
+
+        for planet_id, count in counts.items():
+            self.assertTrue(800 < count < 1200, "planet %d picked %d times out of 3000" % (planet_id, count))
+
+
+class ShipLoadsTest(TestCase):
+    """
+    Ship cargo and upgrade loads are only changed with F() updates
+    """
+
+    def test_save_keeps_concurrent_load_changes(self):
+        location = Location.objects.create(name="Home", image_name="planet1.png")
+        ship = Ship.objects.create(name="Darter", model="Darter", location=location, home_location=location, image_name="ship.png")
+
+        stale = Ship.objects.get(pk=ship.pk)
+        ship.adjust_loads(cargo=12, upgrades=3)
+
+        stale.fuel_level = 50.0
+        stale.save()
+
+        ship.refresh_from_db()
+        self.assertEqual((ship.cargo_load, ship.upgrade_load, ship.fuel_level), (12, 3, 50.0))
+
+
+@override_settings(SBO_SECTORS=dict(settings.SBO_SECTORS, lazy=False))
+class ShipsInRangeTest(TestCase):
+    """
+    ShipManager::locations_in_range is the batch version of Ship::locations_in_range
+    """
+
+    def test_batch_matches_single_ship(self):
+        home = Location.objects.create(name="Home", image_name="planet1.png", x_coordinate=0, y_coordinate=0)
+        for x, y in [(30, 40), (120, -50), (-400, 10), (2000, 2000)]:
+            Location.objects.create(name="(%d, %d)" % (x, y), image_name="Star1.png", location_type="star", x_coordinate=x, y_coordinate=y)
+
+        ship = Ship.objects.create(
+            name="Darter", model="Darter", location=home, home_location=home, image_name="ship.png", max_range=500, fuel_level=90.0
+        )
+
+        batch = Ship.objects.locations_in_range(Ship.objects.filter(pk=ship.pk))[ship.pk]
+        single = ship.locations_in_range()
+
+        self.assertEqual(
+            [(found["id"], found["name"], found["location_type"]) for found in batch],
+            [(found["id"], found["name"], found["location_type"]) for found in single]
+        )
+        for batched, found in zip(batch, single):
+            self.assertAlmostEqual(batched["distance"], found["distance"])
+            self.assertAlmostEqual(batched["fuel_burned_percent"], found["fuel_burned_percent"])
+
+
+class RoutePlannerTest(TestCase):
+    """
+    Fuel aware route planning, see ui.routes
+    """
+
+    def setUp(self):
+        def place(name, x, y, fuel_markup):
+            return Location.objects.create(name=name, image_name="Star1.png", location_type="star", x_coordinate=x, y_coordinate=y, fuel_markup=fuel_markup)
+
+        self.start = place("Start", 0, 0, 1.0)
+        self.pricey = place("Pricey", 450, 0, 2.0)
+        self.cheap = place("Cheap", 430, 100, 0.5)
+        self.destination = place("Destination", 900, 0, 1.0)
+        self.faraway = place("Faraway", 5000, 5000, 1.0)
+
+    def test_cheap_fuel_beats_a_shorter_route(self):
+        route = RoutePlanner(500).plan(self.start, self.destination)
+
+        self.assertEqual([leg["location"]["id"] for leg in route.legs], [self.cheap.id, self.destination.id])
+
+        fuel = 500.0
+        for leg in route.legs:
+            fuel += leg["refuel_before"]
+            self.assertLessEqual(fuel, 500.0 + 1e-6)
+            fuel -= leg["distance"]
+            self.assertGreaterEqual(fuel, -1e-6)
+
+        # only what we need to reach the destination, at the cheap stop's markup
+        self.assertAlmostEqual(route.refuel_cost, 10 * 0.5 * (route.distance - 500.0), places=3)
+
+    def test_unreachable(self):
+        self.assertIsNone(RoutePlanner(500).plan(self.start, self.faraway))
+
+
+class RouteHeuristicTest(TestCase):
+    """
+    The route planner's heuristic never overestimates, so the cheapest route wins, see ui.routes
+    """
+
+    def test_cheap_fuel_is_worth_an_extra_hop(self):
+        def place(name, x, y, fuel_markup):
+            return Location.objects.create(name=name, image_name="Star1.png", location_type="star", x_coordinate=x, y_coordinate=y, fuel_markup=fuel_markup)
+
+        start = place("Start", 0, 0, 1.0)
+        waypoint = place("Waypoint", 290, 50, 1.0)
+        cheap = place("Cheap", 580, 110, 0.1)
+        place("Cheapish", 580, 170, 0.2)
+        destination = place("Destination", 684, 0, 1.0)
+
+        planner = RoutePlanner(500)
+        route = planner.plan(start, destination)
+
+        self.assertEqual([leg["location"]["id"] for leg in route.legs], [waypoint.id, cheap.id, destination.id])
+
+        # the direct route through the waypoint buys what it needs there, at full price
+        direct_distance = math.hypot(290, 50) + math.hypot(684 - 290, 50)
+        direct = direct_distance + planner.fuel_weight * FUEL_UNIT_COST * 1.0 * (direct_distance - 500)
+
+        self.assertLess(route.distance + planner.fuel_weight * route.refuel_cost, direct)
+
+
+class ReachabilityInvalidationTest(TransactionTestCase):
+    """
+    Cached reachability is invalidated when changes commit, see ui.reachability
+    """
+
+    def test_versions_bump_on_commit(self):
+        tier = reachability.tiers()[0]
+        key = reachability._version_key(tier, reachability._region(tier, 12345, -6789))
+        before = cache.get(key, 0)
+
+        with transaction.atomic():
+            reachability.invalidate([(12345, -6789)])
+            self.assertEqual(cache.get(key, 0), before)
+
+        self.assertEqual(cache.get(key, 0), before + 1)
+
+    def test_rolled_back_changes_leave_versions_alone(self):
+        tier = reachability.tiers()[0]
+        key = reachability._version_key(tier, reachability._region(tier, -4321, 9876))
+        before = cache.get(key, 0)
+
+        with transaction.atomic():
+            reachability.invalidate([(-4321, 9876)])
+            transaction.set_rollback(True)
+
+        self.assertEqual(cache.get(key, 0), before)
+
+
+class ReachabilityMissTest(TestCase):
+    """
+    A reachability cache miss only queries a little more than it needs to
+    """
+
+    def setUp(self):
+        self.location = Location.objects.create(name="Home", image_name="planet1.png", x_coordinate=0, y_coordinate=0)
+        self.queried = []
+
+        def recording(queryset, x, y, radius, **kwargs):
+            self.queried.append(radius)
+            return within_range(queryset, x, y, radius, **kwargs)
+
+        within_range = reachability.spatial.within_range
+        reachability.spatial.within_range = recording
+        self.addCleanup(setattr, reachability.spatial, "within_range", within_range)
+
+        cache.clear()
+
+    def test_close_tiers_are_cached(self):
+        reachability.within_range(self.location, 480)
+        reachability.within_range(self.location, 480)
+
+        self.assertEqual(self.queried, [500])
+
+    def test_far_tiers_query_the_radius(self):
+        for radius in [600, 1300, 4900]:
+            reachability.within_range(self.location, radius)
+            self.assertLessEqual(max(self.queried), radius * reachability.MAX_TIER_SLACK)
+
+        self.assertEqual(self.queried, [600, 1300, 4900])
+
+
+class CreditJournalTest(TestCase):
+    """
+    Every credit change is journaled, see ui.models.CreditJournalManager
+    """
+
+    def setUp(self):
+        self.profile = Profile.objects.create(user=User.objects.create_user("journal"), credits=1000)
+
+    def assertJournalBalances(self, opening):
+        self.profile.refresh_from_db()
+        self.assertEqual(opening + sum(self.profile.credit_journal.values_list("amount", flat=True)), self.profile.credits)
+
+    def test_floor_journals_what_was_taken(self):
+        self.profile.add_credits(500)
+        self.profile.subtract_credits(4000)
+
+        self.assertEqual(self.profile.credits, 0)
+        self.assertEqual(self.profile.credit_journal.order_by("-id").first().amount, -1500)
+        self.assertJournalBalances(1000)
+
+    def test_debits_need_cover(self):
+        self.assertFalse(self.profile.spend_credits(1001))
+        self.assertTrue(self.profile.spend_credits(1000))
+        self.assertJournalBalances(1000)
+
+
+class CreditJournalAtomicityTest(TransactionTestCase):
+    """
+    A balance never changes without its journal entry, even outside a transaction
+    """
+
+    def setUp(self):
+        self.profile = Profile.objects.create(user=User.objects.create_user("atomic"), credits=1000)
+
+    def test_failed_entries_leave_balances_alone(self):
+        # too long a reason for the journal
+        reason = "x" * 300
+
+        for change in [
+            lambda: self.profile.add_credits(10, reason=reason),
+            lambda: self.profile.subtract_credits(10, reason=reason),
+            lambda: self.profile.spend_credits(10, reason=reason)
+        ]:
+            with self.assertRaises(DatabaseError):
+                change()
+
+            self.profile.refresh_from_db()
+            self.assertEqual(self.profile.credits, 1000)
+
+        self.assertEqual(CreditJournal.objects.filter(profile=self.profile).count(), 0)
+
+
+class TradeConcurrencyTest(TransactionTestCase):
+    """
+    Concurrent trades with the same ship still add up, see ui.trade
+    """
+
+    def setUp(self):
+        self.profile = Profile.objects.create(user=User.objects.create_user("trader"), credits=50000)
+        self.location = Location.objects.create(name="Exchange", image_name="planet1.png", location_type="planet")
+        self.goods = [
+            Good.objects.create(name="Good %d" % (i,), location=self.location, is_import=True, is_export=True, price=20.0 + 40 * i)
+            for i in range(4)
+        ]
+        self.ship = Ship.objects.create(
+            name="Hauler", model="Hauler", image_name="ship.png", owner=self.profile,
+            location=self.location, home_location=self.location, cargo_capacity=100
+        )
+
+    def assertAddsUp(self, filled):
+        self.ship.refresh_from_db()
+        self.profile.refresh_from_db()
+
+        cargo_total = Cargo.objects.filter(ship=self.ship).aggregate(total=models.Sum("quantity"))["total"] or 0
+        journal_total = CreditJournal.objects.filter(profile=self.profile).aggregate(total=models.Sum("amount"))["total"] or 0
+
+        self.assertEqual(self.ship.cargo_load, cargo_total)
+        self.assertLessEqual(self.ship.cargo_load, self.ship.cargo_capacity)
+        self.assertGreaterEqual(self.profile.credits, 0)
+        self.assertEqual(self.profile.credits, 50000 + journal_total)
+        self.assertEqual(ShipCargoLog.objects.filter(ship=self.ship).count(), filled)
+
+    def test_overselling_is_rejected(self):
+        service = TradeService(self.profile)
+        service.buy(self.ship.id, self.location.id, self.goods[0].id, 10)
+
+        with self.assertRaises(TradeError):
+            service.trade(self.ship.id, self.location.id, [
+                TradeOrder("sell", self.goods[0].id, 5), TradeOrder("sell", self.goods[0].id, 6)
+            ])
+        with self.assertRaises(TradeError):
+            service.buy(self.ship.id, self.location.id, self.goods[1].id, 91)
+
+        self.assertAddsUp(1)
+
+    def test_charges_what_it_checks(self):
+        Profile.objects.filter(pk=self.profile.pk).update(credits=61)
+        good = Good.objects.create(name="Odd Lots", location=self.location, is_import=True, is_export=True, price=20.4)
+
+        result = TradeService(self.profile).buy(self.ship.id, self.location.id, good.id, 3)
+
+        self.assertEqual(result.credits, -61)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.credits, 0)
+        self.assertEqual(CreditJournal.objects.filter(profile=self.profile).get().amount, -61)
+
+    def test_concurrent_trades_add_up(self):
+        filled = []
+        errors = []
+
+        def trader(seed):
+            rng = random.Random(seed)
+            service = TradeService(Profile.objects.get(pk=self.profile.pk))
+
+            try:
+                for i in range(40):
+                    orders = [
+                        TradeOrder(rng.choice(["buy", "sell"]), rng.choice(self.goods).id, rng.randint(1, 15))
+                        for j in range(rng.randint(1, 3))
+                    ]
+                    try:
+                        service.trade(self.ship.id, self.location.id, orders)
+                        filled.append(len(orders))
+                    except TradeError:
+                        pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=trader, args=(seed,)) for seed in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertGreater(sum(filled), 0)
+        self.assertAddsUp(sum(filled))
+
+
+class InstrumentationViewTest(TestCase):
+    """
+    The debug-instrumentation view, see ui.views.debug
+    """
+
+    def setUp(self):
+        User.objects.create_user("staff", password="staff", is_staff=True)
+        self.client.login(username="staff", password="staff")
+
+        view_stats.reset()
+        view_stats.record("instrumented", 12.0, 3, 1.5)
+
+    def test_get_leaves_stats_alone(self):
+        response = self.client.get(reverse("debug-instrumentation"))
+
+        self.assertEqual(response.json()["instrumented"]["requests"], 1)
+        self.assertEqual(view_stats.summary("instrumented")["requests"], 1)
+
+    @override_settings(SBO_INSTRUMENTATION=dict(settings.SBO_INSTRUMENTATION, enabled=True, capture_sql=False))
+    def test_wall_time_without_sql_capture(self):
+        self.client.get(reverse("debug-instrumentation"))
+
+        stats = view_stats.summary("debug-instrumentation")
+        self.assertEqual(stats["requests"], 1)
+        self.assertIsNone(stats["sql_count"])
+        self.assertEqual(sorted(stats["wall_ms"].keys()), ["p50", "p90", "p99"])
+
+    def test_post_resets(self):
+        response = self.client.post(reverse("debug-instrumentation"))
+
+        self.assertEqual(response.json()["instrumented"]["requests"], 1)
+        self.assertNotIn("instrumented", view_stats.summary())
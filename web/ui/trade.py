@@ -0,0 +1,337 @@
+"""
+Transactional trading.
+
+Buying or selling touches the player's credits, the ship's cargo load, and the
+ship's cargo, and every check (can we afford it, do we have room, do we have
+enough to sell) has to hold when the change is written. The `TradeService`
+runs each trade as a single transaction that locks the rows it will change,
+always in the same order, so concurrent trades by the same player queue up
+behind each other instead of overselling, and can't deadlock:
+
+    1. Profile
+    2. Ship
+    3. Cargo, by id
+    4. ShipUpgrade
+
+Every check is made against the locked rows, and the changes are then written
+with as few UPDATEs as we can manage. Several goods can be traded in one
+transaction, and the whole batch succeeds or fails together:
+
+    >>> trader = TradeService(request.user.profile)
+    >>> trader.trade(ship_id, location_id, [TradeOrder("sell", ore.id, 20), TradeOrder("buy", grain.id, 15)])
+    TradeResult(credits=-412, ...)
+    >>> trader.buy_upgrade(ship_id, upgrade_id)
+"""
+from django.db import models, transaction
+
+from ui.models import Profile, Ship, Good, Cargo, ShipUpgrade, ShipCargoLog, CreditJournal
+
+
+class TradeError(Exception):
+    """
+    A trade that can't go through. The message is safe to show the player.
+    """
+    pass
+
+
+class TradeOrder(object):
+    """
+    Buy or sell some quantity of a good.
+    """
+
+    def __init__(self, mode, good_id, quantity):
+        """
+        :param mode: buy | sell
+        :param good_id:
+        :param quantity:
+        """
+        if mode not in ["buy", "sell"]:
+            raise ValueError("Unknown trade mode [%s]" % (mode,))
+
+        self.mode = mode
+        self.good_id = int(good_id)
+        self.quantity = int(quantity)
+
+
+class TradeResult(object):
+    """
+    What a batch of trades did.
+    """
+
+    def __init__(self, credits, cargo, orders):
+        """
+        :param credits: change in the player's credits
+        :param cargo: change in the ship's cargo load
+        :param orders: list of (TradeOrder, Good) that went through
+        """
+        self.credits = credits
+        self.cargo = cargo
+        self.orders = orders
+
+
+class TradeService(object):
+    """
+    Buy and sell on behalf of a player.
+    """
+
+    def __init__(self, profile):
+        """
+        :param profile: the Profile trading
+        """
+        self.profile = profile
+
+    def buy(self, ship_id, location_id, good_id, quantity):
+        """
+        Buy a good from a location.
+
+        :return: TradeResult
+        """
+        return self.trade(ship_id, location_id, [TradeOrder("buy", good_id, quantity)])
+
+    def sell(self, ship_id, location_id, good_id, quantity):
+        """
+        Sell a good to a location.
+
+        :return: TradeResult
+        """
+        return self.trade(ship_id, location_id, [TradeOrder("sell", good_id, quantity)])
+
+    def trade(self, ship_id, location_id, orders):
+        """
+        Run a batch of orders at a location in one transaction. Orders are
+        applied in turn, so selling one good can pay for, and make room for,
+        buying the next.
+
+        :param ship_id:
+        :param location_id:
+        :param orders: list of TradeOrder
+        :return: TradeResult
+        :raises TradeError: if any order can't go through, in which case none do
+        """
+        if len(orders) == 0:
+            raise TradeError("There's nothing to trade")
+
+        with transaction.atomic():
+            profile, ship = self._lock_ship(ship_id)
+
+            if ship.location_id != int(location_id):
+                raise TradeError("Your ship isn't orbiting that location")
+
+            goods = Good.objects.in_bulk([order.good_id for order in orders])
+
+            # lock the cargo we hold of anything we're trading
+            names = sorted(set([good.name for good in goods.values()]))
+            cargo = dict(
+                (c.name, c) for c in Cargo.objects.select_for_update().filter(ship=ship, name__in=names).order_by("id")
+            )
+
+            credits = profile.credits
+            cargo_free = ship.cargo_capacity - ship.cargo_load
+            credits_change = 0
+            cargo_change = 0
+
+            # cargo name -> [quantity, total value], as they'll be once we're done
+            holds = dict((name, [c.quantity, c.total_value]) for name, c in cargo.items())
+
+            filled = []
+
+            for order in orders:
+                good = goods.get(order.good_id)
+
+                if good is None or good.location_id != ship.location_id:
+                    raise TradeError("That good isn't traded at this location")
+
+                if order.quantity <= 0:
+                    raise TradeError("You need to trade at least one %s" % (good.name,))
+
+                # credits are whole, so we round each order once, and check and charge the same amount
+                value = int(round(good.price * order.quantity))
+                hold = holds.setdefault(good.name, [0, 0.0])
+
+                if order.mode == "buy":
+                    if not good.is_export:
+                        raise TradeError("%s isn't an export for this location" % (good.name,))
+                    if order.quantity > cargo_free:
+                        raise TradeError("You don't have room for %d %s" % (order.quantity, good.name))
+                    if value > credits:
+                        raise TradeError("You can't afford %d %s" % (order.quantity, good.name))
+
+                    hold[0] += order.quantity
+                    hold[1] += value
+
+                    credits -= value
+                    credits_change -= value
+                    cargo_free -= order.quantity
+                    cargo_change += order.quantity
+                else:
+                    if not good.is_import:
+                        raise TradeError("%s isn't an import for this location" % (good.name,))
+                    if order.quantity > hold[0]:
+                        raise TradeError("You don't have %d %s to sell" % (order.quantity, good.name))
+
+                    # selling keeps our average purchase price
+                    average = hold[1] / hold[0]
+                    hold[0] -= order.quantity
+                    hold[1] = hold[0] * average
+
+                    credits += value
+                    credits_change += value
+                    cargo_free += order.quantity
+                    cargo_change -= order.quantity
+
+                filled.append((order, good, value))
+
+            self._write_cargo(ship, cargo, holds)
+            self._write_ship(ship, cargo_change=cargo_change)
+            self._write_credits(profile, credits_change, "trade")
+
+            ShipCargoLog.objects.bulk_create([
+                ShipCargoLog(
+                    ship=ship,
+                    mode=order.mode,
+                    good=good.name,
+                    quantity=order.quantity,
+                    location_id=ship.location_id,
+                    location_name=ship.location.name,
+                    cost=value
+                )
+                for order, good, value in filled
+            ])
+
+        return TradeResult(credits_change, cargo_change, [(order, good) for order, good, value in filled])
+
+    def buy_upgrade(self, ship_id, upgrade_id):
+        """
+        Buy an upgrade from a shipyard, and install it.
+
+        :param ship_id:
+        :param upgrade_id:
+        :return: the installed ShipUpgrade
+        :raises TradeError: if the upgrade can't be bought
+        """
+        with transaction.atomic():
+            profile, ship = self._lock_ship(ship_id)
+
+            upgrade = ShipUpgrade.objects.select_for_update().filter(pk=upgrade_id).first()
+
+            if upgrade is None or upgrade.shipyard_id is None:
+                raise TradeError("That upgrade is no longer for sale")
+
+            yard = upgrade.shipyard
+
+            if yard.location_id != ship.location_id:
+                raise TradeError("Your ship isn't orbiting near that ShipYard")
+
+            if upgrade.capacity > ship.upgrade_capacity - ship.upgrade_load:
+                raise TradeError("You don't have enough upgrade capacity for that")
+
+            if upgrade.cost > profile.credits:
+                raise TradeError("You can't afford that")
+
+            # it's ours!
+            ShipUpgrade.objects.filter(pk=upgrade.pk).update(ship=ship, shipyard=None)
+            upgrade.ship = ship
+            upgrade.shipyard = None
+
+            cargo_capacity = upgrade.size if upgrade.target == "cargo" else 0
+            self._write_ship(ship, upgrade_change=upgrade.capacity, cargo_capacity_change=cargo_capacity)
+            self._write_credits(profile, -upgrade.cost, "upgrade purchase")
+
+            # let our shipyard know
+            yard.restock_upgrades()
+
+        return upgrade
+
+    def _lock_ship(self, ship_id):
+        """
+        Lock our profile, then our ship, and make sure the ship is ours.
+
+        :param ship_id:
+        :return: tuple of (Profile, Ship)
+        """
+        profile = Profile.objects.select_for_update().get(pk=self.profile.pk)
+        # no select_related here, FOR UPDATE would lock the joined rows too
+        ship = Ship.objects.select_for_update().filter(pk=ship_id).first()
+
+        if ship is None or ship.owner_id != profile.id:
+            raise TradeError("That's not your ship")
+
+        return profile, ship
+
+    def _write_cargo(self, ship, cargo, holds):
+        """
+        Write our cargo holds back, updating, creating, and deleting cargo
+        as needed.
+
+        :param ship:
+        :param cargo: name -> locked Cargo
+        :param holds: name -> [quantity, total value]
+        :return:
+        """
+        emptied = []
+        created = []
+
+        for name, (quantity, total_value) in holds.items():
+            existing = cargo.get(name)
+
+            if quantity == 0:
+                if existing is not None:
+                    emptied.append(existing.pk)
+            elif existing is None:
+                created.append(Cargo(ship=ship, name=name, quantity=quantity, total_value=total_value))
+            elif existing.quantity != quantity or existing.total_value != total_value:
+                Cargo.objects.filter(pk=existing.pk).update(quantity=quantity, total_value=total_value)
+
+        if len(emptied) > 0:
+            Cargo.objects.filter(pk__in=emptied).delete()
+
+        if len(created) > 0:
+            Cargo.objects.bulk_create(created)
+
+    def _write_ship(self, ship, cargo_change=0, upgrade_change=0, cargo_capacity_change=0):
+        """
+        Apply changes to our ship's loads and capacity, in one UPDATE.
+
+        :param ship:
+        :param cargo_change:
+        :param upgrade_change:
+        :param cargo_capacity_change:
+        :return:
+        """
+        changes = {}
+
+        if cargo_change != 0:
+            changes["cargo_load"] = models.F("cargo_load") + cargo_change
+        if upgrade_change != 0:
+            changes["upgrade_load"] = models.F("upgrade_load") + upgrade_change
+        if cargo_capacity_change != 0:
+            changes["cargo_capacity"] = models.F("cargo_capacity") + cargo_capacity_change
+
+        if len(changes) > 0:
+            Ship.objects.filter(pk=ship.pk).update(**changes)
+
+        ship.cargo_load += cargo_change
+        ship.upgrade_load += upgrade_change
+        ship.cargo_capacity += cargo_capacity_change
+
+    def _write_credits(self, profile, amount, reason):
+        """
+        Apply a change to our credits, and journal it. Our profile is already
+        locked, so we don't need to read it back.
+
+        :param profile:
+        :param amount: whole credits
+        :param reason:
+        :return:
+        """
+        if amount == 0:
+            return
+
+        Profile.objects.filter(pk=profile.pk).update(credits=models.F("credits") + amount)
+        CreditJournal.objects.create(profile=profile, amount=amount, reason=reason)
+
+        profile.credits += amount
+
+        # keep the caller's copy of the profile in step
+        if self.profile is not profile:
+            self.profile.credits = profile.credits
@@ -15,7 +15,7 @@ Including another URLconf
 """
 from django.conf.urls import url, include
 from ui.views import index, learning
-from ui.views import locations, ships, account, marketplace, shipyards
+from ui.views import locations, ships, account, marketplace, shipyards, debug
 
 urlpatterns = [
     url(r'^$', index.index),
@@ -56,4 +56,6 @@ urlpatterns = [
     url(r'^shipyard/ship/(?P<ship_id>[0-9]+)/shipyard/(?P<shipyard_id>[0-9]+)/ships/seed/?$', shipyards.seed_ships, name="shipyard-seed-ships"),
     url(r'^shipyard/ship/(?P<ship_id>[0-9]+)/shipyard/(?P<shipyard_id>[0-9]+)/upgrade/(?P<shipupgrade_id>[0-9]+)/buy/?$', shipyards.buy_upgrade, name="shipyard-buy-upgrade"),
 
+    url(r'^debug/instrumentation/?$', debug.instrumentation, name="debug-instrumentation"),
+
 ]
@@ -7,6 +7,7 @@ from ui.models import Ship, Location
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib import messages
 
 @login_required
 def profile(request):
@@ -50,5 +51,7 @@ def seed_ship(request):
     :param request:
     :return:
     """
-    Ship.objects.seed_ship_for_profile(request.user.profile)
+    if Ship.objects.seed_ship_for_profile(request.user.profile) is None:
+        messages.error(request, "There's nowhere in the universe to put a ship yet")
+
     return redirect(reverse("account-profile"))
\ No newline at end of file
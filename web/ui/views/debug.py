@@ -0,0 +1,26 @@
+"""
+Debugging endpoints for staff.
+"""
+from ui.instrumentation import view_stats
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+
+@staff_member_required
+@require_http_methods(["GET", "POST"])
+def instrumentation(request):
+    """
+    Rolling wall time, SQL count, and SQL time percentiles for each URL name,
+    see `ui.instrumentation`. POST to get the stats and start over.
+
+    :param request:
+    :return:
+    """
+    summary = view_stats.summary()
+
+    if request.method == "POST":
+        view_stats.reset()
+
+    return JsonResponse(summary)
@@ -3,6 +3,7 @@ Control and view planets
 """
 from ui.util import fill_context
 from ui.models import Ship, Location
+from ui import provisioning
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
@@ -62,7 +63,22 @@ def detail(request, ship_id):
 
     # only owners can get the details on a ship
     if request.user.profile == ship.owner:
-        return render(request, "ships/detail.html", context=fill_context({"ship": ship, "location": location}))
+
+        # our logs are paged with cursors from the previous page
+        try:
+            travel_history, travel_cursor = ship.travel_history(cursor=request.GET.get("travel"))
+            cargo_history, cargo_cursor = ship.cargo_history(cursor=request.GET.get("cargo"))
+        except ValueError:
+            return redirect(reverse("ship", args=(ship_id,)))
+
+        return render(request, "ships/detail.html", context=fill_context({
+            "ship": ship,
+            "location": location,
+            "travel_history": travel_history,
+            "travel_cursor": travel_cursor,
+            "cargo_history": cargo_history,
+            "cargo_cursor": cargo_cursor
+        }))
     else:
         return redirect(reverse("ships"))
 
@@ -82,8 +98,9 @@ def travel(request, ship_id):
     # only owners can get the details on a ship
     if request.user.profile == ship.owner:
 
-        if location.shipyards.count() == 0:
-            location.add_shipyard()
+        # ship yards are seeded in the background, see ui.provisioning
+        if not location.shipyards.exists():
+            provisioning.request_shipyard(location.id)
 
         return render(request, "ships/travel.html", context=fill_context({"ship": ship, "location": location}))
     else:
@@ -110,17 +127,13 @@ def buy(request, ship_id):
         messages.error(request, "That ship is already owned by another player")
         return redirect(reverse("ships"))
 
-    # is this ship too expensive
-    if ship.value > user.profile.credits:
+    # exchange money, if this ship isn't too expensive
+    if not user.profile.spend_credits(ship.value, reason="ship purchase"):
         messages.error(request, "That ship is too expensive for you to purchase")
         return redirect(reverse("ships"))
 
     # looks like a good transaction
 
-    # exchange money
-    user.profile.credits = user.profile.credits - ship.value
-    user.profile.save()
-
     # track our yard - we may need to refresh ships
     yard = ship.shipyard
 
@@ -156,6 +169,9 @@ def travel_to_location(request, ship_id, location_id):
     ship.travel_to(location)
     ship.burn_fuel_for_distance(distance)
 
+    # busy locations get their ship yards ahead of time
+    provisioning.record_arrival(location.id)
+
     messages.info(request, "Welcome to %s" % (location.name,))
     return redirect(reverse("ship-travel", args=(ship_id,)))
 
@@ -183,7 +199,7 @@ def travel_to_home_location(request, ship_id):
     ship.save()
 
     # money
-    request.user.profile.subtract_credits(home_distance)
+    request.user.profile.subtract_credits(home_distance, reason="home travel")
 
     return redirect(reverse("ship-travel", args=(ship_id,)))
 
@@ -200,10 +216,10 @@ def refuel(request, ship_id):
     ship = get_object_or_404(Ship, pk=ship_id)
 
     if ship.can_fully_refuel():
-        request.user.profile.subtract_credits(ship.refuel_cost())
+        request.user.profile.subtract_credits(ship.refuel_cost(), reason="refuel")
         ship.refuel()
     else:
         creds = request.user.profile.credits
-        request.user.profile.subtract_credits(creds)
+        request.user.profile.subtract_credits(creds, reason="refuel")
         ship.partially_refuel(creds)
     return redirect(reverse("ship-travel", args=(ship_id,)))
\ No newline at end of file
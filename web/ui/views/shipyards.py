@@ -3,6 +3,7 @@ The market place handles goods transactions.
 """
 from ui.util import fill_context
 from ui.models import Ship, Location, ShipYard, ShipUpgrade
+from ui.trade import TradeService, TradeError
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
@@ -37,7 +38,7 @@ def yard(request, ship_id, shipyard_id):
 
 def buy_upgrade(request, ship_id, shipyard_id, shipupgrade_id):
     """
-    Try and buy and install an upgrade for a ship.
+    Try and buy and install an upgrade for a ship. See `ui.trade.TradeService`.
     
     :param request: 
     :param ship_id: 
@@ -45,42 +46,12 @@ def buy_upgrade(request, ship_id, shipyard_id, shipupgrade_id):
     :param upgrade_id: 
     :return: 
     """
-    ship = get_object_or_404(Ship, pk=ship_id)
-    shipyard = get_object_or_404(ShipYard, pk=shipyard_id)
-    upgrade = get_object_or_404(ShipUpgrade, pk=shipupgrade_id)
-    location = shipyard.location
-
-    # are we actually at the location for this shipyard?
-    if ship.location != location:
-        messages.error(request, "Your ship isn't orbiting near that ShipYard")
-        return redirect(reverse("shipyard", args=(ship_id, shipyard_id)))
-
-    # is this the user's ship?
-    if request.user.profile != ship.owner:
-        messages.error(request, "That's not your ship")
-        return redirect(reverse("ships"))
-
-    # do we have enough money?
-    if upgrade.cost > request.user.profile.credits:
-        messages.error(request, "You can't afford that")
-        return redirect(reverse("shipyard", args=(ship_id, shipyard_id)))
-
-    # let's check our capacity
-    if upgrade.capacity > ship.upgrade_capacity_free():
-        messages.error(request, "You don't have enough upgrade capacity for that")
+    try:
+        upgrade = TradeService(request.user.profile).buy_upgrade(ship_id, shipupgrade_id)
+    except TradeError as e:
+        messages.error(request, str(e))
         return redirect(reverse("shipyard", args=(ship_id, shipyard_id)))
 
-    # can we install it?
-    if not ship.can_install_upgrade(upgrade):
-        messages.error(request, "You can't install that upgrade")
-        return redirect(reverse("shipyard", args=(ship_id, shipyard_id)))
-
-    # buy and install!
-    ship.buy_upgrade(upgrade)
-
-    # don't forget to spend money
-    request.user.profile.subtract_credits(upgrade.cost)
-
     messages.success(request, "%s bought and installed!" % (upgrade.name, ))
     # back to the shipyard with you
     return redirect(reverse("shipyard", args=(ship_id, shipyard_id)))
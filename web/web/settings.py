@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ui.instrumentation.ViewInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +88,30 @@ DATABASES = {
 }
 
 
+# Redis
+# Used by the background task runtime and its control channels (db), and the cache (cache_db)
+SBO_REDIS = {
+    'host': 'redis',
+    'port': 6379,
+    'db': 0,
+    'cache_db': 1,
+}
+
+
+# Cache
+# Shared by every process, so cache invalidation (see ui.reachability) reaches everyone
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://%(host)s:%(port)d/%(cache_db)d' % SBO_REDIS,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        }
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
 
@@ -184,4 +209,65 @@ BOOTSTRAP3 = {
         'default': 'bootstrap3.renderers.FieldRenderer',
         'inline': 'bootstrap3.renderers.InlineFieldRenderer',
     },
-}
\ No newline at end of file
+}
+# Sector materialization, see ui.generation.materializer
+SBO_SECTORS = {
+
+    # generate sectors the first time a ship looks into them
+    'lazy': True,
+
+    # galaxy wide noise seed
+    'simplex_seed': 7222007,
+
+    # queue neighbouring sectors for prefetch, see the async_tasks command
+    'prefetch': True,
+
+    # how many queued sectors does each prefetch run materialize?
+    'prefetch_batch': 4,
+
+    # most missing sectors a page materializes itself, nearest first, the rest are queued for prefetch
+    'inline_sectors': 1,
+}
+
+# Ship log retention, see ui.models.ShipLogManager and the prune_ship_logs command
+SBO_SHIP_LOGS = {
+
+    # how many travel and cargo log entries do we keep for each ship?
+    'keep': 100,
+}
+
+# Background ship yard provisioning, see ui.provisioning
+SBO_PROVISIONING = {
+
+    # how many of the busiest locations do we provision ahead of time?
+    'hot_locations': 20,
+
+    # and how many of the nearest locations around each of them?
+    'neighbours': 10,
+
+    # how far around a hot location do we look for neighbours?
+    'radius': 250,
+
+    # traffic counts are scaled by this every time hot locations are provisioned
+    'decay': 0.5,
+}
+
+# Per view query count and latency instrumentation, see ui.instrumentation
+SBO_INSTRUMENTATION = {
+
+    # record stats for every request?
+    'enabled': True,
+
+    # capture each request's queries for SQL counts, SQL time and N+1 checks? The debug cursor
+    # costs us on every query, so only while debugging
+    'capture_sql': DEBUG,
+
+    # how many recent requests do we keep percentiles over, for each view?
+    'window': 500,
+
+    # flag a request that runs the same query shape this many times as a possible N+1
+    'n_plus_one': 10,
+
+    # log a view's percentiles every this many requests to it
+    'log_every': 100,
+}